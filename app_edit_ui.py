@@ -1,10 +1,17 @@
 import tkinter as tk
-from tkinter import messagebox, simpledialog, ttk
+from tkinter import filedialog, messagebox, simpledialog, ttk
+import argparse
 import sys
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # motor de BD
 try:
     from db_motor_edit import DbConnectionEdit
+    from db_otimista_edit import fundir_edicao
+    from db_backend_edit import BackendSQLite
+    from db_bloqueios_edit import AmostradorBloqueios
 except ImportError:
     print("AVISO: Ficheiro 'db_motor_edit.py' não encontrado. A usar MOCK.")
     class MockDbConnectionEdit:
@@ -12,9 +19,25 @@ except ImportError:
         DATABASE_NAME = 'SGBD_PL1_02'
         NIVEL_ISOLAMENTO_ATUAL = 'READ COMMITTED'
         SERVER_NAME = 'MOCK_SERVER'
+        is_connected = True
+        cache = None # Sem cache: não há pré-carregamento
+
+        class _RastreioMock:
+            @staticmethod
+            def mensagem(texto, nivel='info'):
+                print(texto)
+        rastreio = _RastreioMock()
+        # Como no motor: a AppEdit põe aqui o envio para a thread do Tk (os métodos correm no ExecutorBD)
+        notificar = None
+
+        def _notificar(self, tipo, titulo, mensagem):
+            if self.notificar:
+                self.notificar(tipo, titulo, mensagem)
+            else:
+                self.rastreio.mensagem(f"[{titulo}] {mensagem}")
         
         def connect(self, server, database, username, password):
-            messagebox.showinfo("MOCK", f"A simular conexão a {server}...")
+            self._notificar('info', "MOCK", f"A simular conexão a {server}...")
             return True # Simula sucesso
 
         def set_isolation(self, isolation_level: str):
@@ -23,7 +46,7 @@ except ImportError:
             return True
 
         def fetch_encomenda_data(self, enc_id: int):
-            messagebox.showinfo("MOCK", f"A simular leitura (SELECT) da Encomenda {enc_id}.")
+            self._notificar('info', "MOCK", f"A simular leitura (SELECT) da Encomenda {enc_id}.")
             # Simula dados de retorno (Nome, Morada)
             header = type('obj', (object,), {'Morada' : 'Rua de Teste (MOCK)'})
             # Simula linhas de retorno
@@ -33,13 +56,140 @@ except ImportError:
             ]
             return header, linhas
 
-        def editar_encomenda(self, enc_id: int, nova_morada: str, produtos_alterados: list, pausar_para_teste: bool = False):
-            if pausar_para_teste:
-                messagebox.showinfo("MOCK (PAUSA)", 
-                                    "A transação MOCK está em pausa.\nClique OK para simular o COMMIT.")
-            messagebox.showinfo("MOCK (Sucesso)", f"Encomenda {enc_id} atualizada (simulado).")
+        def fetch_encomenda_pagina(self, enc_id: int, tamanho_pagina: int = 200):
+            header, linhas = self.fetch_encomenda_data(enc_id)
+            return header, len(linhas), linhas
+
+        def fetch_linhas_pagina(self, enc_id: int, apos_produto=None, deslocamento: int = 0, tamanho_pagina: int = 200):
+            return []
+
+        def fetch_encomendas(self, enc_ids=None, de=None, ate=None, usar_cache=True, pre_carga=False):
+            return {}
+
+        def encomenda_em_cache(self, enc_id: int, validar: bool = True):
+            return None
+
+        def ler_para_edicao(self, enc_id: int, ao_receber_lote=None, cancelar=None):
+            return (*self.fetch_encomenda_data(enc_id), {})
+
+        def editar_encomenda(self, enc_id: int, nova_morada: str, produtos_alterados: list, pausar_para_teste: bool = False,
+                             ao_pausar=None, versoes=None):
+            if pausar_para_teste and ao_pausar:
+                ao_pausar()
+            elif pausar_para_teste:
+                self._notificar('info', "MOCK (PAUSA)", "A transação MOCK esteve em pausa; sem ao_pausar o COMMIT segue já.")
+            self._notificar('info', "MOCK (Sucesso)", f"Encomenda {enc_id} atualizada (simulado).")
 
     DbConnectionEdit = MockDbConnectionEdit # Substitui a classe real pela MOCK
+    BackendSQLite = None
+    AmostradorBloqueios = None
+
+    def fundir_edicao(base, servidor, nova_morada, produtos_alterados, preferir_local=True):
+        return nova_morada, produtos_alterados, []
+
+
+# EXECUTOR DA BD (fora da thread do Tk)
+
+class ExecutorBD:
+    """
+    Corre as chamadas à BD numa thread pool para a janela nunca congelar.
+    Os resultados (e qualquer função pedida com na_ui) são entregues na thread
+    do Tk através de 'after', a ~60 fps enquanto houver trabalho pendente.
+    """
+    INTERVALO_OCUPADO_MS = 16
+    INTERVALO_LIVRE_MS = 100
+
+    def __init__(self, root, max_workers: int = 4):
+        self.root = root
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bd-edit")
+        self._pendentes = [] # (future, ao_concluir, ao_falhar)
+        self._ignorados = set() # Futures cancelados já em execução: o resultado é descartado
+        self._fila_ui = queue.SimpleQueue()
+        self._ocupado = False
+        self._a_processar = False
+        self.ao_mudar_ocupado = None # Chamado com True/False na thread do Tk
+        self._agendado = self.root.after(self.INTERVALO_LIVRE_MS, self._processar)
+
+    @property
+    def ocupado(self):
+        return bool(self._pendentes)
+
+    def submeter(self, funcao, *args, ao_concluir=None, ao_falhar=None, **kwargs):
+        """ Chamar na thread do Tk. Devolve o Future; os callbacks correm na thread do Tk. """
+        futuro = self._pool.submit(funcao, *args, **kwargs)
+        self._pendentes.append((futuro, ao_concluir, ao_falhar))
+        self._reagendar(self.INTERVALO_OCUPADO_MS)
+        return futuro
+
+    def cancelar(self, futuro):
+        """ Cancela se ainda não começou; se já está a correr, o resultado é ignorado. """
+        if futuro is not None and not futuro.cancel() and not futuro.done():
+            self._ignorados.add(futuro)
+
+    def na_ui(self, funcao, *args):
+        """ Pode ser chamado de qualquer thread: agenda funcao(*args) na thread do Tk. """
+        self._fila_ui.put((funcao, args))
+
+    def encerrar(self):
+        if self._agendado:
+            self.root.after_cancel(self._agendado)
+            self._agendado = None
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _reagendar(self, intervalo_ms):
+        if self._agendado:
+            self.root.after_cancel(self._agendado)
+        self._agendado = self.root.after(intervalo_ms, self._processar)
+
+    def _processar(self):
+        self._agendado = None
+        if self._a_processar:
+            # Um callback abriu uma janela modal (messagebox), que corre um ciclo do Tk aninhado:
+            # a passagem de fora continua quando ela fechar, e nada é entregue duas vezes
+            self._reagendar(self.INTERVALO_OCUPADO_MS)
+            return
+        self._a_processar = True
+        try:
+            self._entregar()
+        finally:
+            self._a_processar = False
+            # Aconteça o que acontecer nos callbacks, a bomba continua
+            self._reagendar(self.INTERVALO_OCUPADO_MS if self._pendentes else self.INTERVALO_LIVRE_MS)
+
+    def _entregar(self):
+        while True:
+            try:
+                funcao, args = self._fila_ui.get_nowait()
+            except queue.Empty:
+                break
+            self._chamar(funcao, *args)
+
+        # Concluídos e pendentes separados ANTES de chamar qualquer callback
+        concluidos, ainda_pendentes = [], []
+        for pendente in self._pendentes:
+            (concluidos if pendente[0].done() else ainda_pendentes).append(pendente)
+        self._pendentes = ainda_pendentes
+
+        for futuro, ao_concluir, ao_falhar in concluidos:
+            if futuro in self._ignorados or futuro.cancelled():
+                self._ignorados.discard(futuro)
+            elif futuro.exception() is not None:
+                if ao_falhar:
+                    self._chamar(ao_falhar, futuro.exception())
+            elif ao_concluir:
+                self._chamar(ao_concluir, futuro.result())
+
+        if self._ocupado != self.ocupado:
+            self._ocupado = self.ocupado
+            if self.ao_mudar_ocupado:
+                self._chamar(self.ao_mudar_ocupado, self._ocupado)
+
+    def _chamar(self, funcao, *args):
+        # Um callback com erro não pode parar a entrega dos outros: o erro segue o caminho normal do Tk
+        try:
+            funcao(*args)
+        except Exception as ex:
+            self.root.report_callback_exception(type(ex), ex, ex.__traceback__)
 
 
 #JANELA DE LOGIN
@@ -117,8 +267,253 @@ class LoginDialog(tk.Toplevel):
         self.destroy()
 
 
+# LISTA VIRTUAL DE LINHAS (encomendas muito grandes)
+
+class ListaLinhasVirtual:
+    """
+    Treeview com itens só para as linhas visíveis. As linhas chegam por páginas
+    (paginação por chave em Produtold), pedidas através do executor quando a
+    janela visível precisa delas. Cada item só é reescrito se o valor mudou,
+    por isso recarregar custa o mesmo seja qual for o tamanho da encomenda.
+    """
+    TAMANHO_PAGINA = 200
+    MAX_PAGINAS = 20 # Páginas em memória; saem primeiro as mais afastadas da vista
+    COLUNAS = ("ID", "Designacao", "Preco", "Qtd")
+
+    def __init__(self, master, executor, ler_pagina, rastreio):
+        self.executor = executor
+        # ler_pagina(enc_id, apos_produto, deslocamento, tamanho_pagina) -> linhas (corre fora da thread do Tk)
+        self.ler_pagina = ler_pagina
+        self.rastreio = rastreio # Mensagens de páginas que falharam
+
+        caixa = tk.Frame(master)
+        caixa.pack(padx=5, pady=5, fill="both", expand=True)
+        self.tree = ttk.Treeview(caixa, columns=self.COLUNAS, show="headings")
+        self.tree.heading("ID", text="ProdutoId")
+        self.tree.heading("Designacao", text="Designacao")
+        self.tree.heading("Preco", text="Preço")
+        self.tree.heading("Qtd", text="Quantidade")
+        self.scroll = ttk.Scrollbar(caixa, orient="vertical", command=self._rolar)
+        self.scroll.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.tree.bind("<Configure>", lambda evento: self._desenhar())
+        for evento in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(evento, self._roda)
+
+        self._enc_id = None
+        self._total = 0
+        self._inicio = 0 # Índice da primeira linha visível
+        self._memoria = None # Linhas já todas em memória (sem paginação)
+        self._paginas = {}
+        self._paginas_antigas = {} # Mostradas enquanto as da recarga não chegam
+        self._ultimo_id = {} # página -> último Produtold (chave para pedir a seguinte)
+        self._pedidas = set()
+        self._geracao = 0 # Muda a cada carga: respostas de cargas antigas são ignoradas
+        self._valores = [] # Valores mostrados em cada item
+
+    # --- Carregar ---
+    def mostrar_linhas(self, enc_id, linhas):
+        """ Todas as linhas já estão em memória (ex: modo otimista). """
+        self._nova_carga(enc_id, len(linhas))
+        self._memoria = list(linhas)
+        self._desenhar()
+
+    def acrescentar(self, enc_id, linhas):
+        """ Mais linhas de uma leitura em curso (iterar_linhas): só a barra e a vista mudam. """
+        if enc_id != self._enc_id or self._memoria is None:
+            return
+        self._memoria.extend(linhas)
+        self._total = len(self._memoria)
+        self._desenhar()
+
+    def mostrar_paginado(self, enc_id, total: int, primeira_pagina: list):
+        """ Só a primeira página veio com o cabeçalho; as restantes pedem-se ao rolar. """
+        self._nova_carga(enc_id, total)
+        self._guardar_pagina(0, primeira_pagina)
+        self._desenhar()
+
+    def _nova_carga(self, enc_id, total):
+        if enc_id != self._enc_id:
+            self._inicio = 0
+            self._paginas_antigas = {}
+        else:
+            # Recarga da mesma encomenda: fica na mesma posição e mostra o que já tinha
+            self._paginas_antigas = self._paginas
+        self._enc_id, self._total, self._memoria = enc_id, total, None
+        self._paginas, self._ultimo_id, self._pedidas = {}, {}, set()
+        self._geracao += 1
+
+    def procurar(self, produto_id):
+        """ A linha do produto, se estiver em memória (None se ainda não foi lida). """
+        if self._memoria is not None:
+            fontes = [self._memoria]
+        else:
+            fontes = list(self._paginas.values())
+        for linhas in fontes:
+            for linha in linhas:
+                if linha.Produtold == produto_id:
+                    return linha
+        return None
+
+    # --- Páginas ---
+    def _linha(self, indice):
+        if self._memoria is not None:
+            return self._memoria[indice] if indice < len(self._memoria) else None
+        pagina, posicao = divmod(indice, self.TAMANHO_PAGINA)
+        linhas = self._paginas.get(pagina, self._paginas_antigas.get(pagina))
+        return linhas[posicao] if linhas is not None and posicao < len(linhas) else None
+
+    def _guardar_pagina(self, pagina, linhas):
+        self._paginas[pagina] = list(linhas)
+        self._paginas_antigas.pop(pagina, None)
+        if linhas:
+            self._ultimo_id[pagina] = linhas[-1].Produtold
+        # Limita a memória: descarta as páginas mais afastadas da posição atual
+        atual = self._inicio // self.TAMANHO_PAGINA
+        for afastada in sorted(self._paginas, key=lambda p: abs(p - atual))[self.MAX_PAGINAS:]:
+            del self._paginas[afastada]
+
+    def _pedir_em_falta(self, visiveis):
+        if self._memoria is not None or not visiveis:
+            return
+        for pagina in range(self._inicio // self.TAMANHO_PAGINA,
+                            (self._inicio + visiveis - 1) // self.TAMANHO_PAGINA + 1):
+            if pagina in self._paginas or pagina in self._pedidas:
+                continue
+            self._pedidas.add(pagina)
+            # Com a página anterior conhecida usa a chave; senão salta por OFFSET
+            apos_produto = self._ultimo_id.get(pagina - 1)
+            geracao = self._geracao
+            self.executor.submeter(
+                self.ler_pagina, self._enc_id, apos_produto, pagina * self.TAMANHO_PAGINA, self.TAMANHO_PAGINA,
+                ao_concluir=lambda linhas, p=pagina: self._pagina_chegou(geracao, p, linhas),
+                ao_falhar=lambda ex, p=pagina: self._pagina_falhou(geracao, p, ex))
+
+    def _pagina_chegou(self, geracao, pagina, linhas):
+        if geracao != self._geracao:
+            return
+        self._pedidas.discard(pagina)
+        self._guardar_pagina(pagina, linhas)
+        self._desenhar()
+
+    def _pagina_falhou(self, geracao, pagina, ex):
+        if geracao == self._geracao:
+            self._pedidas.discard(pagina)
+            self.rastreio.mensagem(f"❌ Não foi possível ler a página {pagina} das linhas: {ex}", 'erro')
+
+    # --- Desenho ---
+    def _n_visiveis(self):
+        itens = self.tree.get_children()
+        caixa = self.tree.bbox(itens[0]) if itens else None
+        topo, altura_linha = (caixa[1], caixa[3]) if caixa else (25, 20)
+        return max(1, (self.tree.winfo_height() - topo) // max(altura_linha, 1))
+
+    def _desenhar(self):
+        visiveis = self._n_visiveis()
+        self._inicio = max(0, min(self._inicio, self._total - visiveis))
+        n = min(visiveis, self._total - self._inicio)
+
+        itens = list(self.tree.get_children())
+        for i in range(len(itens), n):
+            itens.append(self.tree.insert("", "end", iid=f"v{i}"))
+            self._valores.append(None)
+        if len(itens) > n:
+            self.tree.delete(*itens[n:])
+            del itens[n:], self._valores[n:]
+
+        # Só os itens cujo valor mudou são reescritos
+        for i, item in enumerate(itens):
+            linha = self._linha(self._inicio + i)
+            valores = ((linha.Produtold, linha.Designacao, linha.Preco, linha.Qtd) if linha is not None
+                       else ("...", "(a carregar)", "", ""))
+            if self._valores[i] != valores:
+                self.tree.item(item, values=valores)
+                self._valores[i] = valores
+
+        if self._total:
+            self.scroll.set(self._inicio / self._total, (self._inicio + n) / self._total)
+        else:
+            self.scroll.set(0, 1)
+        self._pedir_em_falta(n)
+
+    def _rolar(self, *args):
+        if args[0] == "moveto":
+            self._inicio = int(float(args[1]) * self._total)
+        elif args[0] == "scroll":
+            self._inicio += int(args[1]) * (self._n_visiveis() if args[2] == "pages" else 1)
+        self._desenhar()
+
+    def _roda(self, evento):
+        para_cima = evento.num == 4 or getattr(evento, "delta", 0) > 0
+        self._inicio += -3 if para_cima else 3
+        self._desenhar()
+        return "break"
+
+
+# PAINEL DE BLOQUEIOS (amostras das DMVs / da BD local)
+class PainelBloqueios(tk.Toplevel):
+    """ Bloqueios e esperas das sessões da aplicação, atualizados a cada amostra. """
+    COLUNAS = ("Sessao", "Referencia", "Estado", "Espera", "ms", "BloqueadaPor", "Recurso", "Modo", "Pedido", "N")
+
+    def __init__(self, master, executor, fonte, rastreio, intervalo_seg: float = 1.0):
+        super().__init__(master)
+        self.title("Bloqueios (amostras)")
+        self.geometry("900x320")
+        self.executor = executor
+        self.amostrador = AmostradorBloqueios(fonte, intervalo_seg=intervalo_seg, rastreio=rastreio)
+        # A amostra chega na thread do amostrador: o desenho é feito na thread do Tk
+        self.amostrador.ao_amostrar = lambda amostra: self.executor.na_ui(self.mostrar, amostra)
+        self.protocol("WM_DELETE_WINDOW", self.fechar)
+
+        self.resumo = tk.Label(self, text="À espera da primeira amostra...", anchor="w")
+        self.resumo.pack(fill="x", padx=10, pady=5)
+        self.tree = ttk.Treeview(self, columns=self.COLUNAS, show="headings", height=10)
+        for coluna in self.COLUNAS:
+            self.tree.heading(coluna, text=coluna)
+            self.tree.column(coluna, width=260 if coluna == "Referencia" else 70)
+        self.tree.tag_configure("espera", foreground="red")
+        self.tree.pack(fill="both", expand=True, padx=10)
+
+        botoes = tk.Frame(self)
+        botoes.pack(fill="x", padx=10, pady=5)
+        tk.Button(botoes, text="Exportar JSON", command=lambda: self.exportar("json")).pack(side="left")
+        tk.Button(botoes, text="Exportar CSV", command=lambda: self.exportar("csv")).pack(side="left", padx=5)
+        self.amostrador.iniciar()
+
+    def mostrar(self, amostra):
+        if not self.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for b in amostra.bloqueios:
+            self.tree.insert("", "end", tags=("espera",) if b.estado_pedido == "WAIT" else (), values=(
+                b.sessao, b.referencia or "", b.estado or "", b.tipo_espera or "", b.espera_ms or "",
+                b.bloqueada_por or "", b.recurso, b.modo, b.estado_pedido, b.quantidade))
+        sessoes = {b.sessao for b in amostra.bloqueios}
+        a_esperar = {b.sessao for b in amostra.bloqueios if b.estado_pedido == "WAIT"}
+        espera_total_ms = sum(e.espera_ms for e in amostra.esperas)
+        self.resumo.config(text=f"{amostra.instante:%H:%M:%S} | {len(sessoes)} sessões com bloqueios | "
+                                f"{len(a_esperar)} à espera | LCK_M_* acumulado: {espera_total_ms} ms | "
+                                f"{len(self.amostrador.amostras)} amostras")
+
+    def exportar(self, formato):
+        caminho = filedialog.asksaveasfilename(parent=self, defaultextension=f".{formato}",
+                                               filetypes=[(formato.upper(), f"*.{formato}")])
+        if not caminho:
+            return
+        n = getattr(self.amostrador, f"exportar_{formato}")(caminho)
+        messagebox.showinfo("Exportado", f"{n} registos exportados para {caminho}.", parent=self)
+
+    def fechar(self):
+        self.amostrador.ao_amostrar = None
+        self.amostrador.parar()
+        self.destroy()
+
+
 # APLICAÇÃO PRINCIPAL
 class AppEdit(tk.Tk):
+    # Encomendas seguintes (EncId + 1 ... + PRE_CARREGAR) lidas em fundo depois de cada carga (0 desliga)
+    PRE_CARREGAR = 5
+
     def __init__(self, db_connection):
         super().__init__()
         self.title("MEI - Aplicação Edit | Controlo de Transações")
@@ -127,17 +522,75 @@ class AppEdit(tk.Tk):
         # Variáveis de Estado
         self.db = db_connection # USA A CONEXÃO GUARDADA
         self.isolation_var = tk.StringVar(value=self.db.NIVEL_ISOLAMENTO_ATUAL)
-        self.is_connected = True 
+        # Modo otimista: sem bloqueios durante a edição, conflitos detetados no COMMIT
+        self.otimista_var = tk.BooleanVar(value=False)
+
+        # As chamadas à BD correm fora da thread do Tk
+        self.executor = ExecutorBD(self)
+        self.db.notificar = lambda tipo, titulo, mensagem: self.executor.na_ui(self._mostrar_mensagem, tipo, titulo, mensagem)
+        self._futuro_carga = None
+        # Pré-carregamento numa thread própria: não conta como 'ocupado' nem atrasa as leituras pedidas
+        self._pre_carregador = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pre-carregar")
+        self._futuro_pre_carga = None
+        self._cancelar_leitura = threading.Event()
+        self._edicao_em_curso = False
+        self._pausas_ativas = []
+        self._a_fechar = False
+        self._painel_bloqueios = None
+        self.protocol("WM_DELETE_WINDOW", self.on_fechar)
         
         # Variáveis de Edição
         self.enc_id_var = tk.StringVar()
         self.morada_var = tk.StringVar()
         self.produtos_alterados = [] 
+        # Versão lida (base da fusão a três no modo otimista e das alterações a enviar)
+        self._enc_carregada = None
+        self._base = None
+        self._qtds_originais = {} # Produtold -> Qtd lida (só as linhas já vistas)
+        self._versoes = None
+        self._edicao_submetida = None
         
         self._criar_frame_configuracao()
         self._criar_frame_edicao()
         self._criar_frame_produtos()
+        self.executor.ao_mudar_ocupado = self._mostrar_ocupado
         
+    @property
+    def is_connected(self):
+        # Pergunta ao motor (o pool valida a ligação e tenta religar). Pode bloquear: chamar fora da thread do Tk.
+        return self.db.is_connected
+
+    def _mostrar_mensagem(self, tipo, titulo, mensagem):
+        getattr(messagebox, f"show{tipo}")(titulo, mensagem, parent=self)
+
+    def _mostrar_ocupado(self, ocupado):
+        if ocupado:
+            self.ocupado_label.config(text="A aguardar a BD...")
+            self.progresso.start(15)
+            self.cancelar_btn.config(state="normal")
+        else:
+            self.ocupado_label.config(text="")
+            self.progresso.stop()
+            self.cancelar_btn.config(state="disabled")
+
+    def _falha_de_conexao(self, ex):
+        self.status_conn.config(text="Estado: SEM CONEXÃO", fg="red")
+        messagebox.showerror("Erro", f"Perda de conexão.\n{ex}")
+
+    def on_fechar(self):
+        # Uma transação em pausa avança para o COMMIT (como o OK da pausa) para a thread terminar;
+        # uma que chegue à pausa depois disto também não espera
+        self._a_fechar = True
+        for continuar in list(self._pausas_ativas):
+            continuar.set()
+        if self._painel_bloqueios is not None and self._painel_bloqueios.winfo_exists():
+            self._painel_bloqueios.fechar()
+        self.executor.encerrar()
+        self._pre_carregador.shutdown(wait=False, cancel_futures=True)
+        if hasattr(self.db, 'fechar'):
+            self.db.fechar() # Espera pela edição em curso (COMMIT e log) e escreve os registos ainda em fila
+        self.destroy()
+
     # --- Secção 1: Configuração e Conexão ---
     def _criar_frame_configuracao(self):
         frame = tk.LabelFrame(self, text="1. Nível de Isolamento", padx=10, pady=10)
@@ -152,21 +605,46 @@ class AppEdit(tk.Tk):
         isolamento_menu.pack(side="left", padx=10)
         
         tk.Button(frame, text="Aplicar Nível", command=self.aplicar_isolamento).pack(side="left", padx=20)
+        tk.Checkbutton(frame, text="Modo otimista", variable=self.otimista_var).pack(side="left")
+        tk.Button(frame, text="Bloqueios...", command=self.abrir_painel_bloqueios).pack(side="left", padx=10)
 
         # Status
         self.status_conn = tk.Label(frame, text=f"Estado: CONECTADO ({self.db.SERVER_NAME})", fg="green")
         self.status_conn.pack(side="right", padx=10)
 
+        # Indicador de ocupado (a BD está a trabalhar numa thread à parte)
+        self.cancelar_btn = tk.Button(frame, text="Cancelar", state="disabled", command=self.cancelar_carga)
+        self.cancelar_btn.pack(side="right", padx=5)
+        self.progresso = ttk.Progressbar(frame, mode="indeterminate", length=80)
+        self.progresso.pack(side="right", padx=5)
+        self.ocupado_label = tk.Label(frame, text="", fg="gray")
+        self.ocupado_label.pack(side="right")
+
         # Aplicar o nível inicial
         self.aplicar_isolamento()
 
     def aplicar_isolamento(self):
         # Aplica o nível de isolamento escolhido usando o motor de BD.
         nivel = self.isolation_var.get()
-        if self.db.set_isolation(nivel):
-            self.status_conn.config(text=f"Estado: CONECTADO | {nivel}", fg="green")
-        else:
-            self.status_conn.config(text="Estado: Erro ao definir Isolamento", fg="orange")
+
+        def _aplicado(sucesso):
+            if sucesso:
+                self.status_conn.config(text=f"Estado: CONECTADO | {nivel}", fg="green")
+            else:
+                self.status_conn.config(text="Estado: Erro ao definir Isolamento", fg="orange")
+
+        self.executor.submeter(self.db.set_isolation, nivel, ao_concluir=_aplicado,
+                               ao_falhar=lambda ex: _aplicado(False))
+
+    def abrir_painel_bloqueios(self):
+        if self._painel_bloqueios is not None and self._painel_bloqueios.winfo_exists():
+            self._painel_bloqueios.lift()
+            return
+        backend = getattr(self.db, 'backend', None)
+        if AmostradorBloqueios is None or backend is None:
+            messagebox.showwarning("Aviso", "Sem fonte de amostras de bloqueios para esta ligação.")
+            return
+        self._painel_bloqueios = PainelBloqueios(self, self.executor, backend.fonte_bloqueios(), self.db.rastreio)
 
     # --- Secção 2: Edição (Carregar Dados) ---
     def _criar_frame_edicao(self):
@@ -184,11 +662,7 @@ class AppEdit(tk.Tk):
         self.morada_entry.grid(row=1, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
 
     def carregar_dados(self):
-        """ LÊ os dados da BD (Passo 4) usando o motor. """
-        if not self.is_connected:
-            messagebox.showerror("Erro", "Perda de conexão.")
-            return
-
+        """ LÊ os dados da BD (Passo 4) usando o motor, numa thread de trabalho. """
         try:
             enc_id_text = self.enc_id_var.get()
             if not enc_id_text:
@@ -196,21 +670,113 @@ class AppEdit(tk.Tk):
                 return
                 
             enc_id = int(enc_id_text)
-            
-            # Chama o motor de BD para o SELECT
-            header, linhas = self.db.fetch_encomenda_data(enc_id)
-            
-            # Preenche a UI
-            self.morada_var.set(header.Morada)
-            self.produtos_alterados = [] 
-            self.atualizar_lista_produtos(linhas) # Passa as linhas lidas
-            
-            messagebox.showinfo("Carregado", f"Encomenda {enc_id} carregada. {len(linhas)} linhas encontradas.")
-            
         except ValueError:
             messagebox.showerror("Erro", "ID da Encomenda deve ser um número inteiro.")
-        except Exception as e:
-            messagebox.showerror("Erro ao Carregar", f"Não foi possível ler os dados:\n{e}")
+            return
+
+        # Um novo pedido substitui o anterior (se ainda não tiver chegado)
+        self.cancelar_carga()
+        self._cancelar_leitura = threading.Event()
+        self._futuro_carga = self.executor.submeter(
+            self._ler_encomenda, enc_id, self.otimista_var.get(), self._cancelar_leitura,
+            ao_concluir=lambda resultado: self._mostrar_encomenda(enc_id, *resultado),
+            ao_falhar=self._falha_ao_carregar)
+
+    def _ler_encomenda(self, enc_id, otimista=False, cancelar=None):
+        # Corre na thread de trabalho: não pode tocar em widgets
+        if not otimista:
+            # Pré-carregada (ou lida antes): aparece já, sem ir à BD; a versão é confirmada em fundo
+            em_cache = self.db.encomenda_em_cache(enc_id, validar=False)
+            if em_cache is not None:
+                self._pre_carregador.submit(self._revalidar, enc_id)
+                return (*em_cache, None, None)
+        if not self.is_connected:
+            raise ConnectionError("A BD não responde.")
+        # Chama o motor de BD para o SELECT (no modo otimista vêm também as versões)
+        if otimista:
+            # As linhas chegam por lotes: as primeiras aparecem sem esperar pelas restantes
+            lotes_recebidos = []
+
+            def _lote_recebido(lote):
+                funcao = self.lista.acrescentar if lotes_recebidos else self.lista.mostrar_linhas
+                lotes_recebidos.append(len(lote))
+                self.executor.na_ui(self._mostrar_lote, cancelar, funcao, enc_id, lote)
+
+            return (*self.db.ler_para_edicao(enc_id, ao_receber_lote=_lote_recebido, cancelar=cancelar), None)
+        # Só o cabeçalho e a primeira página: o resto da lista pede-se ao rolar
+        header, total, linhas = self.db.fetch_encomenda_pagina(enc_id, ListaLinhasVirtual.TAMANHO_PAGINA)
+        return header, linhas, None, total
+
+    def _mostrar_encomenda(self, enc_id, header, linhas, versoes=None, total=None):
+        # Preenche a UI (total=None: as linhas vieram todas)
+        self._futuro_carga = None
+        self._enc_carregada, self._base, self._versoes = enc_id, (header, linhas), versoes
+        self._qtds_originais = {linha.Produtold: linha.Qtd for linha in linhas}
+        self.morada_var.set(header.Morada)
+        self.produtos_alterados = [] 
+        if total is None:
+            self.atualizar_lista_produtos(linhas) # Passa as linhas lidas
+        else:
+            self.lista.mostrar_paginado(enc_id, total, linhas)
+        self._pre_carregar(enc_id)
+        
+        messagebox.showinfo("Carregado", f"Encomenda {enc_id} carregada. "
+                                         f"{len(linhas) if total is None else total} linhas encontradas.")
+
+    def _pre_carregar(self, enc_id):
+        """ Aquece a cache do motor com as encomendas seguintes enquanto o operador edita esta. """
+        if not self.PRE_CARREGAR or self.db.cache is None:
+            return
+        seguintes = [e for e in range(enc_id + 1, enc_id + 1 + self.PRE_CARREGAR) if e not in self.db.cache]
+        if not seguintes:
+            return
+        if self._futuro_pre_carga is not None:
+            self._futuro_pre_carga.cancel() # Se ainda não começou, fica só o pedido mais recente
+        self._futuro_pre_carga = self._pre_carregador.submit(self._pre_carregar_em_fundo, seguintes)
+
+    def _pre_carregar_em_fundo(self, enc_ids):
+        # Corre na thread de pré-carregamento: uma ida à BD para todas (fetch_encomendas)
+        try:
+            self.db.fetch_encomendas(enc_ids, pre_carga=True)
+        except Exception as ex:
+            self.db.rastreio.mensagem(f"⚠️ Pré-carregamento das encomendas {enc_ids[0]}-{enc_ids[-1]} falhou: {ex}", 'aviso')
+
+    def _revalidar(self, enc_id):
+        # Thread de pré-carregamento: a encomenda mostrada da cache ainda é a do servidor?
+        try:
+            atual = self.db.encomenda_em_cache(enc_id) is not None
+        except Exception as ex:
+            self.db.rastreio.mensagem(f"⚠️ Não foi possível confirmar a versão da Encomenda {enc_id}: {ex}", 'aviso')
+            return
+        if not atual:
+            self.executor.na_ui(self._encomenda_desatualizada, enc_id)
+
+    def _encomenda_desatualizada(self, enc_id):
+        # A cache já foi invalidada: recarregar lê do servidor
+        if self._enc_carregada != enc_id or self.enc_id_var.get().strip() != str(enc_id):
+            return
+        if self.produtos_alterados or self._edicao_em_curso or self.morada_var.get() != self._base[0].Morada:
+            messagebox.showwarning("Encomenda alterada",
+                                   f"A Encomenda {enc_id} foi alterada por outra sessão depois de ser pré-carregada.\n"
+                                   "Recarregue-a antes de guardar.")
+            return
+        self.carregar_dados()
+
+    def _mostrar_lote(self, cancelar, funcao, enc_id, lote):
+        if not cancelar.is_set():
+            funcao(enc_id, lote)
+
+    def _falha_ao_carregar(self, ex):
+        self._futuro_carga = None
+        if isinstance(ex, ConnectionError):
+            self._falha_de_conexao(ex)
+        else:
+            messagebox.showerror("Erro ao Carregar", f"Não foi possível ler os dados:\n{ex}")
+
+    def cancelar_carga(self):
+        self._cancelar_leitura.set() # Uma leitura por lotes já a correr para no próximo lote
+        self.executor.cancelar(self._futuro_carga)
+        self._futuro_carga = None
         
     
     # --- Secção 3: Linhas da Encomenda (e Controlo de Transação) ---
@@ -218,13 +784,9 @@ class AppEdit(tk.Tk):
         frame = tk.LabelFrame(self, text="3. Linhas da Encomenda (Alterar Qtd)", padx=10, pady=10)
         frame.pack(padx=10, pady=10, fill="both", expand=True)
 
-        # Usar uma Treeview
-        self.tree = ttk.Treeview(frame, columns=("ID", "Designacao", "Preco", "Qtd"), show="headings")
-        self.tree.heading("ID", text="ProdutoId")
-        self.tree.heading("Designacao", text="Designacao")
-        self.tree.heading("Preco", text="Preço")
-        self.tree.heading("Qtd", text="Quantidade")
-        self.tree.pack(padx=5, pady=5, fill="both", expand=True)
+        # Treeview virtual: só tem itens para as linhas visíveis
+        self.lista = ListaLinhasVirtual(frame, self.executor, self.db.fetch_linhas_pagina, self.db.rastreio)
+        self.tree = self.lista.tree
         
         tk.Button(frame, text="Adicionar/Alterar Produto (para o UPDATE)", command=self.adicionar_produto_ui).pack(pady=5)
         
@@ -248,6 +810,10 @@ class AppEdit(tk.Tk):
 
             # Adicionar/Atualizar na lista interna
             self.produtos_alterados = [p for p in self.produtos_alterados if p['produto_id'] != prod_id]
+            if nova_qtd == self._qtd_original(prod_id):
+                # Voltou ao valor lido: deixa de ser uma alteração
+                messagebox.showinfo("Produto Reposto", f"Produto {prod_id} já tem Qtd={nova_qtd}: não será alterado.")
+                return
             self.produtos_alterados.append({'produto_id': prod_id, 'nova_qtd': nova_qtd})
             
             messagebox.showinfo("Produto Adicionado", f"Produto {prod_id} será atualizado para {nova_qtd} no COMMIT.")
@@ -255,21 +821,35 @@ class AppEdit(tk.Tk):
         except TypeError:
             pass # Cancelado
 
+    def _qtd_original(self, produto_id):
+        # Qtd lida ao carregar; numa lista paginada a linha pode vir de uma página lida depois
+        if produto_id not in self._qtds_originais:
+            linha = self.lista.procurar(produto_id)
+            if linha is None:
+                return None
+            self._qtds_originais[produto_id] = linha.Qtd
+        return self._qtds_originais[produto_id]
+
+    def _alteracoes(self, enc_id, morada):
+        """
+        O que mudou desde a leitura: (nova_morada ou None, produtos com Qtd diferente da lida).
+        Sem a encomenda carregada não há com que comparar e vai tudo.
+        """
+        if self._base is None or self._enc_carregada != enc_id:
+            return morada, list(self.produtos_alterados)
+        header, _ = self._base
+        produtos = [p for p in self.produtos_alterados if p['nova_qtd'] != self._qtd_original(p['produto_id'])]
+        return (None if morada == header.Morada else morada), produtos
+
     def atualizar_lista_produtos(self, linhas_db):
-        # Atualiza a Treeview com os dados lidos da BD. 
-        # Limpa a árvore
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        
-        # Insere os dados lidos da BD
-        for linha in linhas_db:
-            self.tree.insert("", "end", values=(linha.Produtold, linha.Designacao, linha.Preco, linha.Qtd))
+        # Atualiza a Treeview com os dados lidos da BD (só as linhas visíveis que mudaram)
+        self.lista.mostrar_linhas(self._enc_carregada, linhas_db)
             
     def iniciar_transacao(self, pausar=False):
         # Função principal que chama o motor de BD (Passos 2, 3, 5, 6, 7). 
-        if not self.is_connected:
-             messagebox.showerror("Erro", "Perda de conexão.")
-             return
+        if self._edicao_em_curso:
+            messagebox.showwarning("Aviso", "Já existe uma transação em curso nesta janela.")
+            return
              
         try:
             enc_id_text = self.enc_id_var.get()
@@ -278,34 +858,145 @@ class AppEdit(tk.Tk):
                 return
                 
             enc_id = int(enc_id_text)
-            nova_morada = self.morada_var.get()
+            morada = self.morada_var.get()
             
-            # Validação simples para não submeter se nada mudou
-            # (Isto pode ser melhorado se 'header' for guardado em self)
-            # if nova_morada == self.morada_original and not self.produtos_alterados:
-            #      messagebox.showwarning("Aviso", "Não foram especificadas alterações (Morada ou Produtos).")
-            #      return
-
-            # Chama a função principal do motor de BD
-            self.db.editar_encomenda(
+            # Só vai para o motor o que mudou desde a leitura (morada=None: cabeçalho não é tocado)
+            nova_morada, produtos = self._alteracoes(enc_id, morada)
+            if nova_morada is None and not produtos:
+                messagebox.showwarning("Aviso", "Não foram especificadas alterações (Morada ou Produtos).")
+                return
+
+            versoes = None
+            if self.otimista_var.get():
+                if self._versoes is None or self._enc_carregada != enc_id:
+                    messagebox.showwarning("Aviso", "No modo otimista carregue a Encomenda (com o modo ativo) antes de guardar.")
+                    return
+                versoes = self._versoes
+
+            # Chama a função principal do motor de BD (numa thread de trabalho)
+            self._edicao_em_curso = True
+            # A fusão de um conflito compara a morada do formulário, alterada ou não
+            self._edicao_submetida = (enc_id, morada, produtos)
+            self.executor.submeter(
+                self.db.editar_encomenda,
                 enc_id, 
                 nova_morada, 
-                self.produtos_alterados, 
-                pausar_para_teste=pausar
+                produtos, 
+                pausar_para_teste=pausar,
+                ao_pausar=self._aguardar_fim_da_pausa,
+                versoes=versoes,
+                ao_concluir=self._transacao_terminada,
+                ao_falhar=self._transacao_falhou
             )
             
-            # Recarregar os dados após o commit
-            self.carregar_dados()
-            
         except ValueError:
             messagebox.showerror("Erro", "ID da Encomenda inválido.")
-        except Exception as e:
-            messagebox.showerror("Erro na Transação", f"Ocorreu um erro: {e}")
+
+    def _transacao_terminada(self, resultado):
+        self._edicao_em_curso = False
+        if resultado and resultado.get('conflito'):
+            # Modo otimista: outra sessão mudou a encomenda. Lê a versão atual para a fusão
+            enc_id, nova_morada, produtos = self._edicao_submetida
+            self.executor.submeter(
+                self.db.ler_para_edicao, enc_id,
+                ao_concluir=lambda atual: self._resolver_conflito(nova_morada, produtos, *atual),
+                ao_falhar=self._falha_ao_carregar)
+            return
+        # Recarregar os dados após o commit
+        self.carregar_dados()
+
+    def _resolver_conflito(self, nova_morada, produtos, header, linhas, versoes):
+        """ Fusão a três: versão lida (base), alterações do operador e versão atual do servidor. """
+        base, servidor = self._base, (header, linhas)
+        morada, fundidos, conflitos = fundir_edicao(base, servidor, nova_morada, produtos)
+        # A versão atual passa a ser a base: o próximo GUARDAR já não entra em conflito com ela
+        self._base, self._versoes = servidor, versoes
+        self._qtds_originais = {linha.Produtold: linha.Qtd for linha in linhas}
+        self.atualizar_lista_produtos(linhas)
+
+        if not conflitos:
+            self._aplicar_fusao(morada, fundidos)
+            if not fundidos and morada == header.Morada:
+                messagebox.showinfo("Conflito resolvido",
+                                    "Outra sessão já guardou os mesmos valores: não há nada a guardar.")
+                return
+            messagebox.showinfo("Conflito resolvido",
+                                "Outra sessão alterou esta Encomenda, mas noutros campos.\n"
+                                "As alterações foram combinadas e vão ser guardadas de novo.")
+            self.iniciar_transacao()
+            return
+
+        detalhe = "\n".join(
+            f"  {'Morada' if c.campo == 'Morada' else f'Produto {c.campo}'}: lido={c.base}, seu={c.local}, "
+            f"atual={'(linha apagada)' if c.servidor is None else c.servidor}"
+            for c in conflitos)
+        escolha = messagebox.askyesnocancel(
+            "Conflito de Edição",
+            f"Outra sessão alterou os mesmos campos desde que a Encomenda foi carregada:\n\n{detalhe}\n\n"
+            "Sim: guardar os seus valores por cima.\n"
+            "Não: ficar com os valores atuais (as suas outras alterações são guardadas).\n"
+            "Cancelar: rever no formulário antes de guardar.")
+        if escolha is False:
+            morada, fundidos, _ = fundir_edicao(base, servidor, nova_morada, produtos, preferir_local=False)
+        self._aplicar_fusao(morada, fundidos)
+        if escolha is not None and (fundidos or morada != header.Morada):
+            self.iniciar_transacao()
+
+    def _aplicar_fusao(self, morada, produtos):
+        self.morada_var.set(morada)
+        self.produtos_alterados = produtos
+
+    def _transacao_falhou(self, ex):
+        self._edicao_em_curso = False
+        messagebox.showerror("Erro na Transação", f"Ocorreu um erro: {ex}")
+
+    def _aguardar_fim_da_pausa(self):
+        # Corre na thread de trabalho, com a transação aberta: espera pelo botão da janela de pausa
+        continuar = threading.Event()
+        self._pausas_ativas.append(continuar)
+        if self._a_fechar:
+            continuar.set() # A janela está a fechar: segue para o COMMIT
+        else:
+            self.executor.na_ui(self._mostrar_janela_pausa, continuar)
+        continuar.wait()
+        self._pausas_ativas.remove(continuar)
+
+    def _mostrar_janela_pausa(self, continuar):
+        # Janela NÃO modal: a aplicação continua a responder (ex: carregar dados noutra conexão)
+        janela = tk.Toplevel(self)
+        janela.title("Transação em Pausa")
+
+        def _commit():
+            continuar.set()
+            janela.destroy()
+
+        janela.protocol("WM_DELETE_WINDOW", _commit)
+        tk.Label(janela, justify="left", padx=20, pady=10,
+                 text="A transação está ATIVA com dados não confirmados (UPDATEs executados).\n"
+                      "Verifique no Browser/SSMS (deve estar bloqueado).\n\n"
+                      "Clique no botão para executar o COMMIT.").pack()
+        tk.Button(janela, text="Executar COMMIT", bg="green", fg="white", command=_commit).pack(pady=10)
 
 
 # CONTROLADOR PRINCIPAL (TESTE DIRETO SEM LOGIN) ---
 
 if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Aplicação Edit")
+    parser.add_argument("--bd-local", nargs="?", const="", metavar="FICHEIRO",
+                        help="usar uma BD SQLite local (criada e semeada se preciso) em vez do SQL Server")
+    parser.add_argument("--encomendas", type=int, default=100, help="encomendas a semear na BD local")
+    parser.add_argument("--linhas", type=int, default=20, help="linhas por encomenda na BD local")
+    args = parser.parse_args()
+
+    if args.bd_local is not None and BackendSQLite is not None:
+        # Motor real (pool, cache, log, ...) sobre SQLite: sem servidor nem credenciais
+        db_conn_edit = DbConnectionEdit()
+        backend = BackendSQLite(args.bd_local or None).preparar(args.encomendas, args.linhas)
+        if not db_conn_edit.ligar(backend):
+            sys.exit(1)
+        AppEdit(db_conn_edit).mainloop()
+        sys.exit(0)
     
     print("--- INICIANDO TESTE DE CONEXÃO DIRETA ---")
 
@@ -0,0 +1,93 @@
+"""
+Tempo de arranque a frio do motor e do serviço sem interface (db_servico_edit).
+
+Cada medição é um processo Python novo:
+  - import: só o import do módulo (o motor não pode trazer tkinter atrás);
+  - ler (CLI): python -m db_servico_edit ler, do arranque à saída;
+  - 1.ª resposta (servir): python -m db_servico_edit servir, do arranque até à
+    resposta ao primeiro trabalho recebido no stdin.
+Corre contra a BD local de substituição (db_local_edit):
+
+    python bench_arranque_edit.py --repeticoes 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from db_backend_edit import BackendSQLite
+
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+
+MEDIR_IMPORT = (
+    "import sys, time; inicio = time.perf_counter(); import {modulo}; "
+    "print((time.perf_counter() - inicio) * 1000, 'tkinter' in sys.modules)"
+)
+
+
+def medir_import(modulo: str):
+    """ (ms do import, tkinter carregado?) num processo novo. """
+    resultado = subprocess.run([sys.executable, "-c", MEDIR_IMPORT.format(modulo=modulo)],
+                               cwd=PASTA, capture_output=True, text=True)
+    if resultado.returncode != 0:
+        raise RuntimeError(resultado.stderr.strip().splitlines()[-1])
+    ms, tkinter = resultado.stdout.split()
+    return float(ms), tkinter == "True"
+
+
+def medir_cli(caminho: str):
+    inicio = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "db_servico_edit", "--bd-local", caminho, "ler", "1"],
+                   cwd=PASTA, capture_output=True, check=True)
+    return (time.perf_counter() - inicio) * 1000
+
+
+def medir_servico(caminho: str):
+    inicio = time.perf_counter()
+    processo = subprocess.Popen([sys.executable, "-m", "db_servico_edit", "--bd-local", caminho, "servir"],
+                                cwd=PASTA, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True)
+    processo.stdin.write(json.dumps({'id': 1, 'op': 'ler', 'enc_id': 1}) + "\n")
+    processo.stdin.flush()
+    resposta = json.loads(processo.stdout.readline())
+    ms = (time.perf_counter() - inicio) * 1000
+    processo.stdin.close()
+    processo.wait()
+    if not resposta['ok']:
+        raise RuntimeError(resposta['erro'])
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--linhas", type=int, default=20, help="linhas por encomenda")
+    args = parser.parse_args()
+
+    caminho = BackendSQLite().preparar(5, args.linhas).caminho
+    medicoes = [(f"import {modulo}", lambda modulo=modulo: medir_import(modulo))
+                for modulo in ("db_motor_edit", "db_servico_edit", "app_edit_ui")]
+    medicoes += [("ler (CLI)", lambda: (medir_cli(caminho), None)),
+                 ("1.ª resposta (servir)", lambda: (medir_servico(caminho), None))]
+
+    print(f"\n{args.repeticoes} processos novos por medição | {sys.executable}")
+    print(f"{'medição':<26}{'mediana ms':>12}{'mín ms':>10}{'máx ms':>10}{'tkinter':>9}")
+    for nome, medir in medicoes:
+        try:
+            resultados = [medir() for _ in range(args.repeticoes)]
+        except (RuntimeError, subprocess.CalledProcessError) as ex:
+            print(f"{nome:<26}❌ {ex}")
+            continue
+        tempos = [ms for ms, _ in resultados]
+        tkinter = resultados[0][1]
+        print(f"{nome:<26}{statistics.median(tempos):>12.1f}{min(tempos):>10.1f}{max(tempos):>10.1f}"
+              f"{'-' if tkinter is None else ('sim' if tkinter else 'não'):>9}")
+    os.remove(caminho)
+
+
+if __name__ == '__main__':
+    main()
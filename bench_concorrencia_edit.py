@@ -0,0 +1,244 @@
+"""
+Gerador de carga concorrente para a transação de edição, em todos os níveis de
+isolamento da aplicação (READ UNCOMMITTED ... SNAPSHOT).
+
+Põe N editores (editar_encomenda) e M leitores (fetch_encomenda_data) a
+trabalhar ao mesmo tempo, através do mesmo DbConnectionEdit, sobre um conjunto
+de EncIds partilhado (quanto menor --encomendas, mais colisões). Para cada
+nível mede débito, latência p50/p95/p99, repetições, deadlocks, timeouts de
+bloqueio e tempo total à espera de bloqueios, e escreve tudo em JSON.
+
+Por omissão corre contra a BD local de substituição (db_local_edit), que imita
+os bloqueios do SQL Server por nível de isolamento (ao nível da BD, não da
+linha, por isso os números servem para comparar níveis e regressões, não para
+prever o servidor real). Com --server corre contra o SQL Server; aí o tempo
+bloqueado vem de sys.dm_os_wait_stats (esperas LCK_M_*, de todo o servidor).
+Cada nível leva também, em 'etapas', os histogramas do rastreio do motor
+(ler_encomenda, update_linhas, commit, log_insert, ...).
+
+Exemplos:
+    python bench_concorrencia_edit.py --editores 4 --leitores 8 --duracao-seg 5 --saida carga.json
+    python bench_concorrencia_edit.py --niveis SNAPSHOT SERIALIZABLE --pausa-ms 50
+    python bench_concorrencia_edit.py --server 192.168.100.14,1433 --user User_SGBD_PL1_02 --enc-ids 1 2 3
+"""
+import argparse
+import contextlib
+import getpass
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+from db_backend_edit import BackendSQLite, BackendSqlServer
+from db_motor_edit import DbConnectionEdit
+from db_pool_edit import ErroPool
+
+
+NIVEIS_ISOLAMENTO = ["READ UNCOMMITTED", "READ COMMITTED", "REPEATABLE READ", "SERIALIZABLE", "SNAPSHOT"]
+
+ESPERAS_BLOQUEIO_SQL = "SELECT SUM(wait_time_ms) FROM sys.dm_os_wait_stats WHERE wait_type LIKE 'LCK_M_%'"
+
+
+def percentil(ordenados: list, p: float):
+    if not ordenados:
+        return None
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def resumir(tempos_ms: list, falhas: int, duracao_seg: float):
+    tempos_ms = sorted(tempos_ms)
+    return {
+        'operacoes': len(tempos_ms),
+        'falhas': falhas,
+        'por_seg': round(len(tempos_ms) / duracao_seg, 1),
+        'media_ms': round(statistics.fmean(tempos_ms), 2) if tempos_ms else None,
+        'p50_ms': percentil(tempos_ms, 50),
+        'p95_ms': percentil(tempos_ms, 95),
+        'p99_ms': percentil(tempos_ms, 99),
+    }
+
+
+class TempoBloqueado:
+    """ Tempo total à espera de bloqueios: contadores da BD local ou DMVs do SQL Server. """
+
+    def __init__(self, db, conexoes_locais=None):
+        self.db = db
+        self.conexoes_locais = conexoes_locais
+
+    def ler_ms(self):
+        if self.conexoes_locais is not None:
+            return sum(c.tempo_bloqueado_seg for c in list(self.conexoes_locais)) * 1000
+        try:
+            with self.db.pool.conexao() as conn:
+                cursor = conn.cursor()
+                cursor.execute(ESPERAS_BLOQUEIO_SQL)
+                valor = cursor.fetchone()[0]
+                cursor.close()
+            return float(valor or 0)
+        except (self.db.Erro, ErroPool) as ex:
+            print(f"⚠️ Sem acesso a sys.dm_os_wait_stats ({ex}); tempo bloqueado não medido.", file=sys.stderr)
+            return None
+
+
+def correr_nivel(db, nivel: str, produtos: dict, args, tempo_bloqueado: TempoBloqueado):
+    """ Corre editores e leitores durante args.duracao_seg no nível dado. Devolve o resumo. """
+    if not db.set_isolation(nivel):
+        return {'nivel': nivel, 'erro': "Não foi possível definir o nível de isolamento."}
+
+    enc_ids = list(produtos)
+    politica = db.politica_repeticao
+    estatisticas_antes = dict(politica.estatisticas)
+    bloqueado_antes = tempo_bloqueado.ler_ms()
+    db.rastreio.limpar()
+    pausa_seg = args.pausa_ms / 1000
+
+    resultados = {'editores': {'tempos': [], 'falhas': 0}, 'leitores': {'tempos': [], 'falhas': 0}}
+    lock = threading.Lock()
+    limite = time.monotonic() + args.duracao_seg
+
+    def editor(semente):
+        aleatorio = random.Random(semente)
+        contagem = resultados['editores']
+        while time.monotonic() < limite:
+            enc_id = aleatorio.choice(enc_ids)
+            alterados = [{'produto_id': p, 'nova_qtd': aleatorio.randint(1, 50)}
+                         for p in aleatorio.sample(produtos[enc_id], min(args.produtos_por_edicao, len(produtos[enc_id])))]
+            inicio = time.perf_counter()
+            resultado = db.editar_encomenda(enc_id, f"Rua Carga {aleatorio.randint(1, 9999)}", alterados,
+                                            pausar_para_teste=pausa_seg > 0, ao_pausar=lambda: time.sleep(pausa_seg))
+            with lock:
+                if resultado is None:
+                    contagem['falhas'] += 1
+                else:
+                    contagem['tempos'].append(round((time.perf_counter() - inicio) * 1000, 3))
+
+    def leitor(semente):
+        aleatorio = random.Random(semente)
+        contagem = resultados['leitores']
+        while time.monotonic() < limite:
+            inicio = time.perf_counter()
+            try:
+                db.fetch_encomenda_data(aleatorio.choice(enc_ids), usar_cache=False)
+            except (db.Erro, ErroPool):
+                with lock:
+                    contagem['falhas'] += 1
+                continue
+            with lock:
+                contagem['tempos'].append(round((time.perf_counter() - inicio) * 1000, 3))
+
+    threads = [threading.Thread(target=editor, args=(args.semente + i,)) for i in range(args.editores)]
+    threads += [threading.Thread(target=leitor, args=(args.semente + 1000 + i,)) for i in range(args.leitores)]
+    inicio = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duracao = time.monotonic() - inicio
+    db.escritor_log.esvaziar()
+
+    bloqueado_depois = tempo_bloqueado.ler_ms()
+    delta = {chave: politica.estatisticas[chave] - estatisticas_antes[chave] for chave in politica.estatisticas}
+    return {
+        'nivel': nivel,
+        'duracao_seg': round(duracao, 2),
+        'editores': resumir(resultados['editores']['tempos'], resultados['editores']['falhas'], duracao),
+        'leitores': resumir(resultados['leitores']['tempos'], resultados['leitores']['falhas'], duracao),
+        'repeticoes': delta['repeticoes'],
+        'desistencias': delta['desistencias'],
+        'deadlocks': delta['deadlock'],
+        'timeouts_bloqueio': delta['timeout_bloqueio'],
+        'conflitos_snapshot': delta['conflito_snapshot'],
+        'tempo_bloqueado_ms': (round(bloqueado_depois - bloqueado_antes, 1)
+                               if bloqueado_antes is not None and bloqueado_depois is not None else None),
+        'etapas': db.rastreio.resumo(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--editores", type=int, default=4)
+    parser.add_argument("--leitores", type=int, default=4)
+    parser.add_argument("--duracao-seg", type=float, default=5.0, help="duração de cada nível")
+    parser.add_argument("--niveis", nargs="+", default=NIVEIS_ISOLAMENTO, choices=NIVEIS_ISOLAMENTO, metavar="NIVEL")
+    parser.add_argument("--produtos-por-edicao", type=int, default=3)
+    parser.add_argument("--pausa-ms", type=float, default=0.0,
+                        help="tempo entre os UPDATEs e o COMMIT (como o botão PAUSAR para Teste)")
+    parser.add_argument("--lock-timeout-ms", type=int, default=2000)
+    parser.add_argument("--max-tentativas", type=int, default=4)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--saida", help="ficheiro JSON com os resultados")
+    parser.add_argument("--verboso", action="store_true", help="mostra as mensagens do motor")
+    local = parser.add_argument_group("BD local (por omissão)")
+    local.add_argument("--encomendas", type=int, default=8, help="EncIds partilhados pelos clientes")
+    local.add_argument("--linhas", type=int, default=10, help="linhas por encomenda")
+    local.add_argument("--latencia-ms", type=float, default=1.0, help="latência simulada por ida à BD")
+    servidor = parser.add_argument_group("SQL Server")
+    servidor.add_argument("--server")
+    servidor.add_argument("--database", default="SGBD_PL1_02")
+    servidor.add_argument("--user", default="User_SGBD_PL1_02")
+    servidor.add_argument("--enc-ids", type=int, nargs="+", help="EncIds a usar (por omissão 1..--encomendas)")
+    args = parser.parse_args()
+
+    db = DbConnectionEdit()
+    db.cache = None # Mede a BD, não a cache
+    db.notificar = lambda tipo, titulo, mensagem: None # As falhas contam-se pelo retorno
+    db.politica_repeticao.max_tentativas = args.max_tentativas
+    db.politica_repeticao.lock_timeout_ms = args.lock_timeout_ms
+    db.rastreio.ativo = True # Tempos por etapa em cada nível
+    max_conexoes = args.editores + args.leitores + 2 # + escritor de log e leituras das DMVs
+
+    if args.server:
+        password = os.environ.get("SGBD_PASSWORD") or getpass.getpass(f"Password de {args.user}: ")
+        backend = BackendSqlServer(args.server, args.database, args.user, password, driver=db.DRIVER)
+    else:
+        backend = BackendSQLite(latencia_ms=args.latencia_ms).preparar(args.encomendas, args.linhas)
+    if not db.ligar(backend, max_conexoes=max_conexoes):
+        sys.exit(2)
+    tempo_bloqueado = TempoBloqueado(db, getattr(backend, 'conexoes', None))
+
+    enc_ids = args.enc_ids or list(range(1, args.encomendas + 1))
+    produtos = {}
+    for enc_id in enc_ids:
+        _, linhas = db.fetch_encomenda_data(enc_id, usar_cache=False)
+        if linhas:
+            produtos[enc_id] = [linha.Produtold for linha in linhas]
+    if not produtos:
+        print("❌ Nenhuma das encomendas indicadas tem linhas.")
+        sys.exit(2)
+
+    print(f"\n{args.editores} editores + {args.leitores} leitores | {len(produtos)} encomendas | "
+          f"{args.duracao_seg}s por nível | BD {backend.nome}")
+    print(f"{'nível':<18}{'edições/s':>10}{'p50':>8}{'p95':>8}{'p99':>8}{'leituras/s':>11}{'p95':>8}"
+          f"{'repet.':>8}{'deadl.':>8}{'timeout':>8}{'bloq. ms':>10}")
+    niveis = []
+    silencio = open(os.devnull, "w")
+    for nivel in args.niveis:
+        with contextlib.redirect_stdout(sys.stdout if args.verboso else silencio):
+            resultado = correr_nivel(db, nivel, produtos, args, tempo_bloqueado)
+        niveis.append(resultado)
+        if 'erro' in resultado:
+            print(f"{nivel:<18}❌ {resultado['erro']}")
+            continue
+        editores, leitores = resultado['editores'], resultado['leitores']
+        print(f"{nivel:<18}{editores['por_seg']:>10}{editores['p50_ms'] or 0:>8.1f}{editores['p95_ms'] or 0:>8.1f}"
+              f"{editores['p99_ms'] or 0:>8.1f}{leitores['por_seg']:>11}{leitores['p95_ms'] or 0:>8.1f}"
+              f"{resultado['repeticoes']:>8}{resultado['deadlocks']:>8}{resultado['timeouts_bloqueio']:>8}"
+              f"{resultado['tempo_bloqueado_ms'] if resultado['tempo_bloqueado_ms'] is not None else '-':>10}")
+
+    db.fechar()
+    silencio.close()
+
+    if args.saida:
+        configuracao = {chave: valor for chave, valor in vars(args).items() if chave not in ('saida', 'verboso')}
+        with open(args.saida, "w", encoding="utf-8") as ficheiro:
+            json.dump({'data': datetime.now().isoformat(timespec="seconds"), 'backend': backend.nome,
+                       'configuracao': configuracao, 'niveis': niveis}, ficheiro, indent=2, ensure_ascii=False)
+        print(f"\nResultados escritos em {args.saida}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Microbenchmark de fetch_encomenda_data: dois SELECTs separados vs. um só batch
+com dois result sets (e a variante consistente em SNAPSHOT). Depois, a leitura
+de todas as encomendas (uma a uma vs. fetch_encomendas) e a carga da encomenda
+seguinte na UI (primeira página vs. pré-carregada, com a versão confirmada em fundo).
+
+Corre contra a BD local de substituição (db_local_edit), com latência de rede
+simulada por ida à BD, para não precisar do SQL Server:
+
+    python bench_fetch_edit.py --latencia-ms 2 --linhas 200 --repeticoes 200
+"""
+import argparse
+import statistics
+import time
+
+from db_backend_edit import BackendSQLite
+from db_cache_edit import CacheEncomendasEdit
+from db_motor_edit import DbConnectionEdit
+
+
+def medir(db, enc_ids, **opcoes):
+    tempos = []
+    for enc_id in enc_ids:
+        inicio = time.perf_counter()
+        db.fetch_encomenda_data(enc_id, **opcoes)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        'media_ms': statistics.fmean(tempos),
+        'p50_ms': tempos[len(tempos) // 2],
+        'p95_ms': tempos[int(len(tempos) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencia-ms", type=float, default=2.0, help="latência simulada por ida à BD")
+    parser.add_argument("--encomendas", type=int, default=50)
+    parser.add_argument("--linhas", type=int, default=20, help="linhas por encomenda")
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args()
+
+    backend = BackendSQLite(latencia_ms=args.latencia_ms).preparar(args.encomendas, args.linhas)
+    conexoes = backend.conexoes
+
+    db = DbConnectionEdit()
+    db.ligar(backend, min_conexoes=1, max_conexoes=1, intervalo_validacao_seg=3600)
+    db.cache = None # Mede as leituras reais, não a cache
+    enc_ids = [(i % args.encomendas) + 1 for i in range(args.repeticoes)]
+
+    modos = [
+        ("2 SELECTs separados", {'em_lote': False}),
+        ("1 batch (nextset)", {'em_lote': True}),
+        ("1 batch SNAPSHOT", {'em_lote': True, 'consistente': True}),
+    ]
+    print(f"\n{args.repeticoes} leituras | {args.linhas} linhas/encomenda | latência {args.latencia_ms} ms")
+    print(f"{'modo':<22}{'média ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'idas/leitura':>14}")
+    for nome, opcoes in modos:
+        db.fetch_encomenda_data(1, **opcoes) # aquecimento
+        idas_antes = sum(c.idas_a_bd for c in conexoes)
+        resultado = medir(db, enc_ids, **opcoes)
+        idas = (sum(c.idas_a_bd for c in conexoes) - idas_antes) / len(enc_ids)
+        print(f"{nome:<22}{resultado['media_ms']:>10.2f}{resultado['p50_ms']:>10.2f}"
+              f"{resultado['p95_ms']:>10.2f}{idas:>14.1f}")
+
+    todas = list(range(1, args.encomendas + 1))
+    print(f"\nTodas as {args.encomendas} encomendas")
+    print(f"{'modo':<32}{'total ms':>10}{'idas':>8}")
+    for nome, ler in [("fetch_encomenda_data x N", lambda: [db.fetch_encomenda_data(e) for e in todas]),
+                      ("fetch_encomendas (IN)", lambda: db.fetch_encomendas(todas)),
+                      ("fetch_encomendas (intervalo)", lambda: db.fetch_encomendas(de=1, ate=args.encomendas))]:
+        idas_antes = sum(c.idas_a_bd for c in conexoes)
+        inicio = time.perf_counter()
+        ler()
+        print(f"{nome:<32}{(time.perf_counter() - inicio) * 1000:>10.2f}{sum(c.idas_a_bd for c in conexoes) - idas_antes:>8}")
+
+    # Encomenda seguinte na UI: sem cache lê a primeira página; pré-carregada aparece da cache
+    # e a versão é confirmada depois (intervalo_validacao_seg=0: o operador demora mais do que o
+    # intervalo a passar à seguinte). O pré-carregamento e a confirmação correm em fundo na UI.
+    print(f"\nEncomenda seguinte (UI)")
+    print(f"{'modo':<32}{'média ms':>10}{'idas/carga':>12}")
+    for nome, pre_carregar in [("primeira página", False), ("pré-carregada (5 seguintes)", True)]:
+        db.cache = CacheEncomendasEdit(intervalo_validacao_seg=0)
+        tempos, idas = [], 0
+        for enc_id in todas:
+            idas_antes = sum(c.idas_a_bd for c in conexoes)
+            inicio = time.perf_counter()
+            if not pre_carregar or db.encomenda_em_cache(enc_id, validar=False) is None:
+                db.fetch_encomenda_pagina(enc_id)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            idas += sum(c.idas_a_bd for c in conexoes) - idas_antes
+            if pre_carregar:
+                db.encomenda_em_cache(enc_id)
+                db.fetch_encomendas([e for e in range(enc_id + 1, enc_id + 6) if e not in db.cache])
+        print(f"{nome:<32}{statistics.fmean(tempos):>10.2f}{idas / len(todas):>12.1f}")
+
+    db.fechar()
+
+
+if __name__ == '__main__':
+    main()
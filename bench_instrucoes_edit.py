@@ -0,0 +1,77 @@
+"""
+Microbenchmark do registo de instruções preparadas (db_instrucoes_edit):
+cursor novo por execução vs. cursores preparados por conexão, com e sem tipos
+explícitos nos parâmetros.
+
+Cada iteração lê uma encomenda e edita-a com uma morada de comprimento
+diferente. Mostra o tempo por iteração, as preparações feitas por iteração
+(contadas pela BD local) e as assinaturas (SQL + tipos dos parâmetros) distintas
+e repetidas: cada assinatura distinta é uma compilação possível no servidor.
+As mensagens do motor só aparecem com --verboso (senão o print entra nos tempos).
+Corre contra a BD local de substituição (db_local_edit):
+
+    python bench_instrucoes_edit.py --iteracoes 300 --produtos 5
+"""
+import argparse
+import contextlib
+import os
+import statistics
+import sys
+import time
+
+from db_backend_edit import BackendSQLite
+from db_instrucoes_edit import RegistoInstrucoes
+from db_motor_edit import DbConnectionEdit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="latência simulada por ida à BD")
+    parser.add_argument("--encomendas", type=int, default=20)
+    parser.add_argument("--linhas", type=int, default=20, help="linhas por encomenda")
+    parser.add_argument("--produtos", type=int, default=5, help="produtos alterados por edição")
+    parser.add_argument("--iteracoes", type=int, default=300)
+    parser.add_argument("--verboso", action="store_true", help="mostra as mensagens do motor")
+    args = parser.parse_args()
+
+    backend = BackendSQLite(latencia_ms=args.latencia_ms).preparar(args.encomendas, args.linhas)
+    db = DbConnectionEdit()
+    db.ligar(backend, min_conexoes=1, max_conexoes=1, intervalo_validacao_seg=3600)
+    db.cache = None # Mede as leituras reais, não a cache
+    db.notificar = lambda tipo, titulo, mensagem: None
+    db.rastreio.ativo = False # Sem spans: só o custo das instruções entra nos tempos
+
+    modos = [
+        ("cursor novo, sem tipos", RegistoInstrucoes(reutilizar=False, usar_tipos=False)),
+        ("cursor novo, com tipos", RegistoInstrucoes(reutilizar=False)),
+        ("cursores preparados", RegistoInstrucoes()),
+    ]
+    print(f"\n{args.iteracoes} leituras+edições | {args.produtos} produtos/edição | latência {args.latencia_ms} ms")
+    print(f"{'modo':<26}{'média ms':>10}{'p95 ms':>10}{'prep./iter.':>13}{'assinat.':>10}{'repetidas':>11}")
+    silencio = open(os.devnull, "w")
+    for nome, registo in modos:
+        db.instrucoes.limpar()
+        db.instrucoes = registo
+        db.pool.ao_fechar_conexao = registo.esquecer
+        preparacoes_antes = sum(c.preparacoes for c in backend.conexoes)
+        tempos = []
+        with contextlib.redirect_stdout(sys.stdout if args.verboso else silencio):
+            for i in range(args.iteracoes):
+                enc_id = i % args.encomendas + 1
+                produtos = [{'produto_id': p, 'nova_qtd': i % 7 + 1} for p in range(1, args.produtos + 1)]
+                inicio = time.perf_counter()
+                db.fetch_encomenda_data(enc_id)
+                db.editar_encomenda(enc_id, "Rua " + "x" * (i % 40), produtos)
+                tempos.append((time.perf_counter() - inicio) * 1000)
+        tempos.sort()
+        preparacoes = (sum(c.preparacoes for c in backend.conexoes) - preparacoes_antes) / args.iteracoes
+        e = registo.estatisticas
+        print(f"{nome:<26}{statistics.fmean(tempos):>10.2f}{tempos[int(len(tempos) * 0.95) - 1]:>10.2f}"
+              f"{preparacoes:>13.1f}{e['assinaturas']:>10}{e['assinaturas_repetidas']:>11}")
+
+    db.fechar()
+    silencio.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Microbenchmark da leitura das linhas de uma encomenda grande: fetchall()
+(fetch_encomenda_data) vs. streaming com fetchmany (iterar_linhas).
+
+Mede o tempo até à primeira linha, o tempo total e o pico de memória Python
+(tracemalloc) a consumir todas as linhas, e o custo de parar a meio. Corre
+contra a BD local de substituição (db_local_edit):
+
+    python bench_stream_edit.py --linhas 200000 --arraysize 500
+"""
+import argparse
+import time
+import tracemalloc
+
+from db_backend_edit import BackendSQLite
+from db_motor_edit import DbConnectionEdit
+
+
+def medir(consumir):
+    """ consumir(marcar_primeira) percorre as linhas; devolve (ms 1ª linha, ms total, pico MB, nº linhas). """
+    primeira = []
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    n = consumir(lambda: primeira or primeira.append(time.perf_counter()))
+    total = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (primeira[0] - inicio) * 1000 if primeira else None, total * 1000, pico / 2 ** 20, n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--linhas", type=int, default=100000, help="linhas da encomenda sintética")
+    parser.add_argument("--arraysize", type=int, default=500, help="linhas por fetchmany")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="latência simulada por ida à BD")
+    args = parser.parse_args()
+
+    db = DbConnectionEdit()
+    db.ligar(BackendSQLite(latencia_ms=args.latencia_ms).preparar(1, args.linhas),
+             min_conexoes=1, max_conexoes=1, intervalo_validacao_seg=3600)
+    db.cache = None # Mede as leituras reais, não a cache
+
+    def com_fetchall(marcar_primeira):
+        _, linhas = db.fetch_encomenda_data(1)
+        n = 0
+        for _ in linhas:
+            marcar_primeira()
+            n += 1
+        return n
+
+    def com_streaming(marcar_primeira):
+        n = 0
+        for _ in db.iterar_linhas(1, arraysize=args.arraysize):
+            marcar_primeira()
+            n += 1
+        return n
+
+    def parar_na_primeira(marcar_primeira):
+        for _ in db.iterar_linhas(1, arraysize=args.arraysize):
+            marcar_primeira()
+            return 1 # Sai do gerador: cancela o resto e devolve a conexão
+        return 0
+
+    modos = [
+        ("fetchall()", com_fetchall),
+        (f"fetchmany({args.arraysize})", com_streaming),
+        ("parar na 1ª linha", parar_na_primeira),
+    ]
+    print(f"\nEncomenda com {args.linhas} linhas | latência {args.latencia_ms} ms")
+    print(f"{'modo':<22}{'1ª linha ms':>13}{'total ms':>11}{'pico MB':>10}{'linhas':>9}")
+    for nome, consumir in modos:
+        primeira_ms, total_ms, pico_mb, n = medir(consumir)
+        print(f"{nome:<22}{primeira_ms:>13.2f}{total_ms:>11.1f}{pico_mb:>10.2f}{n:>9}")
+
+    db.fechar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Fixtures dos testes: o motor ligado a uma BD SQLite nova por teste (db_backend_edit.BackendSQLite).
+
+    python -m pytest -q
+"""
+import pytest
+
+from db_backend_edit import BackendSQLite
+from db_motor_edit import DbConnectionEdit
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return BackendSQLite(str(tmp_path / "bd_edit.sqlite")).preparar(n_encomendas=5, linhas_por_encomenda=4)
+
+
+@pytest.fixture
+def db(backend, tmp_path, monkeypatch):
+    """ Motor ligado ao backend; o ficheiro de reserva do log fica na pasta do teste. """
+    monkeypatch.chdir(tmp_path)
+    motor = DbConnectionEdit()
+    motor.politica_repeticao.espera_base_seg = 0.001 # Repetições sem esperas longas
+    assert motor.ligar(backend, min_conexoes=1, max_conexoes=4) is not None
+    yield motor
+    motor.fechar()
+
+
+def consultar(db, sql: str, *params):
+    """ Lê tudo de uma consulta numa conexão do pool. """
+    with db.pool.conexao() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql, *params)
+            return [tuple(linha) for linha in cursor.fetchall()]
+        finally:
+            cursor.close()
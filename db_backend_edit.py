@@ -0,0 +1,115 @@
+"""
+Backends de armazenamento do motor da Aplicação Edit.
+
+Um backend sabe abrir conexões ao estilo pyodbc (autocommit=False) e preparar
+a BD. O motor só usa o backend para obter a fábrica de conexões do pool, por
+isso o mesmo código de ligação, isolamento, leitura, edição e log corre em:
+  - BackendSqlServer: pyodbc + ODBC Driver for SQL Server (produção);
+  - BackendSQLite: ficheiro SQLite através de db_local_edit (offline, CI, profiling).
+
+O motor envia sempre T-SQL; a conexão SQLite traduz o que o SQLite não aceita
+(VALUES com alias, OFFSET/FETCH, tabelas #temporárias, SET ...) e imita os
+bloqueios por nível de isolamento, por isso os caminhos medidos offline são os
+mesmos de produção.
+
+    db.ligar(BackendSQLite("/tmp/bd_edit.sqlite").preparar(n_encomendas=1000, linhas_por_encomenda=1000))
+
+Cada backend sabe também criar a fonte de amostras de bloqueios (db_bloqueios_edit)
+e expõe em Erro a classe base dos erros das suas conexões (pyodbc.Error ou
+db_local_edit.Error), que é a que o motor apanha. Só o BackendSqlServer importa o
+pyodbc: a BD local corre sem pyodbc nem unixODBC instalados.
+"""
+
+
+# program_name das sessões da aplicação no SQL Server (filtra as DMVs)
+NOME_APLICACAO = "AppEdit"
+
+
+class BackendSqlServer:
+    nome = "sqlserver"
+
+    def __init__(self, server: str, database: str, username: str, password: str,
+                 driver: str = "{ODBC Driver 17 for SQL Server}"):
+        self.server = server
+        self.database = database
+        self._conn_str = (
+            f"DRIVER={driver};"
+            f"SERVER={server};"
+            f"DATABASE={database};"
+            f"UID={username};"
+            f"PWD={password};"
+            f"APP={NOME_APLICACAO};"
+            "TrustServerCertificate=yes;"
+        )
+
+    @property
+    def descricao(self):
+        return self.server
+
+    @property
+    def Erro(self):
+        import pyodbc
+        return pyodbc.Error
+
+    def preparar(self, **opcoes):
+        """ O esquema do SQL Server é gerido fora da aplicação: nada a fazer. """
+        return self
+
+    def fabrica(self):
+        import pyodbc # Só aqui: quem usa a BD local não precisa do driver ODBC
+        # autocommit=False é crucial
+        return pyodbc.connect(self._conn_str, autocommit=False)
+
+    def fonte_bloqueios(self):
+        from db_bloqueios_edit import FonteBloqueiosSqlServer # Só quem amostra bloqueios paga o import
+        return FonteBloqueiosSqlServer(self.fabrica, NOME_APLICACAO, self.Erro)
+
+
+class BackendSQLite:
+    nome = "sqlite"
+
+    def __init__(self, caminho: str = None, latencia_ms: float = 0.0, timeout_bloqueio_seg: float = 5.0):
+        # Importado só aqui: em produção o motor não precisa da BD local
+        import db_local_edit
+        self._local = db_local_edit
+        self.Erro = db_local_edit.Error
+        self.caminho = caminho
+        self.latencia_ms = latencia_ms
+        self.timeout_bloqueio_seg = timeout_bloqueio_seg
+        # Todas as conexões abertas (os benchmarks somam idas_a_bd / tempo_bloqueado_seg)
+        self.conexoes = []
+
+    @property
+    def descricao(self):
+        return f"SQLite {self.caminho}"
+
+    def preparar(self, n_encomendas: int = 10, linhas_por_encomenda: int = 5):
+        """ Cria o esquema e semeia dados sintéticos (num ficheiro temporário se não houver caminho). """
+        self.caminho = self._local.criar_bd_local(self.caminho, n_encomendas, linhas_por_encomenda)
+        return self
+
+    def fabrica(self):
+        if self.caminho is None:
+            self.preparar()
+        conexao = self._local.ConexaoLocal(self.caminho, latencia_seg=self.latencia_ms / 1000,
+                                           timeout_bloqueio_seg=self.timeout_bloqueio_seg)
+        self.conexoes.append(conexao)
+        return conexao
+
+    def fonte_bloqueios(self):
+        from db_bloqueios_edit import FonteBloqueiosLocal
+        return FonteBloqueiosLocal(self.conexoes)
+
+
+BACKENDS = {
+    BackendSqlServer.nome: BackendSqlServer,
+    BackendSQLite.nome: BackendSQLite,
+}
+
+
+def criar_backend(nome: str, **opcoes):
+    """ criar_backend("sqlite", caminho=...) ou criar_backend("sqlserver", server=..., ...). """
+    try:
+        return BACKENDS[nome](**opcoes)
+    except KeyError:
+        raise ValueError(f"Backend desconhecido: {nome} (disponíveis: {', '.join(BACKENDS)})") from None
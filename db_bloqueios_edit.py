@@ -0,0 +1,197 @@
+"""
+Instrumentação de bloqueios da Aplicação Edit.
+
+Um amostrador corre numa thread à parte e, a cada intervalo, pede à fonte uma
+fotografia dos bloqueios das sessões da aplicação: quem tem que bloqueios, quem
+está à espera de quem e há quanto tempo, e as esperas LCK_M_* acumuladas por
+sessão. Cada sessão traz a Referencia da edição em curso (o motor põe-na em
+CONTEXT_INFO na primeira instrução da transação), por isso uma transação em
+pausa aparece com a mesma referência dos registos 'O' de LogOperations.
+
+Fontes:
+  - FonteBloqueiosSqlServer: uma ida à BD por amostra (sys.dm_tran_locks,
+    sys.dm_exec_requests, sys.dm_exec_session_wait_stats), numa conexão própria
+    para não disputar o pool com as sessões bloqueadas;
+  - FonteBloqueiosLocal: o estado do gestor de bloqueios da BD local (db_local_edit).
+
+A linha do tempo exporta-se em JSON ou CSV (uma linha por bloqueio por amostra).
+"""
+import csv
+import json
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+
+from db_rastreio_edit import Rastreador
+
+
+# Um grupo de bloqueios de uma sessão (mesmo recurso, modo e estado do pedido)
+BloqueioSessao = namedtuple("BloqueioSessao", [
+    "sessao", "referencia", "estado", "comando", "tipo_espera", "espera_ms", "bloqueada_por",
+    "recurso", "modo", "estado_pedido", "quantidade"])
+# Esperas por bloqueios acumuladas numa sessão
+EsperaSessao = namedtuple("EsperaSessao", ["sessao", "tipo_espera", "esperas", "espera_ms"])
+Amostra = namedtuple("Amostra", ["instante", "bloqueios", "esperas"])
+
+# {programa}: só as sessões da aplicação (APP= na ligação), exceto a do próprio amostrador
+BLOQUEIOS_SQL = """
+SELECT s.session_id, REPLACE(CAST(s.context_info AS varchar(128)), CHAR(0), '') AS Referencia,
+       r.status, r.command, r.wait_type, r.wait_time, r.blocking_session_id,
+       l.resource_type, l.request_mode, l.request_status, COUNT(*) AS Quantidade
+FROM sys.dm_tran_locks AS l
+JOIN sys.dm_exec_sessions AS s ON s.session_id = l.request_session_id
+LEFT JOIN sys.dm_exec_requests AS r ON r.session_id = s.session_id
+WHERE s.program_name = ? AND s.session_id <> @@SPID AND l.resource_database_id = DB_ID()
+GROUP BY s.session_id, s.context_info, r.status, r.command, r.wait_type, r.wait_time, r.blocking_session_id,
+         l.resource_type, l.request_mode, l.request_status
+ORDER BY s.session_id;
+SELECT w.session_id, w.wait_type, w.waiting_tasks_count, w.wait_time_ms
+FROM sys.dm_exec_session_wait_stats AS w
+JOIN sys.dm_exec_sessions AS s ON s.session_id = w.session_id
+WHERE s.program_name = ? AND s.session_id <> @@SPID AND w.wait_type LIKE 'LCK_M_%'
+ORDER BY w.session_id, w.wait_type
+"""
+
+
+class FonteBloqueiosSqlServer:
+
+    def __init__(self, fabrica, programa: str, erro: type = Exception):
+        self.fabrica = fabrica
+        self.programa = programa
+        self.erro = erro # Classe base dos erros da fábrica (BackendSqlServer.Erro)
+        self._conexao = None
+
+    def amostrar(self):
+        if self._conexao is None:
+            self._conexao = self.fabrica()
+            with self._conexao.cursor() as cursor:
+                # As DMVs não bloqueiam, mas o amostrador nunca deve ficar preso
+                cursor.execute("SET LOCK_TIMEOUT 1000; SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED")
+        try:
+            cursor = self._conexao.cursor()
+            try:
+                cursor.execute(BLOQUEIOS_SQL, self.programa, self.programa)
+                bloqueios = [BloqueioSessao(*linha) for linha in cursor.fetchall()]
+                cursor.nextset()
+                esperas = [EsperaSessao(*linha) for linha in cursor.fetchall()]
+            finally:
+                cursor.close()
+            self._conexao.rollback()
+        except self.erro:
+            self.fechar() # Volta a ligar na próxima amostra
+            raise
+        return bloqueios, esperas
+
+    def fechar(self):
+        if self._conexao is not None:
+            try:
+                self._conexao.close()
+            except self.erro:
+                pass
+            self._conexao = None
+
+
+class FonteBloqueiosLocal:
+    """ As conexões da BD local (BackendSQLite.conexoes) e o gestor de bloqueios que partilham. """
+
+    def __init__(self, conexoes: list):
+        self.conexoes = conexoes
+
+    def amostrar(self):
+        agora = time.monotonic()
+        bloqueios, esperas = [], []
+        for conexao in list(self.conexoes):
+            if conexao.fechada:
+                continue
+            tem, espera = conexao.estado_bloqueios()
+            referencia = conexao.context_info.rstrip(b"\0").decode(errors="replace")
+            for modo in tem:
+                bloqueios.append(BloqueioSessao(
+                    conexao.sessao_id, referencia, "suspended" if espera else "sleeping", None, None, None, None,
+                    "DATABASE", modo, "GRANT", 1))
+            if espera:
+                modo, desde, bloqueadores = espera
+                bloqueios.append(BloqueioSessao(
+                    conexao.sessao_id, referencia, "suspended", "SELECT" if modo == "S" else "UPDATE",
+                    f"LCK_M_{modo}", int((agora - desde) * 1000),
+                    min((c.sessao_id for c in bloqueadores), default=None), "DATABASE", modo, "WAIT", 1))
+            for tipo_espera, (n, segundos) in sorted(conexao.esperas_bloqueio.items()):
+                if n:
+                    esperas.append(EsperaSessao(conexao.sessao_id, tipo_espera, n, int(segundos * 1000)))
+        return bloqueios, esperas
+
+    def fechar(self):
+        pass
+
+
+class AmostradorBloqueios:
+
+    def __init__(self, fonte, intervalo_seg: float = 1.0, max_amostras: int = 3600, rastreio: Rastreador = None):
+        self.fonte = fonte
+        # Para onde vão os avisos de amostras falhadas (a UI passa o do motor)
+        self.rastreio = rastreio or Rastreador(ativo=False)
+        self.intervalo_seg = intervalo_seg
+        # Linha do tempo limitada: as amostras mais antigas saem primeiro
+        self.amostras = deque(maxlen=max_amostras)
+        # Chamado na thread do amostrador com cada Amostra nova (a UI passa-a para a thread do Tk)
+        self.ao_amostrar = None
+        self.ultimo_erro = None
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        if self._thread is None:
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._correr, name="AmostradorBloqueios", daemon=True)
+            self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.intervalo_seg + 5)
+            self._thread = None
+        self.fonte.fechar()
+
+    def amostrar_agora(self):
+        bloqueios, esperas = self.fonte.amostrar()
+        amostra = Amostra(datetime.now(), bloqueios, esperas)
+        self.amostras.append(amostra)
+        return amostra
+
+    def _correr(self):
+        while not self._parar.is_set():
+            try:
+                amostra = self.amostrar_agora()
+                self.ultimo_erro = None
+                if self.ao_amostrar:
+                    self.ao_amostrar(amostra)
+            except Exception as ex:
+                if str(ex) != str(self.ultimo_erro):
+                    self.rastreio.mensagem(f"⚠️ Amostra de bloqueios falhou: {ex}", 'aviso')
+                self.ultimo_erro = ex
+            self._parar.wait(self.intervalo_seg)
+
+    # --- Exportação ---
+    def linha_do_tempo(self):
+        """ Uma linha (dict) por bloqueio de cada amostra; amostras sem bloqueios não aparecem. """
+        return [{'instante': amostra.instante.isoformat(sep=" "), **bloqueio._asdict()}
+                for amostra in list(self.amostras) for bloqueio in amostra.bloqueios]
+
+    def exportar_json(self, caminho: str):
+        amostras = [{'instante': a.instante.isoformat(sep=" "),
+                     'bloqueios': [b._asdict() for b in a.bloqueios],
+                     'esperas': [e._asdict() for e in a.esperas]}
+                    for a in list(self.amostras)]
+        with open(caminho, "w", encoding="utf-8") as ficheiro:
+            json.dump(amostras, ficheiro, ensure_ascii=False, indent=2)
+        return len(amostras)
+
+    def exportar_csv(self, caminho: str):
+        linhas = self.linha_do_tempo()
+        with open(caminho, "w", encoding="utf-8", newline="") as ficheiro:
+            escritor = csv.DictWriter(ficheiro, fieldnames=("instante",) + BloqueioSessao._fields)
+            escritor.writeheader()
+            escritor.writerows(linhas)
+        return len(linhas)
@@ -0,0 +1,352 @@
+"""
+Edição em massa de encomendas (muitas Encomendas num só trabalho).
+
+Lê um ficheiro CSV ou JSON com edições e aplica-as por lotes, uma transação
+por lote, com UPDATEs set-based (um UPDATE ... FROM (VALUES ...) por tabela e
+por lote). Os registos 'O' de LogOperations seguem pelo escritor de log do
+motor (INSERT multi-linha fora da transação).
+Um lote que morra num deadlock ou timeout de bloqueio é repetido segundo a
+política de repetição do motor (db_retry_edit).
+
+Formatos aceites:
+  CSV  (cabeçalho obrigatório): enc_id,nova_morada,produto_id,nova_qtd
+       Uma linha por alteração; nova_morada ou produto_id/nova_qtd podem ficar vazios.
+  JSON (uma edição por linha, ou uma lista, lida objeto a objeto):
+       {"enc_id": 1, "nova_morada": "Rua X", "produtos_alterados": [{"produto_id": 3, "nova_qtd": 2}]}
+Linhas/registos inválidos (EncId em falta, quantidade negativa, ...) não param o
+trabalho: são saltados e aparecem no relatório com o número e o motivo.
+Só as encomendas que um lote realmente muda levam registos 'O'.
+
+Exemplo:
+    python db_bulk_edit.py edicoes.csv --server 192.168.100.14,1433 --user User_SGBD_PL1_02
+    python db_bulk_edit.py edicoes.jsonl --bd-local /tmp/bd_edit.sqlite --tamanho-lote 200
+"""
+import argparse
+import csv
+import getpass
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from db_backend_edit import BackendSQLite, BackendSqlServer
+from db_motor_edit import DbConnectionEdit, gerar_referencia
+from db_sql_edit import consultar_values, executar_values
+
+
+UPDATE_MORADAS_SQL = (
+    "UPDATE Encomenda SET Morada = v.Morada "
+    "FROM (VALUES {valores}) AS v(EncId, Morada) "
+    "WHERE Encomenda.EncId = v.EncId"
+)
+UPDATE_QTDS_SQL = (
+    "UPDATE EncLinha SET Qtd = v.Qtd "
+    "FROM (VALUES {valores}) AS v(EncId, Produtold, Qtd) "
+    "WHERE EncLinha.EncId = v.EncId AND EncLinha.Produtold = v.Produtold"
+)
+# Quando um UPDATE afeta menos linhas do que as pedidas: que EncIds existem mesmo
+MORADAS_EXISTENTES_SQL = (
+    "SELECT v.EncId FROM (VALUES {valores}) AS v(EncId) "
+    "WHERE EXISTS (SELECT 1 FROM Encomenda WHERE Encomenda.EncId = v.EncId)"
+)
+QTDS_EXISTENTES_SQL = (
+    "SELECT DISTINCT v.EncId FROM (VALUES {valores}) AS v(EncId, Produtold) "
+    "JOIN EncLinha ON EncLinha.EncId = v.EncId AND EncLinha.Produtold = v.Produtold"
+)
+# Caracteres lidos de cada vez de uma lista JSON
+TAMANHO_BLOCO_JSON = 64 * 1024
+
+
+# --- Leitura das edições ---
+
+def _inteiro(valor, campo: str):
+    """ Inteiro >= 0 de um campo CSV (texto) ou JSON; ValueError com o motivo se não for. """
+    if valor is None or valor == "" or isinstance(valor, bool):
+        raise ValueError(f"{campo} em falta")
+    if isinstance(valor, float) and not valor.is_integer():
+        raise ValueError(f"{campo} não é inteiro: {valor!r}")
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{campo} não é inteiro: {valor!r}") from None
+    if numero < 0:
+        raise ValueError(f"{campo} negativo: {numero}")
+    return numero
+
+
+def _edicao(enc_id, nova_morada, produtos):
+    """ Edição validada {'enc_id', 'nova_morada', 'produtos_alterados'}; ValueError se for inválida. """
+    if nova_morada is not None and not isinstance(nova_morada, str):
+        raise ValueError(f"nova_morada não é texto: {nova_morada!r}")
+    if not isinstance(produtos, list):
+        raise ValueError("produtos_alterados não é uma lista")
+    produtos_alterados = []
+    for produto in produtos:
+        if not isinstance(produto, dict):
+            raise ValueError(f"produto inválido: {produto!r}")
+        produtos_alterados.append({'produto_id': _inteiro(produto.get('produto_id'), "produto_id"),
+                                   'nova_qtd': _inteiro(produto.get('nova_qtd'), "nova_qtd")})
+    return {'enc_id': _inteiro(enc_id, "enc_id"), 'nova_morada': nova_morada, 'produtos_alterados': produtos_alterados}
+
+
+def _registos_lista_json(ficheiro):
+    """ Os elementos de uma lista JSON, um a um, lidos por blocos (o ficheiro nunca está todo em memória). """
+    descodificador = json.JSONDecoder()
+    texto, fim = ficheiro.read(TAMANHO_BLOCO_JSON), False
+    pos = texto.index("[") + 1
+    while True:
+        # Saltar espaços e vírgulas entre elementos
+        while pos < len(texto) and texto[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(texto) and texto[pos] == "]":
+            return
+        if pos < len(texto):
+            try:
+                registo, fim_registo = descodificador.raw_decode(texto, pos)
+            except json.JSONDecodeError:
+                if fim:
+                    raise
+            else:
+                # No fim do texto lido um número pode estar cortado: só conta com mais texto a seguir
+                if fim_registo < len(texto) or fim:
+                    yield registo
+                    pos = fim_registo
+                    continue
+        elif fim:
+            raise ValueError("lista JSON sem ']' final")
+        bloco = ficheiro.read(TAMANHO_BLOCO_JSON)
+        texto, pos, fim = texto[pos:] + bloco, 0, not bloco
+
+
+def ler_edicoes(caminho: str, invalidas: list = None):
+    """
+    Gera edições {'enc_id', 'nova_morada', 'produtos_alterados'} a partir de CSV ou JSON, sem ler tudo para memória.
+    As linhas/registos inválidos são saltados e, com invalidas, acrescentados lá como
+    {'linha': n, 'erro': motivo} (CSV e JSON por linha) ou {'registo': n, 'erro': motivo} (lista JSON).
+    """
+    def _invalida(chave, numero, ex):
+        if invalidas is not None:
+            invalidas.append({chave: numero, 'erro': str(ex)})
+
+    with open(caminho, newline="", encoding="utf-8") as ficheiro:
+        if caminho.lower().endswith(".csv"):
+            # Linha 1 é o cabeçalho
+            for numero, linha in enumerate(csv.DictReader(ficheiro), start=2):
+                try:
+                    produtos = []
+                    if linha.get("produto_id") or linha.get("nova_qtd"):
+                        produtos.append({'produto_id': linha.get("produto_id"), 'nova_qtd': linha.get("nova_qtd")})
+                    edicao = _edicao(linha.get("enc_id"), linha.get("nova_morada") or None, produtos)
+                except ValueError as ex:
+                    _invalida('linha', numero, ex)
+                    continue
+                yield edicao
+            return
+
+        primeiro = ficheiro.read(1)
+        while primeiro.isspace():
+            primeiro = ficheiro.read(1)
+        ficheiro.seek(0)
+        if primeiro == "[":
+            registos, chave = enumerate(_registos_lista_json(ficheiro), start=1), 'registo'
+        else:
+            registos, chave = ((n, l) for n, l in enumerate(ficheiro, start=1) if l.strip()), 'linha'
+        for numero, registo in registos:
+            try:
+                if chave == 'linha':
+                    registo = json.loads(registo)
+                if not isinstance(registo, dict):
+                    raise ValueError(f"não é um objeto JSON: {registo!r}")
+                edicao = _edicao(registo.get("enc_id"), registo.get("nova_morada"), registo.get("produtos_alterados", []))
+            except ValueError as ex: # json.JSONDecodeError também é ValueError
+                _invalida(chave, numero, ex)
+                continue
+            yield edicao
+
+
+def agrupar_em_lotes(edicoes, tamanho_lote: int):
+    """
+    Junta as edições por EncId e entrega lotes de até tamanho_lote encomendas:
+    {enc_id: {'nova_morada': str ou None, 'qtds': {produto_id: nova_qtd}}}.
+    """
+    lote = OrderedDict()
+    for edicao in edicoes:
+        enc_id = edicao['enc_id']
+        if enc_id not in lote and len(lote) >= tamanho_lote:
+            yield lote
+            lote = OrderedDict()
+        alvo = lote.setdefault(enc_id, {'nova_morada': None, 'qtds': {}})
+        if edicao.get('nova_morada') is not None:
+            alvo['nova_morada'] = edicao['nova_morada']
+        for produto in edicao.get('produtos_alterados', []):
+            alvo['qtds'][produto['produto_id']] = produto['nova_qtd']
+    if lote:
+        yield lote
+
+
+# --- Execução ---
+
+def _aplicar_lote(db, lote):
+    """
+    Aplica um lote numa só transação.
+    Devolve (moradas afetadas, moradas pedidas, linhas pedidas, linhas afetadas, EncIds mudados).
+    """
+    moradas = [(enc_id, e['nova_morada']) for enc_id, e in lote.items() if e['nova_morada'] is not None]
+    qtds = [(enc_id, produto_id, qtd) for enc_id, e in lote.items() for produto_id, qtd in e['qtds'].items()]
+
+    lock_timeout_ms = db.politica_repeticao.lock_timeout_ms
+    conn = db.pool.obter()
+    descartar = False
+    try:
+        cursor = conn.cursor()
+        try:
+            if lock_timeout_ms is not None:
+                cursor.execute(f"SET LOCK_TIMEOUT {int(lock_timeout_ms)}")
+                db.pool.marcar_estado_alterado(conn)
+
+            inicio = datetime.now()
+            moradas_afetadas = executar_values(cursor, UPDATE_MORADAS_SQL, moradas, "(?, ?)")
+            linhas_afetadas = executar_values(cursor, UPDATE_QTDS_SQL, qtds, "(?, ?, ?)")
+            # EncIds/produtos inexistentes não mudam nada nem levam registos 'O';
+            # só se pergunta quais são quando um UPDATE afetou menos linhas do que as pedidas
+            if moradas_afetadas == len(moradas):
+                mudadas = {enc_id for enc_id, _ in moradas}
+            else:
+                mudadas = {linha[0] for linha in consultar_values(
+                    cursor, MORADAS_EXISTENTES_SQL, [(enc_id,) for enc_id, _ in moradas], "(?)")}
+            if linhas_afetadas == len(qtds):
+                mudadas.update(enc_id for enc_id, _, _ in qtds)
+            else:
+                mudadas.update(linha[0] for linha in consultar_values(
+                    cursor, QTDS_EXISTENTES_SQL, [(enc_id, produto_id) for enc_id, produto_id, _ in qtds], "(?, ?)"))
+            conn.commit()
+        except db.Erro:
+            try:
+                conn.rollback()
+            except db.Erro:
+                descartar = True
+            raise
+        finally:
+            cursor.close()
+    finally:
+        db.pool.devolver(conn, descartar=descartar)
+
+    # LOG INICIAL e FINAL das encomendas mudadas (pela ordem do lote), pelo escritor de log
+    fim = datetime.now()
+    referencias = {enc_id: gerar_referencia() for enc_id in lote if enc_id in mudadas}
+    registos = [(enc_id, inicio, ref) for enc_id, ref in referencias.items()]
+    registos += [(enc_id, fim, ref) for enc_id, ref in referencias.items()]
+    if registos:
+        db.escritor_log.registar(registos)
+
+    if db.cache is not None:
+        for enc_id in referencias:
+            db.cache.invalidar(enc_id)
+    return moradas_afetadas, len(moradas), len(qtds), linhas_afetadas, len(referencias)
+
+
+def editar_em_massa(db, edicoes, tamanho_lote: int = 500, invalidas: list = None):
+    """
+    Aplica um iterável de edições (ver ler_edicoes) por lotes de tamanho_lote encomendas.
+    invalidas: a lista passada a ler_edicoes, para o relatório incluir as linhas saltadas.
+    Devolve um relatório com contagens, lotes falhados e débito (encomendas/s).
+    """
+    politica = db.politica_repeticao
+    relatorio = {'lotes': 0, 'lotes_falhados': 0, 'repeticoes': 0, 'encomendas': 0, 'encomendas_mudadas': 0,
+                 'moradas_pedidas': 0, 'moradas_afetadas': 0, 'linhas_pedidas': 0, 'linhas_afetadas': 0,
+                 'erros': []}
+    inicio = time.perf_counter()
+
+    for numero, lote in enumerate(agrupar_em_lotes(edicoes, tamanho_lote), start=1):
+        resultado = None
+        inicio_lote = time.monotonic()
+        tentativa = 1
+        while True:
+            politica.estatisticas['tentativas'] += 1
+            try:
+                resultado = _aplicar_lote(db, lote)
+                break
+            except db.Erro as ex:
+                if politica.deve_repetir(ex, tentativa, inicio_lote):
+                    relatorio['repeticoes'] += 1
+                    tentativa += 1
+                    continue
+                db.rastreio.mensagem(f"❌ Lote {numero} revertido (ROLLBACK): {ex}", 'erro')
+                relatorio['lotes_falhados'] += 1
+                relatorio['erros'].append({'lote': numero, 'enc_ids': [min(lote), max(lote)], 'erro': str(ex)})
+                break
+
+        relatorio['lotes'] += 1
+        if resultado is None:
+            continue
+        moradas_afetadas, moradas, linhas, linhas_afetadas, mudadas = resultado
+        relatorio['encomendas'] += len(lote)
+        relatorio['encomendas_mudadas'] += mudadas
+        relatorio['moradas_pedidas'] += moradas
+        relatorio['moradas_afetadas'] += moradas_afetadas
+        relatorio['linhas_pedidas'] += linhas
+        relatorio['linhas_afetadas'] += linhas_afetadas
+        if moradas_afetadas != moradas or linhas_afetadas != linhas:
+            db.rastreio.mensagem(f"⚠️ Lote {numero}: {moradas_afetadas}/{moradas} moradas e "
+                                 f"{linhas_afetadas}/{linhas} linhas afetadas (EncIds/produtos inexistentes).", 'aviso')
+
+    # Lidas à medida que as edições foram consumidas: aqui já estão todas
+    relatorio['invalidas'] = list(invalidas or [])
+    duracao = time.perf_counter() - inicio
+    relatorio['duracao_seg'] = round(duracao, 3)
+    relatorio['encomendas_por_seg'] = round(relatorio['encomendas'] / duracao, 1) if duracao else 0.0
+    return relatorio
+
+
+# --- Linha de comandos ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("ficheiro", help="edições em .csv, .json ou .jsonl")
+    parser.add_argument("--server", default="192.168.100.14,1433")
+    parser.add_argument("--database", default="SGBD_PL1_02")
+    parser.add_argument("--user", default="User_SGBD_PL1_02")
+    parser.add_argument("--bd-local", help="usar a BD local de testes (ficheiro SQLite) em vez do SQL Server")
+    parser.add_argument("--isolamento", default="READ COMMITTED")
+    parser.add_argument("--tamanho-lote", type=int, default=500, help="encomendas por transação")
+    parser.add_argument("--max-tentativas", type=int, default=4, help="tentativas por lote (deadlock / timeout de bloqueio)")
+    parser.add_argument("--lock-timeout-ms", type=int, default=5000, help="SET LOCK_TIMEOUT de cada lote")
+    parser.add_argument("--relatorio", help="guardar o relatório em JSON neste ficheiro")
+    args = parser.parse_args(argv)
+
+    db = DbConnectionEdit()
+    if args.bd_local:
+        backend = BackendSQLite(args.bd_local)
+    else:
+        password = os.environ.get("SGBD_PASSWORD") or getpass.getpass(f"Password de {args.user}: ")
+        backend = BackendSqlServer(args.server, args.database, args.user, password, driver=db.DRIVER)
+    ligado = db.ligar(backend)
+    if not ligado or not db.set_isolation(args.isolamento):
+        return 1
+    db.politica_repeticao.max_tentativas = args.max_tentativas
+    db.politica_repeticao.lock_timeout_ms = args.lock_timeout_ms
+
+    invalidas = []
+    relatorio = editar_em_massa(db, ler_edicoes(args.ficheiro, invalidas), args.tamanho_lote, invalidas)
+    db.fechar() # Escreve os registos de log que ainda estão na fila
+
+    db.rastreio.mensagem(f"\n--- RESUMO ---\n"
+                         f"Encomendas: {relatorio['encomendas']} em {relatorio['lotes']} lotes, "
+                         f"{relatorio['encomendas_mudadas']} mudadas "
+                         f"({relatorio['lotes_falhados']} falhados, {relatorio['repeticoes']} repetições por contenção)\n"
+                         f"Moradas: {relatorio['moradas_afetadas']}/{relatorio['moradas_pedidas']} | "
+                         f"Linhas: {relatorio['linhas_afetadas']}/{relatorio['linhas_pedidas']}\n"
+                         f"Duração: {relatorio['duracao_seg']} s | Débito: {relatorio['encomendas_por_seg']} encomendas/s")
+    for invalida in relatorio['invalidas']:
+        posicao = f"linha {invalida['linha']}" if 'linha' in invalida else f"registo {invalida['registo']}"
+        db.rastreio.mensagem(f"⚠️ {posicao} ignorada: {invalida['erro']}", 'aviso')
+    if args.relatorio:
+        with open(args.relatorio, "w", encoding="utf-8") as ficheiro:
+            json.dump(relatorio, ficheiro, indent=2, ensure_ascii=False)
+    return 0 if relatorio['lotes_falhados'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Cache de leitura (read-through) das encomendas para a Aplicação Edit.
+
+Guarda o cabeçalho e as linhas de cada EncId numa LRU limitada em tamanho e em
+tempo (TTL). Uma entrada guardada não é devolvida às cegas: a versão (SHA-256
+do cabeçalho e das linhas, calculado no servidor) é comparada primeiro, o que
+custa uma ida à BD pequena em vez de voltar a ler a encomenda inteira.
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from db_sql_edit import versao_sql, versao_agregada_sql
+
+
+CabecalhoEncomenda = namedtuple("CabecalhoEncomenda", "Nome Morada")
+LinhaEncomenda = namedtuple("LinhaEncomenda", "Produtold Designacao Preco Qtd")
+
+# Versão da encomenda calculada no servidor: um par de hashes (cabeçalho, todas as linhas)
+VERSAO_CABECALHO_SQL = versao_sql("Nome", "Morada")
+VERSAO_LINHAS_SQL = versao_agregada_sql(("Produtold", "Designacao", "Preco", "Qtd"), "Produtold")
+VERSAO_ENCOMENDA_SQL = (
+    f"SELECT (SELECT {VERSAO_CABECALHO_SQL} FROM Encomenda WHERE EncId = ?) AS VersaoEnc, "
+    f"(SELECT {VERSAO_LINHAS_SQL} FROM EncLinha WHERE EncId = ?) AS VersaoLinhas"
+)
+
+
+class _EntradaCache:
+
+    def __init__(self, header, linhas, versao):
+        self.header = header
+        self.linhas = linhas
+        self.versao = versao
+        self.guardada_em = time.monotonic()
+        self.validada_em = self.guardada_em
+
+
+class CacheEncomendasEdit:
+
+    def __init__(self, max_encomendas: int = 256, ttl_seg: float = 300.0, intervalo_validacao_seg: float = 1.0):
+        self.max_encomendas = max_encomendas
+        self.ttl_seg = ttl_seg
+        # Entradas validadas há menos tempo do que isto são devolvidas sem ir à BD
+        self.intervalo_validacao_seg = intervalo_validacao_seg
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        # pre_carga_*: procuras do pré-carregamento, à parte para não baixarem a taxa de acerto das leituras
+        self.estatisticas = {'hits': 0, 'misses': 0, 'validacoes': 0, 'desatualizadas': 0,
+                             'evicoes_lru': 0, 'evicoes_ttl': 0, 'invalidacoes': 0,
+                             'pre_carga_hits': 0, 'pre_carga_misses': 0}
+
+    @staticmethod
+    def converter(header, linhas):
+        """ Converte as linhas do driver em tuplos leves e imutáveis. """
+        return (CabecalhoEncomenda(header.Nome, header.Morada),
+                [LinhaEncomenda(l.Produtold, l.Designacao, l.Preco, l.Qtd) for l in linhas])
+
+    def procurar(self, enc_id: int, pre_carga: bool = False):
+        """
+        Devolve (entrada, precisa_validar) ou (None, False) se não existir/expirou.
+        Se precisa_validar, chamar confirmar() ou invalidar() depois do probe.
+        pre_carga=True: a procura conta em pre_carga_hits/pre_carga_misses.
+        """
+        hits, misses = ('pre_carga_hits', 'pre_carga_misses') if pre_carga else ('hits', 'misses')
+        with self._lock:
+            entrada = self._entradas.get(enc_id)
+            if entrada is None:
+                self.estatisticas[misses] += 1
+                return None, False
+            agora = time.monotonic()
+            if agora - entrada.guardada_em > self.ttl_seg:
+                del self._entradas[enc_id]
+                self.estatisticas['evicoes_ttl'] += 1
+                self.estatisticas[misses] += 1
+                return None, False
+            self._entradas.move_to_end(enc_id)
+            precisa_validar = agora - entrada.validada_em > self.intervalo_validacao_seg
+            if not precisa_validar:
+                self.estatisticas[hits] += 1
+            return entrada, precisa_validar
+
+    def confirmar(self, enc_id: int, versao):
+        """ Resultado do probe: True (e conta um hit) se a versão guardada ainda é a atual. """
+        with self._lock:
+            self.estatisticas['validacoes'] += 1
+            entrada = self._entradas.get(enc_id)
+            if entrada is not None and entrada.versao == versao:
+                entrada.validada_em = time.monotonic()
+                self.estatisticas['hits'] += 1
+                return True
+            if entrada is not None:
+                del self._entradas[enc_id]
+            self.estatisticas['desatualizadas'] += 1
+            self.estatisticas['misses'] += 1
+            return False
+
+    def guardar(self, enc_id: int, header, linhas, versao):
+        with self._lock:
+            self._entradas[enc_id] = _EntradaCache(header, linhas, versao)
+            self._entradas.move_to_end(enc_id)
+            while len(self._entradas) > self.max_encomendas:
+                self._entradas.popitem(last=False)
+                self.estatisticas['evicoes_lru'] += 1
+
+    def aplicar_edicao(self, enc_id: int, nova_morada: str, novas_qtds: dict, versao):
+        """
+        Atualiza a entrada com uma edição nossa já confirmada (COMMIT), para que o
+        recarregamento a seguir não precise de ir à BD. novas_qtds: {Produtold: Qtd}.
+        nova_morada=None: o cabeçalho não foi alterado.
+        """
+        with self._lock:
+            entrada = self._entradas.get(enc_id)
+            if entrada is None:
+                return
+            if nova_morada is not None:
+                entrada.header = entrada.header._replace(Morada=nova_morada)
+            entrada.linhas = [l._replace(Qtd=novas_qtds[l.Produtold]) if l.Produtold in novas_qtds else l
+                              for l in entrada.linhas]
+            entrada.versao = versao
+            entrada.validada_em = time.monotonic()
+
+    def invalidar(self, enc_id: int = None):
+        """ Remove uma encomenda (ou todas, se enc_id for None). """
+        with self._lock:
+            if enc_id is None:
+                self.estatisticas['invalidacoes'] += len(self._entradas)
+                self._entradas.clear()
+            elif self._entradas.pop(enc_id, None) is not None:
+                self.estatisticas['invalidacoes'] += 1
+
+    def __contains__(self, enc_id):
+        return enc_id in self._entradas
+
+    def __len__(self):
+        return len(self._entradas)
@@ -0,0 +1,131 @@
+"""
+Registo de instruções preparadas do motor da Aplicação Edit.
+
+O pyodbc só prepara uma instrução de novo quando o SQL do cursor muda; um
+cursor novo por leitura/edição obriga a preparar tudo outra vez. O registo
+guarda, por conexão do pool, um cursor por texto de SQL, por isso a mesma
+instrução executada na mesma conexão usa sempre o handle já preparado.
+
+Os parâmetros levam tipos explícitos (setinputsizes): sem eles o driver declara
+uma string como nvarchar(len(valor)) e o SQL Server compila um plano por cada
+comprimento de nova_morada. Com TEXTO a declaração é sempre nvarchar(4000).
+
+As estatísticas contam as preparações feitas/evitadas e as assinaturas (SQL +
+declaração dos parâmetros) distintas e repetidas vistas pelo cliente. Uma
+assinatura nova é uma compilação possível no servidor, não um plano medido: a
+reutilização real de planos só se vê no SQL Server (sys.dm_exec_cached_plans).
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+# Códigos de tipo ODBC (sql.h / sqlext.h), os mesmos que pyodbc.SQL_*: sem importar o pyodbc aqui
+SQL_INTEGER, SQL_VARCHAR, SQL_WVARCHAR, SQL_VARBINARY = 4, 12, -9, -3
+
+# Tipos para setinputsizes: (tipo SQL, tamanho, casas decimais)
+INTEIRO = (SQL_INTEGER, 0, 0)
+TEXTO = (SQL_WVARCHAR, 4000, 0)
+TEXTO_CURTO = (SQL_VARCHAR, 128, 0)
+BINARIO = (SQL_VARBINARY, 32, 0) # Versões SHA-256 do modo otimista
+
+
+def _declaracao(valor):
+    """ Como o driver declara um parâmetro sem tipo explícito. """
+    if isinstance(valor, str):
+        return ('nvarchar', len(valor))
+    return (type(valor).__name__,)
+
+
+class RegistoInstrucoes:
+
+    def __init__(self, reutilizar: bool = True, usar_tipos: bool = True, max_por_conexao: int = 32):
+        # reutilizar=False / usar_tipos=False: cursor novo por execução / tipos inferidos pelo driver
+        # (o comportamento antigo, para comparar nos benchmarks)
+        self.reutilizar = reutilizar
+        self.usar_tipos = usar_tipos
+        # Os lotes VALUES têm um texto por tamanho: os menos usados saem (LRU)
+        self.max_por_conexao = max_por_conexao
+        self._cursores = {} # id(conexão) -> OrderedDict(sql -> cursor)
+        self._assinaturas = set()
+        self._lock = threading.Lock()
+        self.estatisticas = {'execucoes': 0, 'preparacoes': 0, 'preparacoes_evitadas': 0,
+                             'assinaturas': 0, 'assinaturas_repetidas': 0}
+
+    @contextmanager
+    def executar(self, conexao, sql: str, params=(), tipos=None):
+        """
+        with registo.executar(conn, sql, [a, b], [INTEIRO, TEXTO]) as cursor: ...
+        Ao sair, os result sets por ler são descartados (o cursor volta ao registo
+        livre) mas a transação continua aberta: COMMIT/ROLLBACK é de quem chama.
+        """
+        tipos = tipos if self.usar_tipos else None
+        cursor = self._cursor(conexao, sql, tipos)
+        self._contar_assinatura(sql, params, tipos)
+        try:
+            cursor.execute(sql, *params)
+            yield cursor
+            if self.reutilizar:
+                while cursor.nextset():
+                    pass
+        finally:
+            if not self.reutilizar:
+                cursor.close()
+
+    def esquecer(self, conexao):
+        """ Fecha os cursores de uma conexão que saiu do pool. """
+        with self._lock:
+            cursores = self._cursores.pop(id(conexao), {})
+        for cursor in cursores.values():
+            self._fechar(cursor)
+
+    def limpar(self):
+        with self._lock:
+            todos, self._cursores = list(self._cursores.values()), {}
+            self._assinaturas.clear()
+        for cursores in todos:
+            for cursor in cursores.values():
+                self._fechar(cursor)
+
+    # --- Auxiliares ---
+    def _cursor(self, conexao, sql: str, tipos):
+        cursor = None
+        despejado = None
+        with self._lock:
+            self.estatisticas['execucoes'] += 1
+            if self.reutilizar:
+                cursores = self._cursores.setdefault(id(conexao), OrderedDict())
+                cursor = cursores.get(sql)
+                if cursor is not None:
+                    cursores.move_to_end(sql)
+                    self.estatisticas['preparacoes_evitadas'] += 1
+                    return cursor
+                if len(cursores) >= self.max_por_conexao:
+                    _, despejado = cursores.popitem(last=False)
+            self.estatisticas['preparacoes'] += 1
+
+        if despejado is not None:
+            self._fechar(despejado)
+        cursor = conexao.cursor()
+        if tipos:
+            cursor.setinputsizes(list(tipos))
+        if self.reutilizar:
+            with self._lock:
+                self._cursores.setdefault(id(conexao), OrderedDict())[sql] = cursor
+        return cursor
+
+    def _contar_assinatura(self, sql: str, params, tipos):
+        assinatura = (sql, tuple(tipos) if tipos else tuple(_declaracao(p) for p in params))
+        with self._lock:
+            if assinatura in self._assinaturas:
+                self.estatisticas['assinaturas_repetidas'] += 1
+            else:
+                self._assinaturas.add(assinatura)
+                self.estatisticas['assinaturas'] += 1
+
+    @staticmethod
+    def _fechar(cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
@@ -0,0 +1,508 @@
+"""
+Base de dados LOCAL de substituição (stand-in) para testes sem SQL Server.
+
+Imita a parte da interface pyodbc usada pelo motor (connect, cursor, execute,
+fetchone/fetchall, nextset, commit/rollback) sobre sqlite3, e aceita o
+subconjunto de T-SQL que a aplicação envia. Permite simular a latência de rede
+e quedas de ligação para testar o pool e os benchmarks offline.
+
+O SQLite não tem níveis de isolamento nem bloqueios partilhados, por isso as
+conexões ao mesmo ficheiro partilham um gestor de bloqueios (ao nível da BD)
+que imita o comportamento do SQL Server sem RCSI:
+  - escritas: bloqueio exclusivo até ao COMMIT/ROLLBACK;
+  - leituras em READ COMMITTED: bloqueio partilhado só durante a instrução;
+  - leituras em REPEATABLE READ / SERIALIZABLE: partilhado até ao fim da transação;
+  - leituras em READ UNCOMMITTED / SNAPSHOT: sem bloqueios.
+SET LOCK_TIMEOUT é respeitado (erro 1222) e duas transações que tentem passar
+de partilhado a exclusivo ao mesmo tempo dão deadlock (erro 1205).
+Cada conexão tem um número de sessão e CONTEXT_INFO, e o gestor diz quem tem e
+quem espera bloqueios, para a instrumentação (db_bloqueios_edit) funcionar offline.
+Os erros são as classes Error/OperationalError/ProgrammingError deste módulo, com
+os mesmos args (SQLSTATE, mensagem) do pyodbc: corre sem pyodbc nem unixODBC.
+"""
+import hashlib
+import itertools
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+
+class Error(Exception):
+    """ Erro da BD local; args = (SQLSTATE, mensagem), como o pyodbc.Error. """
+
+
+class OperationalError(Error):
+    pass
+
+
+class ProgrammingError(Error):
+    pass
+
+
+ESQUEMA_SQL = [
+    "CREATE TABLE IF NOT EXISTS Encomenda (EncId INTEGER PRIMARY KEY, Nome TEXT, Morada TEXT)",
+    "CREATE TABLE IF NOT EXISTS EncLinha (EncId INTEGER NOT NULL, Produtold INTEGER NOT NULL, "
+    "Designacao TEXT, Preco REAL, Qtd INTEGER, PRIMARY KEY (EncId, Produtold))",
+    "CREATE TABLE IF NOT EXISTS LogOperations (NumReg INTEGER PRIMARY KEY AUTOINCREMENT, EventType TEXT, "
+    "Objecto TEXT, Valor TEXT, Referencia TEXT, DCriacao TEXT)",
+]
+
+# "(VALUES (?, ?), ...) AS v(a, b)" -> o SQLite não aceita nomes de colunas no alias
+_VALUES_COM_ALIAS = re.compile(r"\(VALUES (.+?)\) AS (\w+)\(([^)]*)\)", re.IGNORECASE | re.DOTALL)
+# "OFFSET n ROWS FETCH NEXT m ROWS ONLY" -> "LIMIT n, m" (n e m literais ou '?': os parâmetros mantêm a ordem)
+_OFFSET_FETCH = re.compile(r"OFFSET (\S+) ROWS FETCH NEXT (\S+) ROWS ONLY", re.IGNORECASE)
+# "#Tabela" (temporária da sessão) -> "temp.Tabela" (também só visível nesta conexão SQLite)
+_TABELA_TEMPORARIA = re.compile(r"#(\w+)")
+# "STRING_AGG(x, sep) WITHIN GROUP (ORDER BY c)" -> "STRING_AGG(x, sep, c)" (agregado local com ordem)
+_STRING_AGG_ORDENADO = re.compile(r"STRING_AGG\((.+?), (NCHAR\(\d+\))\) WITHIN GROUP \(ORDER BY ([\w.]+)\)",
+                                  re.IGNORECASE)
+
+
+def _traduzir_values(sql: str):
+    def _substituir(m):
+        colunas = [c.strip() for c in m.group(3).split(",")]
+        select = ", ".join(f"column{i} AS {c}" for i, c in enumerate(colunas, start=1))
+        return f"(SELECT {select} FROM (VALUES {m.group(1)})) AS {m.group(2)}"
+    return _VALUES_COM_ALIAS.sub(_substituir, sql)
+
+
+def _traduzir(sql: str):
+    """ T-SQL enviado pela aplicação -> SQL aceite pelo SQLite. """
+    sql = _TABELA_TEMPORARIA.sub(r"temp.\1", sql)
+    sql = _STRING_AGG_ORDENADO.sub(r"STRING_AGG(\1, \2, \3)", sql).replace("nvarchar(max)", "TEXT")
+    return _OFFSET_FETCH.sub(r"LIMIT \1, \2", _traduzir_values(sql))
+
+
+def _hashbytes(algoritmo, valor):
+    """ Equivalente local do HASHBYTES('SHA2_256', ...) do SQL Server (texto em UTF-16, como nvarchar). """
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        valor = valor.encode("utf-16-le")
+    return hashlib.new(algoritmo.replace("SHA2_", "sha").lower(), valor).digest()
+
+
+def _concat(*valores):
+    """ CONCAT do SQL Server: NULL conta como texto vazio. """
+    return "".join("" if valor is None else str(valor) for valor in valores)
+
+
+def _datalength(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        return len(valor.encode("utf-16-le"))
+    return len(valor) if isinstance(valor, bytes) else 8
+
+
+class _StringAggOrdenado:
+    """ STRING_AGG(valor, separador) WITHIN GROUP (ORDER BY ordem), depois de traduzido para 3 argumentos. """
+
+    def __init__(self):
+        self.valores = []
+        self.separador = ""
+
+    def step(self, valor, separador, ordem):
+        self.separador = separador
+        if valor is not None:
+            self.valores.append((ordem, valor))
+
+    def finalize(self):
+        if not self.valores:
+            return None
+        return self.separador.join(valor for _, valor in sorted(self.valores, key=lambda par: par[0]))
+
+
+def _erro_odbc(ex: Exception):
+    """ Converte um erro sqlite3 num Error com SQLSTATE equivalente. """
+    mensagem = str(ex)
+    if "locked" in mensagem or "busy" in mensagem:
+        return Error("HYT00", f"[HYT00] Lock request time out period exceeded. (1222) [{mensagem}]")
+    return Error("HY000", f"[HY000] {mensagem}")
+
+
+class _GestorBloqueios:
+    """ Bloqueio leitores/escritor partilhado pelas conexões ao mesmo ficheiro. """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._partilhados = set()
+        self._exclusivo = None
+        self._a_promover = set()
+        self._a_esperar = {} # dono -> (modo 'S'/'X', desde)
+
+    def adquirir(self, dono, exclusivo: bool, timeout_seg: float):
+        """ Devolve o tempo (s) que esperou (0 se não esperou). Lança Error 1222 (timeout) ou 1205 (deadlock). """
+        inicio = time.monotonic()
+        with self._cond:
+            try:
+                while True:
+                    livre = self._exclusivo in (None, dono)
+                    if exclusivo:
+                        livre = livre and not (self._partilhados - {dono})
+                    if livre:
+                        if exclusivo:
+                            self._exclusivo = dono
+                        else:
+                            self._partilhados.add(dono)
+                        return time.monotonic() - inicio if dono in self._a_esperar else 0.0
+
+                    if exclusivo and dono in self._partilhados:
+                        if self._a_promover - {dono}:
+                            raise Error("40001", "[40001] Transaction was deadlocked on lock resources "
+                                                        "with another process and has been chosen as the deadlock "
+                                                        "victim. Rerun the transaction. (1205)")
+                        self._a_promover.add(dono)
+
+                    restante = inicio + timeout_seg - time.monotonic()
+                    if restante <= 0:
+                        raise Error("HYT00", "[HYT00] Lock request time out period exceeded. (1222)")
+                    self._a_esperar.setdefault(dono, ("X" if exclusivo else "S", inicio))
+                    self._cond.wait(restante)
+            finally:
+                self._a_promover.discard(dono)
+                self._a_esperar.pop(dono, None)
+
+    def estado(self, dono):
+        """ (modos que tem, (modo, desde, quem bloqueia) ou None se não está à espera). """
+        with self._cond:
+            tem = (["X"] if self._exclusivo is dono else []) + (["S"] if dono in self._partilhados else [])
+            espera = self._a_esperar.get(dono)
+            if espera is None:
+                return tem, None
+            bloqueadores = {self._exclusivo} - {None, dono}
+            if espera[0] == "X":
+                bloqueadores |= self._partilhados - {dono}
+            return tem, (espera[0], espera[1], bloqueadores)
+
+    def libertar_partilhado(self, dono):
+        with self._cond:
+            self._partilhados.discard(dono)
+            self._cond.notify_all()
+
+    def libertar(self, dono):
+        with self._cond:
+            self._partilhados.discard(dono)
+            if self._exclusivo is dono:
+                self._exclusivo = None
+            self._cond.notify_all()
+
+
+_gestores_bloqueios = {}
+_lock_gestores = threading.Lock()
+_sessoes = itertools.count(51) # Números de sessão como os do SQL Server (@@SPID)
+
+
+def _gestor_bloqueios(caminho: str):
+    with _lock_gestores:
+        return _gestores_bloqueios.setdefault(os.path.abspath(caminho), _GestorBloqueios())
+
+
+class CursorLocal:
+    """ Cursor ao estilo pyodbc: execute(sql, *params), linhas com acesso por atributo. """
+
+    def __init__(self, conexao):
+        self._conexao = conexao
+        self._resultados = []
+        self._atual = None
+        self.arraysize = 1
+        self.fast_executemany = False
+        self.tamanhos_entrada = None
+        self._ultimo_sql = None
+
+    # --- Execução ---
+    def execute(self, sql: str, *params):
+        self._conexao._verificar()
+        if self._conexao._erros_injetados:
+            raise self._conexao._erros_injetados.pop(0)
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        params = [self._converter(p) for p in params]
+        # Como o pyodbc: o mesmo SQL no mesmo cursor não volta a ser preparado
+        if sql != self._ultimo_sql:
+            self._conexao.preparacoes += 1
+            self._ultimo_sql = sql
+
+        self._resultados = []
+        for instrucao in [i.strip() for i in sql.split(";") if i.strip()]:
+            n = instrucao.count("?")
+            params_instrucao, params = params[:n], params[n:]
+            self._executar_instrucao(instrucao, params_instrucao)
+
+        self._conexao._simular_latencia()
+        self._atual = self._resultados.pop(0) if self._resultados else None
+        return self
+
+    def executemany(self, sql: str, seq_params):
+        self._conexao._verificar()
+        self._conexao._bloquear(exclusivo=True)
+        try:
+            cursor = self._conexao._sqlite.executemany(
+                _traduzir(sql), [[self._converter(p) for p in linha] for linha in seq_params])
+        except sqlite3.Error as ex:
+            raise _erro_odbc(ex) from ex
+        self._conexao._simular_latencia()
+        self._resultados = []
+        self._atual = cursor
+
+    def setinputsizes(self, tamanhos):
+        # O SQLite não declara tipos de parâmetros; guardado só para inspeção
+        self.tamanhos_entrada = tamanhos
+
+    def _executar_instrucao(self, instrucao: str, params):
+        palavras = instrucao.split()
+        comando = palavras[0].upper()
+        # SET TRANSACTION ISOLATION LEVEL / SET LOCK_TIMEOUT / ... não existem no SQLite
+        if comando == "SET":
+            self._conexao.definicoes_sessao.append(instrucao)
+            self._conexao._aplicar_set(palavras)
+            return
+        # DECLARE @v tipo = CAST(? AS tipo): só o valor do parâmetro interessa (ex: SET CONTEXT_INFO @v)
+        if comando == "DECLARE":
+            self._conexao._variaveis[palavras[1]] = params[0] if params else None
+            return
+        if comando in ("BEGIN", "COMMIT", "ROLLBACK") and len(palavras) > 1 and palavras[1].upper().startswith("TRAN"):
+            if comando != "BEGIN":
+                # Dentro do batch: a ida à BD já conta no execute
+                self._conexao._terminar(comando == "COMMIT")
+            return
+        leitura = comando in ("SELECT", "WITH")
+        if leitura and " FROM " in instrucao.upper():
+            self._conexao._bloquear(exclusivo=False)
+        elif not leitura:
+            self._conexao._bloquear(exclusivo=True)
+        try:
+            self._resultados.append(self._conexao._sqlite.execute(_traduzir(instrucao), params))
+        except sqlite3.Error as ex:
+            raise _erro_odbc(ex) from ex
+        finally:
+            if leitura and self._conexao.isolamento == "READ COMMITTED":
+                self._conexao._bloqueios.libertar_partilhado(self._conexao)
+
+    @staticmethod
+    def _converter(valor):
+        if isinstance(valor, datetime):
+            return valor.isoformat(sep=" ")
+        if isinstance(valor, Decimal):
+            return str(valor) # O sqlite3 não aceita Decimal; a coluna NUMERIC/REAL converte o texto
+        return valor
+
+    # --- Resultados ---
+    @property
+    def description(self):
+        return self._atual.description if self._atual is not None else None
+
+    @property
+    def rowcount(self):
+        if self._atual is None or self._atual.description is not None:
+            return -1
+        return self._atual.rowcount
+
+    def _linha(self, valores):
+        nomes = tuple(d[0] for d in self._atual.description)
+        classe = self._conexao._classes_linha.get(nomes)
+        if classe is None:
+            classe = namedtuple("Row", nomes, rename=True)
+            self._conexao._classes_linha[nomes] = classe
+        return classe(*valores)
+
+    def fetchone(self):
+        if self._atual is None or self._atual.description is None:
+            raise ProgrammingError("No results.  Previous SQL was not a query.")
+        valores = self._atual.fetchone()
+        return self._linha(valores) if valores is not None else None
+
+    def fetchmany(self, tamanho: int = None):
+        if self._atual is None or self._atual.description is None:
+            raise ProgrammingError("No results.  Previous SQL was not a query.")
+        return [self._linha(v) for v in self._atual.fetchmany(tamanho or self.arraysize)]
+
+    def fetchall(self):
+        if self._atual is None or self._atual.description is None:
+            raise ProgrammingError("No results.  Previous SQL was not a query.")
+        return [self._linha(v) for v in self._atual.fetchall()]
+
+    def nextset(self):
+        if not self._resultados:
+            self._atual = None
+            return False
+        self._atual = self._resultados.pop(0)
+        return True
+
+    def cancel(self):
+        self._conexao._sqlite.interrupt()
+
+    def close(self):
+        self._resultados = []
+        self._atual = None
+
+    # Tal como no pyodbc, sair do bloco 'with' sem erro faz COMMIT
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traceback):
+        if tipo is None:
+            self._conexao.commit()
+        self.close()
+
+
+class ConexaoLocal:
+    """ Conexão ao estilo pyodbc (autocommit=False) sobre um ficheiro SQLite. """
+
+    def __init__(self, caminho: str, latencia_seg: float = 0.0, timeout_bloqueio_seg: float = 5.0):
+        self._sqlite = sqlite3.connect(caminho, timeout=timeout_bloqueio_seg, check_same_thread=False)
+        self._sqlite.execute("PRAGMA journal_mode=WAL")
+        self._sqlite.create_function("GETDATE", 0, lambda: datetime.now().isoformat(sep=" "))
+        self._sqlite.create_function("HASHBYTES", 2, _hashbytes, deterministic=True)
+        self._sqlite.create_function("CONCAT", -1, _concat, deterministic=True)
+        self._sqlite.create_function("DATALENGTH", 1, _datalength, deterministic=True)
+        self._sqlite.create_function("NCHAR", 1, chr, deterministic=True)
+        self._sqlite.create_aggregate("STRING_AGG", 3, _StringAggOrdenado)
+        self._classes_linha = {}
+        self.latencia_seg = latencia_seg
+        self.definicoes_sessao = []
+        self.idas_a_bd = 0
+        self.preparacoes = 0 # Execuções com SQL diferente do anterior no mesmo cursor
+        self._em_baixo = False
+        self._fechada = False
+        self._erros_injetados = []
+        # Emulação de isolamento / bloqueios (ver docstring do módulo)
+        self._bloqueios = _gestor_bloqueios(caminho)
+        self.isolamento = "READ COMMITTED"
+        self.timeout_bloqueio_seg = timeout_bloqueio_seg
+        self._lock_timeout_seg = timeout_bloqueio_seg
+        self.tempo_bloqueado_seg = 0.0 # Tempo total à espera de bloqueios
+        self.esperas_bloqueio = {'LCK_M_S': [0, 0.0], 'LCK_M_X': [0, 0.0]} # [nº esperas, segundos]
+        self.sessao_id = next(_sessoes)
+        self.context_info = b""
+        self._variaveis = {}
+
+    def _verificar(self):
+        if self._fechada:
+            raise ProgrammingError("Attempt to use a closed connection.")
+        if self._em_baixo:
+            raise OperationalError("08S01", "[08S01] Communication link failure")
+
+    def _simular_latencia(self):
+        self.idas_a_bd += 1
+        if self.latencia_seg:
+            time.sleep(self.latencia_seg)
+
+    def _aplicar_set(self, palavras: list):
+        texto = " ".join(palavras[1:]).upper()
+        if texto.startswith("TRANSACTION ISOLATION LEVEL "):
+            self.isolamento = texto[len("TRANSACTION ISOLATION LEVEL "):]
+        elif texto.startswith("LOCK_TIMEOUT "):
+            milissegundos = int(palavras[2])
+            # -1 (esperar sempre) fica limitado ao timeout da conexão para os testes não pendurarem
+            self._lock_timeout_seg = self.timeout_bloqueio_seg if milissegundos < 0 else milissegundos / 1000
+        elif texto.startswith("CONTEXT_INFO "):
+            valor = palavras[2]
+            if valor.startswith("@"):
+                valor = self._variaveis.get(valor) or ""
+                self.context_info = valor.encode() if isinstance(valor, str) else bytes(valor)
+            else:
+                self.context_info = bytes.fromhex(valor[2:])
+
+    def _bloquear(self, exclusivo: bool):
+        if not exclusivo and self.isolamento in ("READ UNCOMMITTED", "SNAPSHOT"):
+            return
+        esperou = self._bloqueios.adquirir(self, exclusivo, self._lock_timeout_seg)
+        if esperou:
+            self.tempo_bloqueado_seg += esperou
+            contagem = self.esperas_bloqueio['LCK_M_X' if exclusivo else 'LCK_M_S']
+            contagem[0] += 1
+            contagem[1] += esperou
+
+    @property
+    def fechada(self):
+        return self._fechada
+
+    def estado_bloqueios(self):
+        """ Para a instrumentação: (modos que tem, espera atual ou None). """
+        return self._bloqueios.estado(self)
+
+    def injetar_erro(self, erro: Exception, vezes: int = 1):
+        """ As próximas 'vezes' execuções falham com este erro (ex: deadlock 1205). """
+        self._erros_injetados.extend([erro] * vezes)
+
+    def simular_queda(self):
+        """ A partir daqui todas as operações falham como uma ligação TCP perdida. """
+        self._em_baixo = True
+
+    def cursor(self):
+        self._verificar()
+        return CursorLocal(self)
+
+    def execute(self, sql: str, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        self._verificar()
+        self._terminar(True)
+        self._simular_latencia()
+
+    def rollback(self):
+        self._verificar()
+        self._terminar(False)
+        self._simular_latencia()
+
+    def _terminar(self, confirmar: bool):
+        try:
+            if confirmar:
+                self._sqlite.commit()
+            else:
+                self._sqlite.rollback()
+        finally:
+            self._bloqueios.libertar(self)
+
+    def close(self):
+        if not self._fechada:
+            self._fechada = True
+            self._bloqueios.libertar(self)
+            self._sqlite.close()
+
+
+def ligar(caminho: str, latencia_seg: float = 0.0):
+    """ Equivalente a pyodbc.connect(..., autocommit=False) para a BD local. """
+    return ConexaoLocal(caminho, latencia_seg=latencia_seg)
+
+
+def criar_bd_local(caminho: str = None, n_encomendas: int = 10, linhas_por_encomenda: int = 5):
+    """
+    Cria (se necessário) o esquema Encomenda/EncLinha/LogOperations num ficheiro
+    SQLite e semeia dados sintéticos. Devolve o caminho do ficheiro.
+    As linhas são geradas dentro do SQLite (INSERT ... SELECT sobre uma sequência),
+    por isso milhões de linhas demoram segundos e não passam pela memória do Python.
+    """
+    if caminho is None:
+        descritor, caminho = tempfile.mkstemp(prefix="bd_edit_", suffix=".sqlite")
+        os.close(descritor)
+
+    conn = sqlite3.connect(caminho)
+    try:
+        # Só durante a carga: sem fsync por página (um ficheiro de testes pode sempre ser recriado)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        for instrucao in ESQUEMA_SQL:
+            conn.execute(instrucao)
+        conn.execute(
+            "WITH RECURSIVE enc(id) AS (SELECT 1 UNION ALL SELECT id + 1 FROM enc WHERE id < ?) "
+            "INSERT OR IGNORE INTO Encomenda (EncId, Nome, Morada) "
+            "SELECT id, 'Cliente ' || id, 'Rua ' || id || ', Covilhã' FROM enc", (n_encomendas,))
+        conn.execute(
+            "WITH RECURSIVE enc(id) AS (SELECT 1 UNION ALL SELECT id + 1 FROM enc WHERE id < ?), "
+            "prod(id) AS (SELECT 1 UNION ALL SELECT id + 1 FROM prod WHERE id < ?) "
+            "INSERT OR IGNORE INTO EncLinha (EncId, Produtold, Designacao, Preco, Qtd) "
+            "SELECT enc.id, prod.id, 'Produto ' || prod.id, ROUND(1.5 * prod.id, 2), 1 FROM enc, prod "
+            "ORDER BY enc.id, prod.id", (n_encomendas, linhas_por_encomenda))
+        conn.commit()
+    finally:
+        conn.close()
+    return caminho
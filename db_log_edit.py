@@ -0,0 +1,198 @@
+"""
+Escritor assíncrono dos registos 'O' de LogOperations.
+
+As edições deixam de fazer INSERT + COMMIT do log dentro do seu caminho: os
+registos vão para uma fila limitada em memória e uma thread em segundo plano
+escreve-os em lotes (INSERT multi-linha, um COMMIT por lote) quando a fila
+atinge tamanho_lote ou passa intervalo_seg. Se a BD não responder, os registos
+vão para um ficheiro local (append-only, JSON por linha) e são reenviados,
+pela ordem original, assim que a BD voltar.
+
+O par inicial/final de cada edição entra na fila junto e com a mesma
+Referência, por isso a ligação entre os dois registos mantém-se. Depois de
+parar(), o que ainda chegar (ex: uma edição que confirmou durante o fecho) vai
+direto para o ficheiro de reserva: um registo de uma edição confirmada nunca se perde.
+A thread volta a tentar o ficheiro de reserva a cada intervalo_reserva_seg (e em
+esvaziar()/parar()), mesmo sem registos novos: uma aplicação parada depois de
+uma falha da BD não deixa registos no disco à espera da próxima edição.
+
+Como no INSERT original, Valor leva o instante da edição (relógio do cliente) e
+DCriacao é o GETDATE() do servidor no momento em que a linha é inserida.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from db_rastreio_edit import Rastreador
+from db_sql_edit import executar_values
+
+
+INSERT_LOGS_SQL = "INSERT INTO LogOperations (EventType, Objecto, Valor, Referencia, DCriacao) VALUES {valores}"
+LINHA_LOG_SQL = "('O', ?, ?, ?, GETDATE())"
+FICHEIRO_RESERVA = "logoperations_pendentes.jsonl"
+
+
+class EscritorLogOperations:
+
+    def __init__(self, pool, tamanho_lote: int = 200, intervalo_seg: float = 0.5, max_fila: int = 10000,
+                 ficheiro_reserva: str = FICHEIRO_RESERVA, rastreio: Rastreador = None,
+                 intervalo_reserva_seg: float = 30.0):
+        self.pool = pool
+        # O do motor, para o INSERT do log aparecer nos mesmos tempos e saídas
+        self.rastreio = rastreio or Rastreador(ativo=False)
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_seg = intervalo_seg
+        self.ficheiro_reserva = ficheiro_reserva
+        # De quanto em quanto tempo a thread volta a tentar o ficheiro de reserva sem registos novos
+        self.intervalo_reserva_seg = intervalo_reserva_seg
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._thread = None
+        self._parado = False
+        self._lock_fila = threading.Lock() # registar() vs parar(): nada entra na fila depois do fim
+        self._lock_reserva = threading.Lock()
+        self.estatisticas = {'registos': 0, 'escritos': 0, 'lotes': 0, 'em_reserva': 0, 'reenviados': 0}
+
+    # --- API ---
+    def iniciar(self):
+        with self._lock_fila:
+            self._parado = False
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._trabalhar, name="log-operations", daemon=True)
+            self._thread.start()
+        return self
+
+    def registar_edicao(self, enc_id: int, referencia: str, inicio: datetime, fim: datetime):
+        """ Regista o par 'O' inicial/final de uma edição confirmada. """
+        self.registar([(enc_id, inicio, referencia), (enc_id, fim, referencia)])
+
+    def registar(self, registos: list):
+        """ registos: [(Objecto, Valor, Referencia), ...]; DCriacao é a hora do servidor no INSERT. """
+        self.estatisticas['registos'] += len(registos)
+        with self._lock_fila:
+            if not self._parado:
+                try:
+                    self._fila.put(registos, timeout=1.0)
+                    return
+                except queue.Full:
+                    pass # Fila cheia (BD muito lenta): não se perde nada, vai direto para o ficheiro
+        self._guardar_em_reserva(registos)
+
+    def esvaziar(self, timeout_seg: float = 10.0):
+        """ Escreve já tudo o que está na fila. Devolve True se terminou dentro do timeout. """
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        feito = threading.Event()
+        self._fila.put(feito)
+        return feito.wait(timeout_seg)
+
+    def parar(self, timeout_seg: float = 10.0):
+        with self._lock_fila:
+            self._parado = True # Daqui em diante registar() escreve no ficheiro de reserva
+        if self._thread is not None and self._thread.is_alive():
+            self._fila.put(None)
+            self._thread.join(timeout_seg)
+        self._thread = None
+        # O que ficou na fila (a thread não terminou a tempo ou nunca arrancou) também vai para o ficheiro
+        restantes = []
+        while True:
+            try:
+                item = self._fila.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, list):
+                restantes.extend(item)
+            elif isinstance(item, threading.Event):
+                item.set()
+        if restantes:
+            self._guardar_em_reserva(restantes)
+
+    # --- Thread de escrita ---
+    def _trabalhar(self):
+        pendentes = []
+        limite = None
+        proxima_reserva = time.monotonic() # Reserva deixada por uma execução anterior: tenta já
+        while True:
+            if limite is not None:
+                espera = max(0.0, limite - time.monotonic())
+            elif self._ha_reserva():
+                espera = max(0.0, proxima_reserva - time.monotonic())
+            else:
+                espera = None
+            try:
+                item = self._fila.get(timeout=espera)
+            except queue.Empty:
+                item = False # Passou o intervalo (do lote ou do reenvio da reserva)
+
+            if isinstance(item, list):
+                pendentes.extend(item)
+                if limite is None:
+                    limite = time.monotonic() + self.intervalo_seg
+                if len(pendentes) < self.tamanho_lote:
+                    continue
+
+            # Tamanho atingido, intervalo esgotado, pedido de esvaziar ou de parar (a reserva vai junto)
+            self._escrever(pendentes)
+            pendentes, limite = [], None
+            proxima_reserva = time.monotonic() + self.intervalo_reserva_seg
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                return
+
+    def _escrever(self, registos: list):
+        if not registos and not self._ha_reserva():
+            return
+        try:
+            with self.rastreio.span("log_insert", registos=len(registos)) as span, self.pool.conexao() as conn:
+                cursor = conn.cursor()
+                try:
+                    reenviados = self._reenviar_reserva(cursor)
+                    if registos:
+                        executar_values(cursor, INSERT_LOGS_SQL, registos, LINHA_LOG_SQL)
+                    conn.commit()
+                    span.linhas = len(registos) + reenviados
+                finally:
+                    cursor.close()
+            if reenviados:
+                os.remove(self.ficheiro_reserva + ".reenvio")
+                self.estatisticas['reenviados'] += reenviados
+                self.rastreio.mensagem(f"[LOG] {reenviados} registos pendentes reenviados para LogOperations.")
+            self.estatisticas['escritos'] += len(registos)
+            self.estatisticas['lotes'] += 1 if registos else 0
+        except Exception as ex:
+            if registos:
+                self.rastreio.mensagem(f"⚠️ [LOG] BD indisponível ({ex}). {len(registos)} registos guardados "
+                                       f"em {self.ficheiro_reserva}.", 'aviso')
+                self._guardar_em_reserva(registos)
+
+    # --- Ficheiro de reserva ---
+    def _guardar_em_reserva(self, registos: list):
+        with self._lock_reserva:
+            with open(self.ficheiro_reserva, "a", encoding="utf-8") as ficheiro:
+                for objecto, valor, referencia in registos:
+                    ficheiro.write(json.dumps([objecto, valor.isoformat(), referencia]) + "\n")
+                ficheiro.flush()
+                os.fsync(ficheiro.fileno())
+        self.estatisticas['em_reserva'] += len(registos)
+
+    def _ha_reserva(self):
+        return os.path.exists(self.ficheiro_reserva) or os.path.exists(self.ficheiro_reserva + ".reenvio")
+
+    def _reenviar_reserva(self, cursor):
+        """ Insere (na transação do cursor) os registos do ficheiro de reserva. Devolve quantos. """
+        # O ficheiro é renomeado antes de ser lido: o que chegar entretanto vai para um ficheiro novo
+        em_reenvio = self.ficheiro_reserva + ".reenvio"
+        with self._lock_reserva:
+            if os.path.exists(self.ficheiro_reserva) and not os.path.exists(em_reenvio):
+                os.replace(self.ficheiro_reserva, em_reenvio)
+        if not os.path.exists(em_reenvio):
+            return 0
+        with open(em_reenvio, encoding="utf-8") as ficheiro:
+            registos = [json.loads(linha) for linha in ficheiro if linha.strip()]
+        # Ficheiros de versões anteriores têm um 4º campo (DCriacao do cliente): o servidor põe o seu
+        registos = [(objecto, datetime.fromisoformat(valor), referencia) for objecto, valor, referencia, *_ in registos]
+        executar_values(cursor, INSERT_LOGS_SQL, registos, LINHA_LOG_SQL)
+        return len(registos)
@@ -1,157 +1,813 @@
-import pyodbc
 from datetime import datetime
-import uuid
+import os
+import threading
 import time
-from tkinter import messagebox
+from itertools import groupby
+
+from db_backend_edit import BackendSqlServer
+from db_log_edit import EscritorLogOperations
+from db_cache_edit import (CabecalhoEncomenda, CacheEncomendasEdit, LinhaEncomenda, VERSAO_ENCOMENDA_SQL,
+                           VERSAO_CABECALHO_SQL, VERSAO_LINHAS_SQL)
+from db_instrucoes_edit import RegistoInstrucoes, INTEIRO, TEXTO, TEXTO_CURTO, BINARIO
+from db_otimista_edit import (SELECT_CABECALHO_VERSAO_SQL, SELECT_LINHAS_VERSAO_SQL, CONDICAO_CABECALHO_SQL,
+                              CONDICAO_LINHA_SQL, CONDICAO_LINHA_LOTE_SQL, LinhaVersionada, separar_versoes)
+from db_pool_edit import PoolConexoesEdit, ErroPool
+from db_rastreio_edit import Rastreador
+from db_retry_edit import PoliticaRepeticao
+from db_sql_edit import MAX_PARAMETROS
+
+
+SELECT_LINHAS_SQL = "SELECT Produtold, Designacao, Preco, Qtd FROM EncLinha WHERE EncId = ? ORDER BY Produtold"
+# Página de EncLinha: {apos} = "" ou " AND Produtold > ?" (paginação por chave).
+# Deslocamento e tamanho vão como parâmetros: o mesmo texto (e plano) serve todas as páginas
+SELECT_LINHAS_PAGINA_SQL = (
+    "SELECT Produtold, Designacao, Preco, Qtd FROM EncLinha WHERE EncId = ?{apos} "
+    "ORDER BY Produtold OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+)
+# Várias encomendas num só batch: {filtro} = "IN (?, ...)" ou "BETWEEN ? AND ?", repetido nas três instruções.
+# As versões (as mesmas de VERSAO_ENCOMENDA_SQL) vêm antes das linhas, como em fetch_encomenda_data.
+SELECT_ENCOMENDAS_SQL = (
+    f"SELECT EncId, Nome, Morada, {VERSAO_CABECALHO_SQL} AS VersaoEnc FROM Encomenda WHERE EncId {{filtro}}; "
+    f"SELECT EncId, {VERSAO_LINHAS_SQL} AS VersaoLinhas "
+    "FROM EncLinha WHERE EncId {filtro} GROUP BY EncId; "
+    "SELECT EncId, Produtold, Designacao, Preco, Qtd FROM EncLinha WHERE EncId {filtro} ORDER BY EncId, Produtold"
+)
+# A Referencia da edição fica visível nas DMVs (sys.dm_exec_sessions.context_info) enquanto a transação corre
+REFERENCIA_SESSAO_SQL = "DECLARE @referencia varbinary(128) = CAST(? AS varbinary(128)); SET CONTEXT_INFO @referencia; "
+
+
+def gerar_referencia():
+    """ Referência única que liga os registos 'O' inicial e final de uma edição em LogOperations. """
+    # os.urandom em vez de uuid.uuid4: o módulo uuid (e o platform) custam ~20 ms no arranque
+    return f"G1-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{os.urandom(3).hex()}"
+
 
 class DbConnectionEdit:
     """
     Motor da Base de Dados para a Aplicação Edit.
-    Gere a conexão e todas as transações de escrita.
+    Gere o pool de conexões e todas as transações de escrita.
     """
     def __init__(self):
-        self.conn = None
+        self.pool = None
+        self.backend = None # db_backend_edit: SQL Server ou SQLite
+        # Classe base dos erros da BD ligada (backend.Erro): pyodbc.Error ou db_local_edit.Error
+        self.Erro = Exception
         self.DRIVER = '{ODBC Driver 17 for SQL Server}' 
         self.DATABASE_NAME = 'SGBD_PL1_02' 
         self.NIVEL_ISOLAMENTO_ATUAL = 'READ COMMITTED'
         self.SERVER_NAME = '' # Será definido no connect
+        # Máximo de pares (Produtold, Qtd) por UPDATE em lote:
+        # 1000 linhas é o limite do VALUES e 2*1000+1 fica abaixo dos 2100 parâmetros do SQL Server
+        self.TAMANHO_LOTE_LINHAS = 1000
+        # Linhas pedidas ao driver por fetchmany em iterar_linhas
+        self.TAMANHO_LOTE_LEITURA = 500
+        # Máximo de EncIds por IN em fetch_encomendas (3 instruções x 512 fica abaixo dos 2100 parâmetros)
+        self.TAMANHO_LOTE_ENCOMENDAS = 512
+        # Quando definido, recebe (tipo, titulo, mensagem); sem ele as notificações vão para o rastreio.
+        # O motor não importa tkinter: a UI usa-o para mostrar as mensagens na thread do Tk.
+        self.notificar = None
+        self._notificacoes = threading.local() # Última notificação de cada thread (ultima_notificacao)
+        # Cache de leitura das encomendas (None para desligar)
+        self.cache = CacheEncomendasEdit()
+        # Tempos por etapa (spans, desligados por omissão) e as mensagens da consola
+        self.rastreio = Rastreador(ativo=False)
+        # Repetição de deadlocks / timeouts de bloqueio e SET LOCK_TIMEOUT por transação
+        self.politica_repeticao = PoliticaRepeticao(rastreio=self.rastreio)
+        # Registos 'O' de LogOperations escritos em lote fora da transação (criado no ligar_pool;
+        # depois de fechar() fica parado e manda o que receber para o ficheiro de reserva)
+        self.escritor_log = None
+        # Edições a correr: fechar() espera por elas antes de parar o escritor de log
+        self._edicoes_ativas = 0
+        self._fim_edicoes = threading.Condition()
+        # Cursores preparados por conexão do pool, com tipos de parâmetros fixos
+        self.instrucoes = RegistoInstrucoes()
 
-    def connect(self, server, database, username, password):
+    def connect(self, server, database, username, password, **opcoes_pool):
         """
-        Tenta estabelecer e guardar a conexão principal.
+        Tenta estabelecer o pool de conexões ao SQL Server.
+        opcoes_pool é passado ao PoolConexoesEdit (min_conexoes, max_conexoes, ...).
         """
-        self.SERVER_NAME = server
         self.DATABASE_NAME = database
-        
-        conn_str = (
-            f"DRIVER={self.DRIVER};"
-            f"SERVER={server};"
-            f"DATABASE={database};"
-            f"UID={username};"
-            f"PWD={password};"
-            "TrustServerCertificate=yes;" 
-        )
-        
+        return self.ligar(BackendSqlServer(server, database, username, password, driver=self.DRIVER), **opcoes_pool)
+
+    def ligar(self, backend, **opcoes_pool):
+        """ Liga o motor a um backend de db_backend_edit (SQL Server ou SQLite). Devolve o pool ou None. """
+        self.backend = backend
+        return self.ligar_pool(backend.fabrica, backend.descricao, erro=backend.Erro, **opcoes_pool)
+
+    def ligar_pool(self, fabrica, server_name: str, erro: type = Exception, **opcoes_pool):
+        """
+        Cria o pool a partir de uma fábrica de conexões (pyodbc ou BD local de testes).
+        erro: classe base dos erros das conexões da fábrica (ex: pyodbc.Error).
+        Devolve o pool, ou None se não for possível ligar.
+        """
+        self.SERVER_NAME = server_name
+        self.Erro = erro
+        opcoes_pool.setdefault('rastreio', self.rastreio)
+        pool = PoolConexoesEdit(fabrica, **opcoes_pool)
+        # Estado base de cada conexão; as edições mudam o LOCK_TIMEOUT e o pool repõe-no
+        pool.definir_estado_sessao('lock_timeout', "SET LOCK_TIMEOUT -1")
+        pool.definir_estado_sessao('context_info', "SET CONTEXT_INFO 0x")
+        pool.ao_fechar_conexao = self.instrucoes.esquecer
         try:
-            # autocommit=False é crucial
-            self.conn = pyodbc.connect(conn_str, autocommit=False)
-            print("✅ Conexão (DbConnectionEdit) estabelecida com sucesso!")
-            return self.conn
-        except pyodbc.Error as ex:
-            print(f"❌ ERRO DE CONEXÃO (DbConnectionEdit): {ex}")
-            self.conn = None
+            with self.rastreio.span("ligar", servidor=server_name) as span:
+                pool.aquecer()
+                span.linhas = pool.min_conexoes
+        except ErroPool as ex:
+            self.rastreio.mensagem(f"❌ ERRO DE CONEXÃO (DbConnectionEdit): {ex}", 'erro')
+            pool.fechar()
+            self.pool = None
             return None
 
+        self.fechar()
+        self.pool = pool
+        self.escritor_log = EscritorLogOperations(pool, rastreio=self.rastreio).iniciar()
+        self.rastreio.mensagem(f"✅ Conexão (DbConnectionEdit) estabelecida com sucesso! "
+                               f"(pool {pool.min_conexoes}-{pool.max_conexoes})")
+        return self.pool
+
+    def fechar(self, timeout_seg: float = 30.0):
+        """
+        Espera (até timeout_seg) pelas edições em curso, escreve os registos de log
+        pendentes e fecha o pool. Uma edição que ainda confirme depois disso não perde
+        o par 'O': o escritor parado grava-o no ficheiro de reserva.
+        """
+        with self._fim_edicoes:
+            if not self._fim_edicoes.wait_for(lambda: self._edicoes_ativas == 0, timeout_seg):
+                self.rastreio.mensagem(f"⚠️ {self._edicoes_ativas} edição(ões) ainda em curso ao fechar: "
+                                       "os registos de log seguem para o ficheiro de reserva.", 'aviso')
+        if self.escritor_log:
+            self.escritor_log.parar()
+        if self.pool:
+            self.pool.fechar()
+            self.pool = None
+        self.rastreio.esvaziar()
+
+    @property
+    def is_connected(self):
+        """ True se a BD responde (o pool tenta religar antes de desistir). """
+        return self.pool is not None and self.pool.verificar()
+
     def set_isolation(self, isolation_level: str):
-        """ Define o nível de isolamento para a conexão guardada. """
-        if not self.conn:
-            print("Erro: Sem conexão para definir isolamento.")
+        """ Define o nível de isolamento para todas as conexões do pool (repõe-se após religar). """
+        if not self.pool:
+            self.rastreio.mensagem("Erro: Sem conexão para definir isolamento.", 'erro')
             return False
             
         try:
-            with self.conn.cursor() as cursor:
-                isolation_sql = f"SET TRANSACTION ISOLATION LEVEL {isolation_level}"
-                cursor.execute(isolation_sql)
+            isolation_sql = f"SET TRANSACTION ISOLATION LEVEL {isolation_level}"
+            with self.rastreio.span("isolamento", nivel=isolation_level), self.pool.conexao() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(isolation_sql)
+            self.pool.definir_estado_sessao('isolamento', isolation_sql)
             self.NIVEL_ISOLAMENTO_ATUAL = isolation_level
-            print(f"✅ Nível de isolamento (DbConnectionEdit) definido para: {isolation_level}")
+            self.rastreio.mensagem(f"✅ Nível de isolamento (DbConnectionEdit) definido para: {isolation_level}")
             return True
-        except pyodbc.Error as ex:
-            print(f"❌ ERRO ao definir nível de isolamento: {ex}")
+        except (self.Erro, ErroPool) as ex:
+            self.rastreio.mensagem(f"❌ ERRO ao definir nível de isolamento: {ex}", 'erro')
             return False
 
-    def fetch_encomenda_data(self, enc_id: int):
+    def fetch_encomenda_data(self, enc_id: int, em_lote: bool = True, consistente: bool = False,
+                             usar_cache: bool = True):
         """ 
         Função de LEITURA (SELECT) - Passo 4. 
+        Com em_lote=True o cabeçalho e as linhas vêm numa só ida à BD (dois result sets).
+        Com consistente=True a leitura é feita em SNAPSHOT, numa só transação, para
+        que cabeçalho e linhas correspondam ao mesmo instante (e não usa a cache); o
+        nível escolhido na UI é reposto no mesmo batch.
+        Com usar_cache=True a encomenda vem da cache se a versão no servidor não mudou.
+        Devolve sempre (CabecalhoEncomenda, [LinhaEncomenda, ...]), venha da cache ou da BD.
         """
-        if not self.conn:
+        if not self.pool:
              raise Exception("Sem conexão.")
              
+        select_enc_sql = "SELECT Nome, Morada FROM Encomenda WHERE EncId = ?"
+        select_linhas_sql = SELECT_LINHAS_SQL
+        repor_sql = f"SET TRANSACTION ISOLATION LEVEL {self.NIVEL_ISOLAMENTO_ATUAL}"
+        usar_cache = usar_cache and self.cache is not None and not consistente
+        entrada, precisa_validar = self.cache.procurar(enc_id) if usar_cache else (None, False)
+        if entrada is not None and not precisa_validar:
+            return entrada.header, list(entrada.linhas) # Validada há pouco: nem sequer usa uma conexão
+
         try:
-            with self.conn.cursor() as cursor:
-                # 1. Ler Cabeçalho
-                select_enc_sql = "SELECT Nome, Morada FROM Encomenda WHERE EncId = ?"
-                cursor.execute(select_enc_sql, enc_id)
-                header = cursor.fetchone()
-                
+            with self.rastreio.span("ler_encomenda", enc_id=enc_id, em_lote=em_lote, consistente=consistente) as span, \
+                    self.pool.conexao() as conn:
+                versao = None
+                if entrada is not None and self.cache.confirmar(enc_id, self._versao_encomenda(conn, enc_id)):
+                    span.definir(cache="validada")
+                    return entrada.header, list(entrada.linhas)
+                # A versão é lida ANTES dos dados: se mudarem entretanto, o próximo probe deteta-o
+                if usar_cache and not em_lote:
+                    versao = self._versao_encomenda(conn, enc_id)
+
+                try:
+                    if em_lote or consistente:
+                        # 1 + 2. Cabeçalho e Linhas no mesmo batch
+                        batch_sql = f"{select_enc_sql}; {select_linhas_sql}"
+                        params = [enc_id, enc_id]
+                        if consistente:
+                            # O nível escolhido na UI volta no fim do mesmo batch (sem outra ida à BD)
+                            batch_sql = f"SET TRANSACTION ISOLATION LEVEL SNAPSHOT; {batch_sql}; {repor_sql}"
+                        elif usar_cache:
+                            batch_sql = f"{VERSAO_ENCOMENDA_SQL}; {batch_sql}"
+                            params = [enc_id, enc_id] + params
+                        with self.instrucoes.executar(conn, batch_sql, params, [INTEIRO] * len(params)) as cursor:
+                            if usar_cache:
+                                versao = tuple(cursor.fetchone())
+                                cursor.nextset()
+                            header = cursor.fetchone()
+                            cursor.nextset()
+                            linhas = cursor.fetchall()
+                    else:
+                        # 1. Ler Cabeçalho
+                        with self.instrucoes.executar(conn, select_enc_sql, [enc_id], [INTEIRO]) as cursor:
+                            header = cursor.fetchone()
+                        
+                        # 2. Ler Linhas
+                        linhas = []
+                        if header:
+                            with self.instrucoes.executar(conn, select_linhas_sql, [enc_id], [INTEIRO]) as cursor:
+                                linhas = cursor.fetchall()
+                except self.Erro:
+                    if consistente:
+                        # O batch parou antes de repor o nível: só neste caso vai à parte
+                        with self.instrucoes.executar(conn, repor_sql):
+                            pass
+                    raise
+
                 if not header:
                     raise Exception(f"Encomenda {enc_id} não encontrada.")
+
+                # O mesmo tipo com e sem cache: tuplos leves em vez das Row do driver
+                header, linhas = CacheEncomendasEdit.converter(header, linhas)
+                if usar_cache:
+                    self.cache.guardar(enc_id, header, linhas, versao)
+                    linhas = list(linhas)
                 
-                # 2. Ler Linhas
-                select_linhas_sql = "SELECT Produtold, Designacao, Preco, Qtd FROM EncLinha WHERE EncId = ? ORDER BY Produtold"
-                cursor.execute(select_linhas_sql, enc_id)
-                linhas = cursor.fetchall()
-                
+                span.linhas = len(linhas)
                 return header, linhas
                 
-        except pyodbc.Error as ex:
-            print(f"ERRO no fetch_encomenda_data: {ex}")
+        except self.Erro as ex:
+            self.rastreio.mensagem(f"ERRO no fetch_encomenda_data: {ex}", 'erro')
             raise # Lança o erro para a UI
+
+    def fetch_encomendas(self, enc_ids=None, de: int = None, ate: int = None, usar_cache: bool = True,
+                         pre_carga: bool = False):
+        """
+        Leitura de várias encomendas de uma vez, pelos EncIds dados (WHERE EncId IN)
+        ou pelo intervalo de..ate (BETWEEN): cabeçalhos, versões e linhas vêm num só
+        batch por bloco, em vez de duas idas à BD por encomenda, e as linhas são
+        agrupadas por EncId em memória. Devolve {enc_id: (header, linhas)} só com as
+        encomendas que existem.
+        Com enc_ids e usar_cache=True, as que estão na cache (validadas há pouco) não
+        voltam a ser lidas e as lidas ficam na cache: é assim que a UI pré-carrega
+        as encomendas seguintes (pre_carga=True: as procuras na cache contam à parte).
+        Um intervalo não passa pela cache (leituras em massa).
+        """
+        if not self.pool:
+             raise Exception("Sem conexão.")
+
+        encomendas = {}
+        usar_cache = usar_cache and self.cache is not None and enc_ids is not None
+        if enc_ids is None:
+            blocos = [("BETWEEN ? AND ?", [de, ate])]
+        else:
+            pedidos = []
+            for enc_id in dict.fromkeys(enc_ids):
+                entrada, precisa_validar = self.cache.procurar(enc_id, pre_carga) if usar_cache else (None, False)
+                if entrada is not None and not precisa_validar:
+                    encomendas[enc_id] = (entrada.header, list(entrada.linhas))
+                else:
+                    pedidos.append(enc_id) # Sem cache ou por validar: relê (custa o mesmo batch)
+            blocos = []
+            for inicio in range(0, len(pedidos), self.TAMANHO_LOTE_ENCOMENDAS):
+                bloco = pedidos[inicio:inicio + self.TAMANHO_LOTE_ENCOMENDAS]
+                # IN com 1, 2, 4, 8, ... parâmetros (o último repetido): poucos textos de SQL a preparar
+                tamanho = min(1 << (len(bloco) - 1).bit_length(), self.TAMANHO_LOTE_ENCOMENDAS)
+                bloco += [bloco[-1]] * (tamanho - len(bloco))
+                blocos.append((f"IN ({', '.join(['?'] * tamanho)})", bloco))
+            if not blocos:
+                return encomendas # Tudo veio da cache (ou não foi pedido nada): nem usa uma conexão
+
+        try:
+            with self.rastreio.span("ler_encomendas", intervalo=enc_ids is None, blocos=len(blocos)) as span, \
+                    self.pool.conexao() as conn:
+                total_linhas = 0
+                for filtro, params in blocos:
+                    select_sql = SELECT_ENCOMENDAS_SQL.format(filtro=filtro)
+                    with self.instrucoes.executar(conn, select_sql, params * 3, [INTEIRO] * (len(params) * 3)) as cursor:
+                        cabecalhos = cursor.fetchall()
+                        cursor.nextset()
+                        versoes_linhas = {linha[0]: linha[1] for linha in cursor.fetchall()}
+                        cursor.nextset()
+                        linhas_por_encomenda = {
+                            enc_id: [LinhaEncomenda(*linha[1:]) for linha in grupo]
+                            for enc_id, grupo in groupby(cursor.fetchall(), key=lambda linha: linha[0])}
+
+                    for enc_id, nome, morada, versao_enc in cabecalhos:
+                        header = CabecalhoEncomenda(nome, morada)
+                        linhas = linhas_por_encomenda.get(enc_id, [])
+                        if usar_cache:
+                            self.cache.guardar(enc_id, header, linhas, (versao_enc, versoes_linhas.get(enc_id)))
+                        encomendas[enc_id] = (header, list(linhas))
+                        total_linhas += len(linhas)
+                span.linhas = total_linhas
+                span.definir(encomendas=len(encomendas))
+        except self.Erro as ex:
+            self.rastreio.mensagem(f"ERRO no fetch_encomendas: {ex}", 'erro')
+            raise
+        return encomendas
+
+    def encomenda_em_cache(self, enc_id: int, validar: bool = True):
+        """
+        (header, linhas) se a encomenda estiver na cache e ainda for a versão do
+        servidor (probe de versão se não foi validada há pouco); senão None.
+        Com validar=False não há probe: quem chama mostra já e confirma depois
+        (nova chamada com validar=True). Nunca lê a encomenda.
+        """
+        if self.cache is None or not self.pool:
+            return None
+        entrada, precisa_validar = self.cache.procurar(enc_id)
+        if entrada is None:
+            return None
+        if precisa_validar and validar:
+            with self.pool.conexao() as conn:
+                if not self.cache.confirmar(enc_id, self._versao_encomenda(conn, enc_id)):
+                    return None
+        return entrada.header, list(entrada.linhas)
+
+    def fetch_encomenda_pagina(self, enc_id: int, tamanho_pagina: int = 200, usar_cache: bool = True):
+        """
+        Leitura para listas grandes: cabeçalho, nº total de linhas e só a primeira
+        página de linhas, numa ida à BD. Devolve (header, total_linhas, linhas).
+        As páginas seguintes vêm de fetch_linhas_pagina.
+        Com usar_cache=True, uma encomenda em cache (validada há pouco, ou cuja versão,
+        lida no mesmo batch, não mudou) sai da cache; uma encomenda que cabe toda na
+        primeira página fica na cache, como em fetch_encomenda_data.
+        """
+        if not self.pool:
+             raise Exception("Sem conexão.")
+
+        usar_cache = usar_cache and self.cache is not None
+        entrada, precisa_validar = self.cache.procurar(enc_id) if usar_cache else (None, False)
+        if entrada is not None and not precisa_validar:
+            return entrada.header, len(entrada.linhas), list(entrada.linhas[:tamanho_pagina])
+
+        batch_sql = (
+            "SELECT Nome, Morada FROM Encomenda WHERE EncId = ?; "
+            "SELECT COUNT(*) FROM EncLinha WHERE EncId = ?; "
+            + SELECT_LINHAS_PAGINA_SQL.format(apos="")
+        )
+        params = [enc_id, enc_id, enc_id, 0, tamanho_pagina]
+        if usar_cache:
+            # A versão vem antes dos dados, como em fetch_encomenda_data
+            batch_sql = f"{VERSAO_ENCOMENDA_SQL}; {batch_sql}"
+            params = [enc_id, enc_id] + params
+        try:
+            with self.rastreio.span("ler_encomenda_pagina", enc_id=enc_id) as span, self.pool.conexao() as conn, \
+                    self.instrucoes.executar(conn, batch_sql, params, [INTEIRO] * len(params)) as cursor:
+                versao = None
+                if usar_cache:
+                    versao = tuple(cursor.fetchone())
+                    cursor.nextset()
+                    if entrada is not None and self.cache.confirmar(enc_id, versao):
+                        span.definir(cache="validada")
+                        return entrada.header, len(entrada.linhas), list(entrada.linhas[:tamanho_pagina])
+                header = cursor.fetchone()
+                cursor.nextset()
+                total = cursor.fetchone()[0]
+                cursor.nextset()
+                linhas = cursor.fetchall()
+                span.linhas = len(linhas)
+        except self.Erro as ex:
+            self.rastreio.mensagem(f"ERRO no fetch_encomenda_pagina: {ex}", 'erro')
+            raise
+
+        if not header:
+            raise Exception(f"Encomenda {enc_id} não encontrada.")
+        header, linhas = CacheEncomendasEdit.converter(header, linhas)
+        # A cache guarda encomendas inteiras: só quando a primeira página é a encomenda toda
+        if usar_cache and total <= tamanho_pagina:
+            self.cache.guardar(enc_id, header, linhas, versao)
+            linhas = list(linhas)
+        return header, total, linhas
+
+    def fetch_linhas_pagina(self, enc_id: int, apos_produto: int = None, deslocamento: int = 0,
+                            tamanho_pagina: int = 200):
+        """
+        Uma página de EncLinha ordenada por Produtold.
+        Com apos_produto (último Produtold da página anterior) usa paginação por chave
+        (WHERE Produtold > ?), que custa o mesmo em qualquer ponto da encomenda;
+        sem ele salta 'deslocamento' linhas (OFFSET), para saltos diretos a meio da lista.
+        """
+        if not self.pool:
+             raise Exception("Sem conexão.")
+
+        if apos_produto is not None:
+            select_sql = SELECT_LINHAS_PAGINA_SQL.format(apos=" AND Produtold > ?")
+            params = [enc_id, apos_produto, 0, tamanho_pagina]
+        else:
+            select_sql = SELECT_LINHAS_PAGINA_SQL.format(apos="")
+            params = [enc_id, int(deslocamento), tamanho_pagina]
+        try:
+            with self.rastreio.span("ler_linhas_pagina", enc_id=enc_id, por_chave=apos_produto is not None) as span, \
+                    self.pool.conexao() as conn, \
+                    self.instrucoes.executar(conn, select_sql, params, [INTEIRO] * len(params)) as cursor:
+                linhas = [LinhaEncomenda(*linha) for linha in cursor.fetchall()]
+                span.linhas = len(linhas)
+                return linhas
+        except self.Erro as ex:
+            self.rastreio.mensagem(f"ERRO no fetch_linhas_pagina: {ex}", 'erro')
+            raise
+
+    def iterar_linhas(self, enc_id: int, arraysize: int = None, com_versoes: bool = False,
+                      em_lotes: bool = False, cancelar=None):
+        """
+        Gerador das linhas da encomenda, lidas com fetchmany(arraysize) em vez de fetchall():
+        a primeira linha chega sem esperar pela última e só um lote está em memória.
+        Produz LinhaEncomenda (LinhaVersionada com com_versoes=True), ou listas delas
+        com em_lotes=True. A conexão fica com o gerador até ele acabar; parar a meio
+        (break, close() ou cancelar.set() noutra thread) cancela o resto no servidor
+        e devolve a conexão ao pool.
+        """
+        if not self.pool:
+             raise Exception("Sem conexão.")
+
+        arraysize = arraysize or self.TAMANHO_LOTE_LEITURA
+        select_sql, registo = (SELECT_LINHAS_VERSAO_SQL, LinhaVersionada) if com_versoes else (SELECT_LINHAS_SQL, LinhaEncomenda)
+        conn = self.pool.obter()
+        cursor = None
+        terminou = False
+        descartar = False
+        try:
+            cursor = conn.cursor()
+            cursor.arraysize = arraysize
+            # Só a execução é medida: o resto depende de quem consome o gerador
+            with self.rastreio.span("iterar_linhas", enc_id=enc_id, arraysize=arraysize):
+                cursor.execute(select_sql, enc_id)
+            while not (cancelar is not None and cancelar.is_set()):
+                lote = cursor.fetchmany(arraysize)
+                if not lote:
+                    terminou = True
+                    break
+                # Tuplos leves em vez das Row do driver
+                lote = [registo(*linha) for linha in lote]
+                if em_lotes:
+                    yield lote
+                else:
+                    yield from lote
+        except self.Erro as ex:
+            self.rastreio.mensagem(f"ERRO no iterar_linhas: {ex}", 'erro')
+            raise
+        finally:
+            if cursor:
+                try:
+                    if not terminou:
+                        cursor.cancel() # O servidor deixa de enviar o resto do resultado
+                    cursor.close()
+                except self.Erro:
+                    descartar = True
+            self.pool.devolver(conn, descartar=descartar)
+
+    def ler_para_edicao(self, enc_id: int, ao_receber_lote=None, cancelar=None):
+        """
+        Leitura para o modo otimista: devolve (header, linhas, versoes), em que versoes
+        tem o hash (HASHBYTES) do cabeçalho e de cada linha calculado nas mesmas linhas lidas.
+        As versões são depois passadas a editar_encomenda(..., versoes=versoes). Não usa a cache.
+        As linhas vêm de iterar_linhas: ao_receber_lote(lote) é chamado por cada lote que
+        chega (ex: para a UI mostrar as primeiras linhas logo); cancelar interrompe a leitura.
+        """
+        if not self.pool:
+             raise Exception("Sem conexão.")
+
+        try:
+            with self.rastreio.span("ler_cabecalho_versao", enc_id=enc_id), self.pool.conexao() as conn, \
+                    self.instrucoes.executar(conn, SELECT_CABECALHO_VERSAO_SQL, [enc_id], [INTEIRO]) as cursor:
+                header = cursor.fetchone()
+        except self.Erro as ex:
+            self.rastreio.mensagem(f"ERRO no ler_para_edicao: {ex}", 'erro')
+            raise
+
+        if not header:
+            raise Exception(f"Encomenda {enc_id} não encontrada.")
+
+        linhas = []
+        for lote in self.iterar_linhas(enc_id, com_versoes=True, em_lotes=True, cancelar=cancelar):
+            linhas.extend(lote)
+            if ao_receber_lote:
+                ao_receber_lote(lote)
+        if cancelar is not None and cancelar.is_set():
+            raise Exception(f"Leitura da Encomenda {enc_id} cancelada.")
+        return separar_versoes(header, linhas)
+
+    def _versao_encomenda(self, conn, enc_id: int):
+        """ Probe barato: hashes do cabeçalho e das linhas calculados no servidor. """
+        with self.rastreio.span("versao", enc_id=enc_id), self.instrucoes.executar(conn, VERSAO_ENCOMENDA_SQL, [enc_id, enc_id], [INTEIRO, INTEIRO]) as cursor:
+            return tuple(cursor.fetchone())
             
 
-    def editar_encomenda(self, enc_id: int, nova_morada: str, produtos_alterados: list, pausar_para_teste: bool = False):
+    def _notificar(self, tipo: str, titulo: str, mensagem: str):
+        """ tipo: 'info' ou 'error'. """
+        self._notificacoes.ultima = (tipo, titulo, mensagem)
+        if self.notificar:
+            self.notificar(tipo, titulo, mensagem)
+        else:
+            self.rastreio.mensagem(f"[{titulo}] {mensagem}", 'erro' if tipo == 'error' else 'info')
+
+    def ultima_notificacao(self):
+        """ (tipo, titulo, mensagem) da última notificação feita nesta thread, ou None (ex: porque editar_encomenda devolveu None). """
+        return getattr(self._notificacoes, 'ultima', None)
+
+    def editar_encomenda(self, enc_id: int, nova_morada: str, produtos_alterados: list, pausar_para_teste: bool = False,
+                         em_lote: bool = True, ao_pausar=None, versoes=None):
         """
         Executa o fluxo completo de edição.
+        Com em_lote=True as quantidades são enviadas num único UPDATE por lote
+        (em vez de um UPDATE por produto). Devolve um resumo com as linhas
+        pedidas/afetadas e o nº de tentativas, ou None se a transação foi revertida.
+        ao_pausar: função chamada na pausa de teste; o COMMIT só avança quando ela retornar
+        (sem ela a pausa só é notificada: o motor não abre janelas).
+        Deadlocks e timeouts de bloqueio são repetidos segundo self.politica_repeticao.
+        versoes: as de ler_para_edicao, para o modo otimista. Cada UPDATE só se aplica se
+        a linha não mudou desde a leitura; senão a transação é revertida e o resumo
+        vem com 'conflito': True (sem notificação: a UI decide como fundir).
+        Só é enviado o que muda: com nova_morada=None o cabeçalho não é tocado (nem
+        bloqueado) e sem produtos não há UPDATE de linhas. Sem nada para mudar não se
+        abre transação nem se escreve log; o resumo vem com 'sem_alteracoes': True.
         """
-        if not self.conn:
-            messagebox.showerror("Erro de Transação", "A conexão com a BD foi perdida.")
+        with self._fim_edicoes:
+            self._edicoes_ativas += 1
+        try:
+            with self.rastreio.span("editar", enc_id=enc_id, otimista=versoes is not None) as span:
+                resumo = self._editar_encomenda(enc_id, nova_morada, produtos_alterados, pausar_para_teste,
+                                                em_lote, ao_pausar, versoes)
+                if resumo is None:
+                    span.erro = "revertida"
+                else:
+                    span.linhas = resumo['linhas_afetadas']
+                    span.definir(tentativas=resumo['tentativas'], conflito=resumo['conflito'])
+                return resumo
+        finally:
+            with self._fim_edicoes:
+                self._edicoes_ativas -= 1
+                self._fim_edicoes.notify_all()
+
+    def _editar_encomenda(self, enc_id, nova_morada, produtos_alterados, pausar_para_teste,
+                          em_lote, ao_pausar, versoes):
+        if nova_morada is None and not produtos_alterados:
+            self.rastreio.mensagem(f"[EDIÇÃO] Encomenda {enc_id} sem alterações: nada a guardar.")
+            return {'referencia': None, 'linhas_pedidas': 0, 'linhas_afetadas': 0,
+                    'tentativas': 0, 'conflito': False, 'sem_alteracoes': True}
+
+        # O pool desta edição: se o motor fechar entretanto (ver fechar), a conexão volta ao pool certo
+        pool = self.pool
+        if not pool:
+            self._notificar('error', "Erro de Transação", "A conexão com a BD foi perdida.")
             return
 
         # 2.4. Gerar Referência Única
-        user_reference = f"G1-{datetime.now().strftime('%Y%m%d%H%M%S%f')}-{uuid.uuid4().hex[:6]}"
-        cursor = None 
+        user_reference = gerar_referencia()
+        lock_timeout_ms = self.politica_repeticao.lock_timeout_ms
+        inicio = time.monotonic()
+        tentativa = 0
 
-        try:
-            cursor = self.conn.cursor()
-            
-            # 2.5. LOG INICIAL
-            log_start_sql = "INSERT INTO LogOperations (EventType, Objecto, Valor, Referencia, DCriacao) VALUES ('O', ?, ?, ?, GETDATE())"
-            cursor.execute(log_start_sql, enc_id, datetime.now(), user_reference)
-            print(f"\n[LOG] Registo inicial 'O' inserido. Referência: {user_reference}")
-            
-            # --- INÍCIO DA TRANSAÇÃO (implícito) ---
-
-            # --- 3.2 & 3.3. ATUALIZAÇÃO (UPDATE) ---
-            print("\n--- INÍCIO DA ATUALIZAÇÃO (UPDATE) ---")
-
-            # 1. Atualizar Encomenda (Morada)
-            update_enc_sql = "UPDATE Encomenda SET Morada = ? WHERE EncId = ?"
-            cursor.execute(update_enc_sql, nova_morada, enc_id)
-            print(f"✅ UPDATE Encomenda (Morada) executado.")
-
-            # 2. Atualizar EncLinha (Quantidade)
-            for produto in produtos_alterados:
-                update_linha_sql = "UPDATE EncLinha SET Qtd = ? WHERE EncId = ? AND Produtold = ?"
-                cursor.execute(update_linha_sql, produto['nova_qtd'], enc_id, produto['produto_id'])
-                print(f"  > Produto {produto['produto_id']} atualizado para Qtd={produto['nova_qtd']}.")
-
-            # 3.4. PAUSA PARA TESTES
-            if pausar_para_teste:
-                print("\n*** PAUSA PARA TESTE DE CONCORRÊNCIA ***")
-                messagebox.showinfo("Transação em Pausa", 
-                                    "A transação está ATIVA com dados não confirmados (UPDATEs executados).\n"
-                                    "Verifique no Browser/SSMS (deve estar bloqueado).\n\n"
-                                    "Clique OK para executar o COMMIT.")
-            
-            # 2.10. COMMIT DA TRANSAÇÃO
-            self.conn.commit()
-            print("\n✅ COMMIT EXECUTADO. Alterações permanentes.")
-            
-            # 2.6. LOG FINAL
-            log_end_sql = "INSERT INTO LogOperations (EventType, Objecto, Valor, Referencia, DCriacao) VALUES ('O', ?, ?, ?, GETDATE())"
-            cursor.execute(log_end_sql, enc_id, datetime.now(), user_reference)
-            self.conn.commit() # Commit separado do log final
-            print("[LOG] Registo final 'O' inserido.")
-            
-            messagebox.showinfo("Sucesso", f"Encomenda {enc_id} atualizada com sucesso.")
-
-        except pyodbc.Error as ex:
-            print(f"❌ FALHA CRÍTICA NA TRANSAÇÃO: {ex}")
-            if self.conn:
-                self.conn.rollback() 
-                print("ROLLBACK EXECUTADO.")
-                messagebox.showerror("Falha na Transação", f"Ocorreu um erro e a transação foi revertida (ROLLBACK).\n\n{ex}")
+        while True:
+            tentativa += 1
+            self.politica_repeticao.estatisticas['tentativas'] += 1
+            # Numa repetição os dois registos 'O' levam o nº da tentativa (o par continua ligado pela Referência)
+            referencia = user_reference if tentativa == 1 else f"{user_reference}-T{tentativa}"
+
+            # Conexão própria do pool: leituras feitas durante a pausa usam outra
+            try:
+                conn = pool.obter()
+            except ErroPool as ex:
+                self._notificar('error', "Erro de Transação", f"A conexão com a BD foi perdida.\n\n{ex}")
+                return
+
+            descartar = False
+            erro = None
+            # O COMMIT repõe o LOCK_TIMEOUT e o CONTEXT_INFO por omissão; se não chegar lá, repõe-nos o pool
+            estado_reposto = False
+
+            try:
+                # 2.5. LOG INICIAL: o momento fica registado aqui, o INSERT é feito
+                # pelo escritor de log (em lote) depois do COMMIT
+                inicio_edicao = datetime.now()
+                self.rastreio.mensagem(f"\n[LOG] Início da edição. Referência: {referencia}")
                 
-        finally:
-            # NÃO fechamos a conexão, mas fechamos o cursor
-            if cursor:
-                cursor.close()
\ No newline at end of file
+                # --- INÍCIO DA TRANSAÇÃO (implícito) ---
+
+                # --- 3.2 & 3.3. ATUALIZAÇÃO (UPDATE) ---
+                self.rastreio.mensagem("\n--- INÍCIO DA ATUALIZAÇÃO (UPDATE) ---")
+
+                # A primeira instrução leva a Referencia (CONTEXT_INFO) e o limite de espera
+                # por bloqueios desta transação: (sql, parâmetros, tipos)
+                prefixo_sql = REFERENCIA_SESSAO_SQL
+                if lock_timeout_ms is not None:
+                    prefixo_sql += f"SET LOCK_TIMEOUT {int(lock_timeout_ms)}; "
+                prefixo = (prefixo_sql, [referencia], [TEXTO_CURTO])
+
+                # 1. Atualizar Encomenda (Morada), só se mudou
+                cabecalho_mudou = False
+                if nova_morada is not None:
+                    (prefixo_sql, params_enc, tipos_enc), prefixo = prefixo, ("", [], [])
+                    update_enc_sql = f"{prefixo_sql}UPDATE Encomenda SET Morada = ? WHERE EncId = ?"
+                    # nova_morada como TEXTO: o mesmo plano serve qualquer comprimento de morada
+                    params_enc, tipos_enc = params_enc + [nova_morada, enc_id], tipos_enc + [TEXTO, INTEIRO]
+                    if versoes is not None:
+                        update_enc_sql += f" AND {CONDICAO_CABECALHO_SQL}"
+                        params_enc.append(versoes.cabecalho)
+                        tipos_enc.append(BINARIO)
+                    with self.rastreio.span("update_encomenda", enc_id=enc_id) as span, \
+                            self.instrucoes.executar(conn, update_enc_sql, params_enc, tipos_enc) as cursor:
+                        span.linhas = cursor.rowcount
+                        cabecalho_mudou = versoes is not None and cursor.rowcount == 0
+                        encomenda_inexistente = versoes is None and cursor.rowcount == 0
+                    # Modo pessimista: 0 linhas quer dizer que o EncId não existe (no otimista é conflito)
+                    if encomenda_inexistente:
+                        with self.rastreio.span("rollback", enc_id=enc_id):
+                            conn.rollback()
+                        self.rastreio.mensagem(f"❌ A Encomenda {enc_id} não existe. ROLLBACK EXECUTADO.", 'erro')
+                        self._notificar('error', "Falha na Transação",
+                                        f"Encomenda não existe: {enc_id}. A transação foi revertida (ROLLBACK).")
+                        return None
+                    self.rastreio.mensagem(f"✅ UPDATE Encomenda (Morada) executado.")
+
+                # 2. Atualizar EncLinha (Quantidade)
+                if em_lote:
+                    pedidas, afetadas = self._atualizar_linhas_em_lote(conn, enc_id, produtos_alterados, versoes, prefixo)
+                else:
+                    pedidas, afetadas = len(produtos_alterados), 0
+                    for produto in produtos_alterados:
+                        (prefixo_sql, params_linha, tipos_linha), prefixo = prefixo, ("", [], [])
+                        update_linha_sql = f"{prefixo_sql}UPDATE EncLinha SET Qtd = ? WHERE EncId = ? AND Produtold = ?"
+                        params_linha = params_linha + [produto['nova_qtd'], enc_id, produto['produto_id']]
+                        tipos_linha = tipos_linha + [INTEIRO] * 3
+                        if versoes is not None:
+                            update_linha_sql += f" AND {CONDICAO_LINHA_SQL}"
+                            params_linha.append(versoes.linhas.get(produto['produto_id']))
+                            tipos_linha.append(BINARIO)
+                        with self.rastreio.span("update_linhas", enc_id=enc_id, lote=1) as span, \
+                                self.instrucoes.executar(conn, update_linha_sql, params_linha, tipos_linha) as cursor:
+                            span.linhas = cursor.rowcount
+                            afetadas += max(cursor.rowcount, 0)
+                        self.rastreio.mensagem(
+                            f"  > Produto {produto['produto_id']} atualizado para Qtd={produto['nova_qtd']}.", 'debug')
+                self.rastreio.mensagem(f"✅ UPDATE EncLinha: {afetadas}/{pedidas} linhas afetadas.")
+
+                if afetadas != pedidas or cabecalho_mudou:
+                    em_falta = self._produtos_em_falta(conn, enc_id, produtos_alterados)
+                    # No modo otimista, uma linha lida que entretanto desapareceu é conflito, não erro
+                    desconhecidos = em_falta if versoes is None else [p for p in em_falta if p not in versoes.linhas]
+                    with self.rastreio.span("rollback", enc_id=enc_id):
+                        conn.rollback()
+
+                    # Produtos que não existem na encomenda não podem passar em silêncio
+                    if desconhecidos:
+                        self.rastreio.mensagem(
+                            f"❌ Produtos inexistentes na Encomenda {enc_id}: {desconhecidos}. ROLLBACK EXECUTADO.", 'erro')
+                        self._notificar('error', "Falha na Transação",
+                                        f"Os produtos {desconhecidos} não existem na Encomenda {enc_id}.\n"
+                                        f"Linhas afetadas: {afetadas} de {pedidas}. A transação foi revertida (ROLLBACK).")
+                        return None
+
+                    self.rastreio.mensagem(f"⚠️ CONFLITO: a Encomenda {enc_id} foi alterada por outra sessão "
+                                           "desde a leitura. ROLLBACK EXECUTADO.", 'aviso')
+                    if self.cache is not None:
+                        self.cache.invalidar(enc_id)
+                    return {'referencia': referencia, 'linhas_pedidas': pedidas, 'linhas_afetadas': afetadas,
+                            'tentativas': tentativa, 'conflito': True}
+
+                # 3.4. PAUSA PARA TESTES
+                if pausar_para_teste:
+                    self.rastreio.mensagem("\n*** PAUSA PARA TESTE DE CONCORRÊNCIA ***")
+                    if ao_pausar:
+                        ao_pausar()
+                    else:
+                        self._notificar('info', "Transação em Pausa",
+                                        "A transação está ATIVA com dados não confirmados (UPDATEs executados).\n"
+                                        "Sem ao_pausar o COMMIT segue já.")
+                
+                # 2.10. COMMIT DA TRANSAÇÃO, no mesmo batch que a reposição do estado de sessão:
+                # a conexão volta ao pool limpa e a próxima edição não paga uma ida à BD para isso
+                commit_sql = "COMMIT TRANSACTION; " + pool.sql_estado_sessao('lock_timeout', 'context_info')
+                params_commit, tipos_commit = [], []
+                # Versão pós-edição, só se a encomenda estiver em cache: à frente do COMMIT no mesmo
+                # batch (ainda com os bloqueios da edição, sem mais uma ida à BD com a transação aberta)
+                ler_versao = self.cache is not None and enc_id in self.cache
+                if ler_versao:
+                    commit_sql = f"{VERSAO_ENCOMENDA_SQL}; {commit_sql}"
+                    params_commit, tipos_commit = [enc_id, enc_id], [INTEIRO, INTEIRO]
+                with self.rastreio.span("commit", enc_id=enc_id), \
+                        self.instrucoes.executar(conn, commit_sql, params_commit, tipos_commit) as cursor:
+                    estado_reposto = True
+                    versao = tuple(cursor.fetchone()) if ler_versao else None
+                self.rastreio.mensagem("\n✅ COMMIT EXECUTADO. Alterações permanentes.")
+
+                # A cache fica com os dados novos: o recarregamento a seguir não vai à BD
+                if versao is not None:
+                    self.cache.aplicar_edicao(enc_id, nova_morada,
+                                              {p['produto_id']: p['nova_qtd'] for p in produtos_alterados}, versao)
+                
+                # 2.6. LOG FINAL: o par inicial/final vai para a fila do escritor de log
+                self._registar_log_edicao(enc_id, referencia, inicio_edicao, datetime.now())
+                
+                self._notificar('info', "Sucesso", f"Encomenda {enc_id} atualizada com sucesso.")
+                return {'referencia': referencia, 'linhas_pedidas': pedidas, 'linhas_afetadas': afetadas,
+                        'tentativas': tentativa, 'conflito': False}
+
+            except self.Erro as ex:
+                erro = ex
+                self.rastreio.mensagem(f"❌ FALHA NA TRANSAÇÃO (tentativa {tentativa}): {ex}", 'erro')
+                if self.cache is not None:
+                    self.cache.invalidar(enc_id)
+                try:
+                    with self.rastreio.span("rollback", enc_id=enc_id):
+                        conn.rollback()
+                    self.rastreio.mensagem("ROLLBACK EXECUTADO.")
+                except self.Erro:
+                    # A ligação caiu: o servidor desfaz a transação sozinho e o pool religa
+                    descartar = True
+                    
+            finally:
+                if not estado_reposto:
+                    pool.marcar_estado_alterado(conn)
+                # NÃO fechamos a conexão (volta ao pool); os cursores ficam preparados no registo
+                pool.devolver(conn, descartar=descartar)
+
+            # Deadlock / timeout de bloqueio: a conexão já voltou ao pool, espera e repete
+            if not self.politica_repeticao.deve_repetir(erro, tentativa, inicio):
+                self._notificar('error', "Falha na Transação",
+                                f"Ocorreu um erro e a transação foi revertida (ROLLBACK) "
+                                f"após {tentativa} tentativa(s).\n\n{erro}")
+                return None
+
+    def _registar_log_edicao(self, enc_id, referencia, inicio, fim):
+        """ Depois do COMMIT: o par 'O' não pode ficar pelo caminho, aconteça o que acontecer ao log. """
+        try:
+            self.escritor_log.registar_edicao(enc_id, referencia, inicio, fim)
+            self.rastreio.mensagem("[LOG] Registos 'O' inicial e final enviados para o escritor de log.")
+        except Exception as ex:
+            # Nem a fila nem o ficheiro de reserva: fica pelo menos no rastreio, com tudo o que é preciso para o repor
+            self.rastreio.mensagem(f"❌ [LOG] Registos 'O' da Encomenda {enc_id} não guardados ({ex}): "
+                                   f"Referencia={referencia} inicio={inicio.isoformat()} fim={fim.isoformat()}", 'erro')
+
+    def _atualizar_linhas_em_lote(self, conn, enc_id: int, produtos_alterados: list, versoes=None,
+                                  prefixo=("", [], [])):
+        """
+        Envia todas as quantidades alteradas num único UPDATE ... FROM (VALUES ...)
+        por lote, em vez de uma ida à BD por produto.
+        Com versoes (modo otimista) cada linha leva também o hash lido.
+        prefixo: (sql, parâmetros, tipos) a enviar só com o primeiro lote (ex: SET LOCK_TIMEOUT).
+        Devolve (linhas pedidas, linhas afetadas).
+        """
+        # Se o mesmo produto aparecer repetido fica a última quantidade
+        novas_qtds = {p['produto_id']: p['nova_qtd'] for p in produtos_alterados}
+        if versoes is None:
+            pares = list(novas_qtds.items())
+            linha_sql, colunas, condicao = "(?, ?)", "Produtold, Qtd", ""
+            tipos_linha = [INTEIRO, INTEIRO]
+        else:
+            pares = [(produto_id, qtd, versoes.linhas.get(produto_id)) for produto_id, qtd in novas_qtds.items()]
+            linha_sql, colunas, condicao = "(?, ?, ?)", "Produtold, Qtd, Versao", f" AND {CONDICAO_LINHA_LOTE_SQL}"
+            tipos_linha = [INTEIRO, INTEIRO, BINARIO]
+        # 3 parâmetros por linha no modo otimista: o lote encolhe para caber nos 2100
+        tamanho_lote = min(self.TAMANHO_LOTE_LINHAS, MAX_PARAMETROS // linha_sql.count("?"))
+        afetadas = 0
+
+        for inicio in range(0, len(pares), tamanho_lote):
+            lote = pares[inicio:inicio + tamanho_lote]
+            valores_sql = ", ".join([linha_sql] * len(lote))
+            (prefixo_sql, params, tipos), prefixo = prefixo, ("", [], [])
+            update_linhas_sql = prefixo_sql + (
+                "UPDATE EncLinha SET Qtd = v.Qtd "
+                f"FROM (VALUES {valores_sql}) AS v({colunas}) "
+                f"WHERE EncLinha.EncId = ? AND EncLinha.Produtold = v.Produtold{condicao}"
+            )
+            params = params + [valor for par in lote for valor in par] + [enc_id]
+            tipos = tipos + tipos_linha * len(lote) + [INTEIRO]
+            # Os lotes completos têm sempre o mesmo texto: só o último (mais curto) é preparado à parte
+            with self.rastreio.span("update_linhas", enc_id=enc_id, lote=len(lote)) as span, \
+                    self.instrucoes.executar(conn, update_linhas_sql, params, tipos) as cursor:
+                span.linhas = cursor.rowcount
+                afetadas += max(cursor.rowcount, 0)
+                self.rastreio.mensagem(f"  > Lote de {len(lote)} produtos enviado ({cursor.rowcount} linhas afetadas).",
+                                       'debug')
+
+        return len(pares), afetadas
+
+    def _produtos_em_falta(self, conn, enc_id: int, produtos_alterados: list):
+        """ Devolve os ProdutoIds pedidos que não existem em EncLinha para esta encomenda. """
+        pedidos = list(dict.fromkeys(p['produto_id'] for p in produtos_alterados))
+        existentes = set()
+
+        for inicio in range(0, len(pedidos), self.TAMANHO_LOTE_LINHAS):
+            lote = pedidos[inicio:inicio + self.TAMANHO_LOTE_LINHAS]
+            select_sql = (
+                "SELECT Produtold FROM EncLinha "
+                f"WHERE EncId = ? AND Produtold IN ({', '.join(['?'] * len(lote))})"
+            )
+            with self.instrucoes.executar(conn, select_sql, [enc_id, *lote], [INTEIRO] * (len(lote) + 1)) as cursor:
+                existentes.update(row[0] for row in cursor.fetchall())
+
+        return [p for p in pedidos if p not in existentes]
@@ -0,0 +1,85 @@
+"""
+Modo otimista da edição: nenhum bloqueio fica preso enquanto o operador edita.
+
+Na leitura, o servidor calcula um SHA-256 (HASHBYTES) do cabeçalho e de cada
+linha nas mesmas linhas que devolve os dados. Na escrita, cada UPDATE só se
+aplica se o hash atual ainda for o lido; se alguma linha afetada faltar, outra sessão
+mudou a encomenda e a transação é revertida como conflito. A UI junta então a
+versão lida (base), as alterações do operador (local) e a versão atual do
+servidor com fundir_edicao (fusão a três).
+"""
+from collections import namedtuple
+
+from db_cache_edit import CabecalhoEncomenda, LinhaEncomenda, VERSAO_CABECALHO_SQL
+from db_sql_edit import versao_sql
+
+
+VERSAO_LINHA_SQL = versao_sql("Designacao", "Preco", "Qtd")
+
+SELECT_CABECALHO_VERSAO_SQL = f"SELECT Nome, Morada, {VERSAO_CABECALHO_SQL} AS Versao FROM Encomenda WHERE EncId = ?"
+SELECT_LINHAS_VERSAO_SQL = (
+    f"SELECT Produtold, Designacao, Preco, Qtd, {VERSAO_LINHA_SQL} AS Versao "
+    "FROM EncLinha WHERE EncId = ? ORDER BY Produtold"
+)
+CONDICAO_CABECALHO_SQL = f"{VERSAO_CABECALHO_SQL} = ?"
+CONDICAO_LINHA_SQL = f"{VERSAO_LINHA_SQL} = ?"
+CONDICAO_LINHA_LOTE_SQL = f"{versao_sql('EncLinha.Designacao', 'EncLinha.Preco', 'EncLinha.Qtd')} = v.Versao"
+
+# Linha lida com SELECT_LINHAS_VERSAO_SQL
+LinhaVersionada = namedtuple("LinhaVersionada", LinhaEncomenda._fields + ("Versao",))
+# cabecalho: hash do cabeçalho; linhas: {Produtold: hash da linha} (bytes)
+VersoesEncomenda = namedtuple("VersoesEncomenda", ["cabecalho", "linhas"])
+# campo: 'Morada' ou o Produtold; servidor=None se a linha já não existe
+Conflito = namedtuple("Conflito", ["campo", "base", "local", "servidor"])
+
+
+def separar_versoes(header, linhas):
+    """ Linhas lidas com SELECT_*_VERSAO_SQL -> (cabeçalho, linhas, VersoesEncomenda). """
+    versoes = VersoesEncomenda(header.Versao, {linha.Produtold: linha.Versao for linha in linhas})
+    header = CabecalhoEncomenda(header.Nome, header.Morada)
+    linhas = [LinhaEncomenda(l.Produtold, l.Designacao, l.Preco, l.Qtd) for l in linhas]
+    return header, linhas, versoes
+
+
+def _fundir_valor(base, local, servidor):
+    """ Devolve (valor fundido, há conflito). Em conflito o valor é o local. """
+    if local == base or local == servidor:
+        return servidor, False
+    if servidor == base:
+        return local, False
+    return local, True
+
+
+def fundir_edicao(base, servidor, nova_morada: str, produtos_alterados: list, preferir_local: bool = True):
+    """
+    Fusão a três das alterações do operador com o que mudou no servidor.
+    base / servidor: (cabeçalho, linhas) lidos antes da edição / depois do conflito.
+    Devolve (nova_morada, produtos_alterados, conflitos). Os valores mudados só de
+    um lado ficam com esse lado; nos conflitos fica o local (ou o do servidor com
+    preferir_local=False). Produtos cujo valor final já é o do servidor saem da lista.
+    """
+    (base_header, base_linhas), (servidor_header, servidor_linhas) = base, servidor
+    qtds_base = {linha.Produtold: linha.Qtd for linha in base_linhas}
+    qtds_servidor = {linha.Produtold: linha.Qtd for linha in servidor_linhas}
+    conflitos = []
+
+    morada, em_conflito = _fundir_valor(base_header.Morada, nova_morada, servidor_header.Morada)
+    if em_conflito:
+        conflitos.append(Conflito('Morada', base_header.Morada, nova_morada, servidor_header.Morada))
+        morada = nova_morada if preferir_local else servidor_header.Morada
+
+    fundidos = []
+    for produto in produtos_alterados:
+        produto_id, qtd_local = produto['produto_id'], produto['nova_qtd']
+        if produto_id not in qtds_servidor:
+            # A linha foi apagada por outra sessão: não há o que atualizar
+            conflitos.append(Conflito(produto_id, qtds_base.get(produto_id), qtd_local, None))
+            continue
+        qtd, em_conflito = _fundir_valor(qtds_base.get(produto_id), qtd_local, qtds_servidor[produto_id])
+        if em_conflito:
+            conflitos.append(Conflito(produto_id, qtds_base.get(produto_id), qtd_local, qtds_servidor[produto_id]))
+            qtd = qtd_local if preferir_local else qtds_servidor[produto_id]
+        if qtd != qtds_servidor[produto_id]:
+            fundidos.append({'produto_id': produto_id, 'nova_qtd': qtd})
+
+    return morada, fundidos, conflitos
@@ -0,0 +1,270 @@
+"""
+Pool de conexões para o motor da Aplicação Edit.
+
+Mantém entre min_conexoes e max_conexoes ligações abertas, valida-as com
+'SELECT 1' antes de as entregar, fecha as que ficam inativas demasiado tempo,
+volta a ligar com backoff exponencial quando a ligação cai e repõe o estado de
+sessão (ex: SET TRANSACTION ISOLATION LEVEL) em cada ligação nova ou religada.
+
+A fábrica de conexões é uma função sem argumentos, por isso o pool funciona
+tanto com pyodbc como com a BD local de testes (db_local_edit).
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from db_rastreio_edit import Rastreador
+
+
+class ErroPool(Exception):
+    """ Não foi possível obter uma conexão (BD inacessível ou pool esgotado). """
+
+
+class _ConexaoPool:
+    """ Conexão guardada no pool e o respetivo estado. """
+
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.criada_em = time.monotonic()
+        self.ultimo_uso = self.criada_em
+        self.versao_estado = 0 # Versão do estado de sessão já aplicada
+
+
+class PoolConexoesEdit:
+
+    def __init__(self, fabrica, min_conexoes: int = 1, max_conexoes: int = 5,
+                 max_inativa_seg: float = 300.0, intervalo_validacao_seg: float = 1.0,
+                 timeout_obter_seg: float = 30.0, tentativas_religar: int = 4,
+                 espera_religar_seg: float = 0.5, sql_teste: str = "SELECT 1", rastreio: Rastreador = None):
+        if min_conexoes < 0 or max_conexoes < 1 or min_conexoes > max_conexoes:
+            raise ValueError("Tamanhos do pool inválidos (0 <= min_conexoes <= max_conexoes, max_conexoes >= 1).")
+
+        self.fabrica = fabrica
+        self.min_conexoes = min_conexoes
+        self.max_conexoes = max_conexoes
+        self.max_inativa_seg = max_inativa_seg
+        # Conexões usadas há menos tempo do que isto não voltam a ser testadas
+        self.intervalo_validacao_seg = intervalo_validacao_seg
+        self.timeout_obter_seg = timeout_obter_seg
+        self.tentativas_religar = tentativas_religar
+        self.espera_religar_seg = espera_religar_seg
+        self.sql_teste = sql_teste
+        # Para onde vão os avisos de validação/religação (o motor passa o seu)
+        self.rastreio = rastreio or Rastreador(ativo=False)
+
+        self._livres = deque()
+        self._em_uso = {}
+        self._total = 0
+        self._cond = threading.Condition()
+        self._fechado = False
+
+        # Estado de sessão reposto em cada conexão: chave -> SQL
+        self._estado_sessao = {}
+        self._versao_estado = 0
+
+        self.saudavel = False
+        # Chamado com cada conexão que o pool fecha (ex: para esquecer os cursores preparados)
+        self.ao_fechar_conexao = None
+        self.estatisticas = {'criadas': 0, 'religacoes': 0, 'falhas_validacao': 0,
+                             'removidas_inativas': 0, 'esperas': 0}
+
+    # --- Ciclo de vida ---
+    def aquecer(self):
+        """ Abre as min_conexoes iniciais. Lança ErroPool se não conseguir abrir nenhuma. """
+        conexoes = [self.obter() for _ in range(max(self.min_conexoes, 1))]
+        for conexao in conexoes:
+            self.devolver(conexao)
+
+    def fechar(self):
+        with self._cond:
+            self._fechado = True
+            livres, self._livres = list(self._livres), deque()
+            self._total -= len(livres)
+            self._cond.notify_all()
+        for item in livres:
+            self._fechar_silenciosamente(item.conexao)
+        self.saudavel = False
+
+    # --- Estado de sessão ---
+    def definir_estado_sessao(self, chave: str, sql: str):
+        """ Regista SQL de sessão a repor em todas as conexões (atuais e futuras). """
+        with self._cond:
+            self._estado_sessao[chave] = sql
+            self._versao_estado += 1
+
+    def sql_estado_sessao(self, *chaves):
+        """
+        SQL registado para estas chaves, para quem repõe o estado no seu próprio batch
+        (ex: a edição junta-o ao COMMIT e a conexão volta ao pool já com o estado por omissão).
+        """
+        with self._cond:
+            return "; ".join(self._estado_sessao[chave] for chave in chaves if chave in self._estado_sessao)
+
+    def marcar_estado_alterado(self, conexao):
+        """
+        Indica que quem tem a conexão mudou o estado de sessão (ex: SET LOCK_TIMEOUT).
+        O estado registado volta a ser reposto quando a conexão for entregue outra vez.
+        """
+        with self._cond:
+            item = self._em_uso.get(id(conexao))
+            if item is not None:
+                item.versao_estado = -1
+
+    def _repor_estado_sessao(self, item: _ConexaoPool):
+        with self._cond:
+            versao, instrucoes = self._versao_estado, list(self._estado_sessao.values())
+        if item.versao_estado == versao:
+            return
+        if instrucoes:
+            # Todas as instruções numa só ida à BD
+            cursor = item.conexao.cursor()
+            try:
+                cursor.execute("; ".join(instrucoes))
+            finally:
+                cursor.close()
+        item.versao_estado = versao
+
+    # --- Obter / devolver ---
+    def obter(self, timeout_seg: float = None):
+        """ Entrega uma conexão validada. Tem de ser devolvida com devolver(). """
+        timeout_seg = self.timeout_obter_seg if timeout_seg is None else timeout_seg
+        limite = time.monotonic() + timeout_seg
+        item = None
+        inativas = []
+
+        try:
+            with self._cond:
+                while True:
+                    if self._fechado:
+                        raise ErroPool("O pool de conexões está fechado.")
+                    inativas.extend(self._remover_inativas())
+                    if self._livres:
+                        item = self._livres.pop() # LIFO: a mais recente tem mais probabilidade de estar viva
+                        break
+                    if self._total < self.max_conexoes:
+                        self._total += 1 # Reserva o lugar; a ligação é aberta fora do lock
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise ErroPool(f"Pool esgotado: {self.max_conexoes} conexões em uso há mais de {timeout_seg}s.")
+                    self.estatisticas['esperas'] += 1
+                    self._cond.wait(restante)
+        finally:
+            # Fechar (e correr ao_fechar_conexao) fora do lock: close() pode bloquear na rede
+            for inativa in inativas:
+                self._fechar_silenciosamente(inativa.conexao)
+
+        try:
+            if item is None:
+                item = _ConexaoPool(self._ligar_com_backoff())
+            elif time.monotonic() - item.ultimo_uso > self.intervalo_validacao_seg and not self._validar(item):
+                self.estatisticas['religacoes'] += 1
+                self._fechar_silenciosamente(item.conexao)
+                item = _ConexaoPool(self._ligar_com_backoff())
+            self._repor_estado_sessao(item)
+        except Exception:
+            if item is not None:
+                self._fechar_silenciosamente(item.conexao)
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._em_uso[id(item.conexao)] = item
+        return item.conexao
+
+    def devolver(self, conexao, descartar: bool = False):
+        """ Devolve a conexão ao pool, desfazendo qualquer transação que tenha ficado aberta. """
+        with self._cond:
+            item = self._em_uso.pop(id(conexao), None)
+        if item is None:
+            return
+
+        if not descartar:
+            try:
+                conexao.rollback()
+            except Exception:
+                descartar = True # A ligação morreu a meio; não volta ao pool
+
+        with self._cond:
+            if descartar or self._fechado:
+                self._total -= 1
+            else:
+                item.ultimo_uso = time.monotonic()
+                self._livres.append(item)
+            self._cond.notify()
+        if descartar or self._fechado:
+            self._fechar_silenciosamente(conexao)
+
+    @contextmanager
+    def conexao(self):
+        """ with pool.conexao() as conn: ... """
+        conexao = self.obter()
+        try:
+            yield conexao
+        finally:
+            self.devolver(conexao)
+
+    def verificar(self):
+        """ Obtém e devolve uma conexão (religando se preciso). Devolve True se a BD responde. """
+        try:
+            self.devolver(self.obter())
+        except ErroPool:
+            return False
+        return self.saudavel
+
+    # --- Auxiliares ---
+    def _validar(self, item: _ConexaoPool):
+        try:
+            cursor = item.conexao.cursor()
+            try:
+                cursor.execute(self.sql_teste)
+                cursor.fetchone()
+            finally:
+                cursor.close()
+            return True
+        except Exception as ex:
+            self.estatisticas['falhas_validacao'] += 1
+            self.rastreio.mensagem(f"⚠️ Conexão do pool falhou a validação ({ex}). A religar...", 'aviso')
+            return False
+
+    def _ligar_com_backoff(self):
+        espera = self.espera_religar_seg
+        ultimo_erro = None
+        for tentativa in range(1, self.tentativas_religar + 1):
+            try:
+                conexao = self.fabrica()
+                self.estatisticas['criadas'] += 1
+                self.saudavel = True
+                return conexao
+            except Exception as ex:
+                ultimo_erro = ex
+                self.rastreio.mensagem(f"❌ Tentativa {tentativa}/{self.tentativas_religar} de ligação falhou: {ex}", 'erro')
+                if tentativa < self.tentativas_religar:
+                    time.sleep(espera)
+                    espera = min(espera * 2, 8.0)
+        self.saudavel = False
+        raise ErroPool(f"Não foi possível ligar à BD após {self.tentativas_religar} tentativas: {ultimo_erro}")
+
+    def _remover_inativas(self):
+        # Chamado com o lock; retira as mais antigas (início da deque) acima do mínimo.
+        # Devolve-as para serem fechadas por quem chamou, já sem o lock.
+        agora = time.monotonic()
+        removidas = []
+        while (self._livres and self._total > self.min_conexoes
+               and agora - self._livres[0].ultimo_uso > self.max_inativa_seg):
+            item = self._livres.popleft()
+            self._total -= 1
+            self.estatisticas['removidas_inativas'] += 1
+            removidas.append(item)
+        return removidas
+
+    def _fechar_silenciosamente(self, conexao):
+        if self.ao_fechar_conexao:
+            self.ao_fechar_conexao(conexao)
+        try:
+            conexao.close()
+        except Exception:
+            pass
@@ -0,0 +1,292 @@
+"""
+Rastreio do motor da Aplicação Edit: tempos por etapa e mensagens.
+
+Cada etapa (ligar, isolamento, leituras, UPDATEs, COMMIT, INSERT do log) corre
+dentro de um span: duração pelo relógio monotónico, nº de linhas e código de
+erro (ex: 1205). Os spans acumulam-se num histograma por nome e são enviados
+às saídas configuradas; as mensagens que antes eram print() também passam por
+aqui, com nível, e cada saída decide o que mostra.
+
+Saídas:
+  - SaidaConsola: as mensagens como antes (por omissão só a partir de 'info',
+    por isso as mensagens por linha/lote, 'debug', deixam de custar I/O);
+  - SaidaJsonLinhas / SaidaFicheiro: um JSON por linha (spans e mensagens);
+  - SaidaOpenTelemetry: spans para um tracer OpenTelemetry (pacote opcional).
+
+Com ativo=False, span() devolve um objeto nulo partilhado: o custo é uma
+chamada e um if.
+"""
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+NIVEIS = {'debug': 10, 'info': 20, 'aviso': 30, 'erro': 40}
+# Limites superiores (ms) dos intervalos dos histogramas; o último intervalo é aberto
+LIMITES_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# "... (1205) (SQLExecDirectW)" -> 1205
+_CODIGO_NATIVO = re.compile(r"\((\d{3,5})\)")
+
+
+def codigo_erro(ex: Exception):
+    """ Código nativo do SQL Server se vier na mensagem, senão o SQLSTATE, senão o nome da exceção. """
+    encontrado = _CODIGO_NATIVO.search(str(ex))
+    if encontrado:
+        return encontrado.group(1)
+    if ex.args and isinstance(ex.args[0], str) and len(ex.args[0]) == 5:
+        return ex.args[0]
+    return type(ex).__name__
+
+
+class Histograma:
+
+    def __init__(self):
+        self.contagens = [0] * (len(LIMITES_MS) + 1)
+        self.n = 0
+        self.erros = 0
+        self.soma_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+
+    def registar(self, duracao_ms: float, erro: bool = False):
+        indice = 0
+        while indice < len(LIMITES_MS) and duracao_ms > LIMITES_MS[indice]:
+            indice += 1
+        self.contagens[indice] += 1
+        self.n += 1
+        self.erros += erro
+        self.soma_ms += duracao_ms
+        self.min_ms = duracao_ms if self.min_ms is None else min(self.min_ms, duracao_ms)
+        self.max_ms = max(self.max_ms, duracao_ms)
+
+    def percentil(self, p: float):
+        """ Limite superior do intervalo onde cai o percentil p (0-100); no último intervalo, o máximo. """
+        if not self.n:
+            return None
+        alvo = p / 100 * self.n
+        acumulado = 0
+        for indice, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo and contagem:
+                return min(LIMITES_MS[indice], self.max_ms) if indice < len(LIMITES_MS) else self.max_ms
+        return self.max_ms
+
+    def resumo(self):
+        return {'n': self.n, 'erros': self.erros,
+                'media_ms': round(self.soma_ms / self.n, 3) if self.n else None,
+                'min_ms': round(self.min_ms, 3) if self.min_ms is not None else None,
+                'max_ms': round(self.max_ms, 3),
+                **{f'p{p}_ms': round(self.percentil(p), 3) if self.n else None for p in (50, 95, 99)}}
+
+
+class Span:
+    """ Etapa em curso. linhas e erro podem ser preenchidos por quem a mede. """
+    __slots__ = ("id", "pai", "nome", "atributos", "linhas", "erro", "inicio_ns")
+
+    def __init__(self, id_span, pai, nome, atributos):
+        self.id = id_span
+        self.pai = pai
+        self.nome = nome
+        self.atributos = atributos
+        self.linhas = None
+        self.erro = None
+        self.inicio_ns = time.time_ns()
+
+    def definir(self, **atributos):
+        self.atributos.update(atributos)
+
+
+class _SpanNulo:
+    """ Span e context manager ao mesmo tempo, partilhado por todos quando o rastreio está desligado. """
+    linhas = None
+    erro = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traceback):
+        return False
+
+    def __setattr__(self, nome, valor):
+        pass # span.linhas = n não guarda nada
+
+    def definir(self, **atributos):
+        pass
+
+
+_SPAN_NULO = _SpanNulo()
+
+
+class Rastreador:
+
+    def __init__(self, saidas: list = None, ativo: bool = True):
+        self.saidas = list(saidas) if saidas is not None else [SaidaConsola()]
+        # Só os spans dependem de 'ativo'; as mensagens vão sempre para as saídas
+        self.ativo = ativo
+        self.histogramas = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    # --- Spans ---
+    def span(self, nome: str, **atributos):
+        """ with rastreio.span("commit") as span: ...  (span.linhas = n para registar linhas) """
+        if not self.ativo:
+            return _SPAN_NULO
+        return self._medir(nome, atributos)
+
+    @contextmanager
+    def _medir(self, nome, atributos):
+        pilha = getattr(self._local, 'pilha', None)
+        if pilha is None:
+            pilha = self._local.pilha = []
+        span = Span(next(self._ids), pilha[-1].id if pilha else None, nome, atributos)
+        for saida in self.saidas:
+            if hasattr(saida, 'iniciar'):
+                saida.iniciar(span)
+        pilha.append(span)
+        inicio = time.perf_counter()
+        try:
+            yield span
+        except Exception as ex:
+            span.erro = codigo_erro(ex)
+            raise
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            pilha.pop()
+            with self._lock:
+                histograma = self.histogramas.get(nome)
+                if histograma is None:
+                    histograma = self.histogramas[nome] = Histograma()
+                histograma.registar(duracao_ms, span.erro is not None)
+            self._emitir({'tipo': 'span', 'id': span.id, 'pai': span.pai, 'nome': nome,
+                          'inicio_ns': span.inicio_ns, 'duracao_ms': round(duracao_ms, 3),
+                          'linhas': span.linhas, 'erro': span.erro, 'atributos': span.atributos,
+                          'thread': threading.current_thread().name})
+
+    def resumo(self):
+        """ {nome da etapa: n, erros, média, mín, máx, p50/p95/p99 em ms} """
+        with self._lock:
+            return {nome: histograma.resumo() for nome, histograma in sorted(self.histogramas.items())}
+
+    def limpar(self):
+        with self._lock:
+            self.histogramas = {}
+
+    # --- Mensagens ---
+    def mensagem(self, texto: str, nivel: str = 'info'):
+        """ Substitui o print(): cada saída mostra a partir do seu nivel_minimo. """
+        valor = NIVEIS[nivel]
+        if not any(saida.nivel_minimo is not None and valor >= NIVEIS[saida.nivel_minimo]
+                   for saida in self.saidas):
+            return
+        self._emitir({'tipo': 'mensagem', 'nivel': nivel, 'texto': texto,
+                      'instante': datetime.now().isoformat(sep=" "),
+                      'thread': threading.current_thread().name})
+
+    def esvaziar(self):
+        for saida in self.saidas:
+            if hasattr(saida, 'esvaziar'):
+                saida.esvaziar()
+
+    def _emitir(self, registo: dict):
+        for saida in self.saidas:
+            try:
+                saida.emitir(registo)
+            except Exception as ex:
+                # Uma saída avariada não pode derrubar uma transação
+                print(f"⚠️ Saída de rastreio {type(saida).__name__} falhou: {ex}", file=sys.stderr)
+
+
+# --- Saídas ---
+class SaidaConsola:
+    """ As mensagens, como os antigos print(); os spans não aparecem. """
+
+    def __init__(self, nivel_minimo: str = 'info', ficheiro=None):
+        self.nivel_minimo = nivel_minimo
+        self.ficheiro = ficheiro
+
+    def emitir(self, registo: dict):
+        if registo['tipo'] == 'mensagem' and NIVEIS[registo['nivel']] >= NIVEIS[self.nivel_minimo]:
+            print(registo['texto'], file=self.ficheiro or sys.stdout)
+
+
+class SaidaJsonLinhas:
+    """ Um objeto JSON por linha (spans e, a partir de nivel_minimo, mensagens). nivel_minimo=None: só spans. """
+
+    def __init__(self, ficheiro=None, nivel_minimo: str = 'info'):
+        self.ficheiro = ficheiro or sys.stdout
+        self.nivel_minimo = nivel_minimo
+        self._lock = threading.Lock()
+
+    def emitir(self, registo: dict):
+        if registo['tipo'] == 'mensagem' and (self.nivel_minimo is None
+                                               or NIVEIS[registo['nivel']] < NIVEIS[self.nivel_minimo]):
+            return
+        linha = json.dumps(registo, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self.ficheiro.write(linha)
+
+    def esvaziar(self):
+        with self._lock:
+            self.ficheiro.flush()
+
+
+class SaidaFicheiro(SaidaJsonLinhas):
+    """ JSON por linha acrescentado a um ficheiro (com buffer: esvaziar()/fechar() escrevem o resto). """
+
+    def __init__(self, caminho: str, nivel_minimo: str = 'info'):
+        super().__init__(open(caminho, "a", encoding="utf-8"), nivel_minimo)
+        self.caminho = caminho
+
+    def fechar(self):
+        with self._lock:
+            self.ficheiro.close()
+
+
+class SaidaOpenTelemetry:
+    """
+    Cada span vira um span OpenTelemetry (com o pai certo), ligado ao tracer dado
+    ou ao global. Precisa do pacote opcional opentelemetry-api; o exportador
+    (OTLP, consola, ...) configura-se no SDK, fora da aplicação.
+    """
+    nivel_minimo = None # As mensagens não vão para aqui
+
+    def __init__(self, tracer=None, nome: str = "app-edit"):
+        try:
+            from opentelemetry import trace
+        except ImportError as ex:
+            raise ImportError("SaidaOpenTelemetry precisa do pacote 'opentelemetry-api' "
+                              "(pip install opentelemetry-api opentelemetry-sdk).") from ex
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer(nome)
+        self._abertos = {} # id do span -> span OpenTelemetry
+
+    def iniciar(self, span: Span):
+        pai = self._abertos.get(span.pai)
+        contexto = self._trace.set_span_in_context(pai) if pai is not None else None
+        self._abertos[span.id] = self.tracer.start_span(
+            span.nome, context=contexto, start_time=span.inicio_ns,
+            attributes={f"edit.{chave}": valor if isinstance(valor, (str, int, float, bool)) else str(valor)
+                        for chave, valor in span.atributos.items() if valor is not None})
+
+    def emitir(self, registo: dict):
+        if registo['tipo'] != 'span':
+            return
+        span = self._abertos.pop(registo['id'], None)
+        if span is None:
+            return
+        for chave, valor in registo['atributos'].items():
+            if valor is not None:
+                span.set_attribute(f"edit.{chave}", valor if isinstance(valor, (str, int, float, bool)) else str(valor))
+        if registo['linhas'] is not None:
+            span.set_attribute("edit.linhas", registo['linhas'])
+        if registo['erro'] is not None:
+            span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, str(registo['erro'])))
+        span.end(end_time=registo['inicio_ns'] + int(registo['duracao_ms'] * 1_000_000))
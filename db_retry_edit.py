@@ -0,0 +1,99 @@
+"""
+Política de repetição para transações que falham por contenção.
+
+Classifica os erros pyodbc pelo SQLSTATE e pelo código nativo do SQL Server e
+repete apenas os transitórios (vítima de deadlock, timeout de bloqueio,
+conflito de SNAPSHOT, ligação perdida) com backoff exponencial com jitter,
+até um número máximo de tentativas e um orçamento de tempo.
+"""
+import random
+import re
+import time
+
+from db_rastreio_edit import Rastreador
+
+
+# Código nativo do SQL Server -> classe do erro
+ERROS_NATIVOS = {
+    1205: 'deadlock',          # Transaction was deadlocked ... chosen as the deadlock victim
+    1222: 'timeout_bloqueio',  # Lock request time out period exceeded (SET LOCK_TIMEOUT)
+    3960: 'conflito_snapshot', # Snapshot isolation transaction aborted due to update conflict
+    10054: 'ligacao',
+    10060: 'ligacao',
+}
+# SQLSTATE (args[0] do pyodbc.Error) -> classe do erro
+SQLSTATES = {
+    '40001': 'deadlock',
+    'HYT00': 'timeout_bloqueio',
+    '08S01': 'ligacao',
+    '08001': 'ligacao',
+}
+TRANSITORIOS = {'deadlock', 'timeout_bloqueio', 'conflito_snapshot', 'ligacao'}
+
+_CODIGO_NATIVO = re.compile(r"\((\d{3,5})\)")
+
+
+def classificar_erro(ex: Exception):
+    """ Devolve 'deadlock', 'timeout_bloqueio', 'conflito_snapshot', 'ligacao' ou 'permanente'. """
+    mensagem = str(ex)
+    for codigo in _CODIGO_NATIVO.findall(mensagem):
+        if int(codigo) in ERROS_NATIVOS:
+            return ERROS_NATIVOS[int(codigo)]
+    sqlstate = ex.args[0] if ex.args and isinstance(ex.args[0], str) else None
+    return SQLSTATES.get(sqlstate, 'permanente')
+
+
+class PoliticaRepeticao:
+
+    def __init__(self, max_tentativas: int = 4, espera_base_seg: float = 0.05, espera_max_seg: float = 2.0,
+                 orcamento_seg: float = 15.0, lock_timeout_ms: int = 5000, rastreio: Rastreador = None):
+        self.max_tentativas = max_tentativas
+        self.espera_base_seg = espera_base_seg
+        self.espera_max_seg = espera_max_seg
+        # Tempo total (desde a 1ª tentativa) a partir do qual já não se repete
+        self.orcamento_seg = orcamento_seg
+        # SET LOCK_TIMEOUT aplicado a cada transação (-1 = esperar indefinidamente)
+        self.lock_timeout_ms = lock_timeout_ms
+        # Para onde vão os avisos de repetição (o motor passa o seu)
+        self.rastreio = rastreio or Rastreador(ativo=False)
+        self.estatisticas = {'tentativas': 0, 'repeticoes': 0, 'desistencias': 0,
+                             'deadlock': 0, 'timeout_bloqueio': 0, 'conflito_snapshot': 0, 'ligacao': 0}
+
+    def espera(self, tentativa: int):
+        """ Backoff exponencial com 'full jitter' (evita que as vítimas voltem a colidir). """
+        return random.uniform(0, min(self.espera_max_seg, self.espera_base_seg * 2 ** (tentativa - 1)))
+
+    def deve_repetir(self, ex: Exception, tentativa: int, inicio: float):
+        """
+        Decide, depois do ROLLBACK da tentativa falhada, se vale a pena repetir.
+        Se sim, já esperou o backoff quando retorna True. inicio: time.monotonic() da 1ª tentativa.
+        """
+        classe = classificar_erro(ex)
+        if classe in self.estatisticas:
+            self.estatisticas[classe] += 1
+        if classe not in TRANSITORIOS:
+            return False
+
+        espera = self.espera(tentativa)
+        if tentativa >= self.max_tentativas or time.monotonic() - inicio + espera > self.orcamento_seg:
+            self.estatisticas['desistencias'] += 1
+            return False
+
+        self.estatisticas['repeticoes'] += 1
+        self.rastreio.mensagem(f"⚠️ Erro transitório ({classe}) na tentativa {tentativa}/{self.max_tentativas}. "
+                               f"A repetir dentro de {espera * 1000:.0f} ms...", 'aviso')
+        time.sleep(espera)
+        return True
+
+    def executar(self, funcao, *args, **kwargs):
+        """ Chama funcao(*args, tentativa=n, **kwargs) até ter sucesso ou o erro deixar de ser transitório. """
+        inicio = time.monotonic()
+        tentativa = 1
+        while True:
+            self.estatisticas['tentativas'] += 1
+            try:
+                return funcao(*args, tentativa=tentativa, **kwargs)
+            except Exception as ex:
+                if not self.deve_repetir(ex, tentativa, inicio):
+                    raise
+            tentativa += 1
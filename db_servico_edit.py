@@ -0,0 +1,236 @@
+"""
+Linha de comandos e serviço do motor da Aplicação Edit, sem interface gráfica.
+
+Não importa tkinter e só carrega o motor (pyodbc, pool, log) depois de ler os
+argumentos, por isso arranca depressa e corre num servidor sem ecrã:
+
+    python -m db_servico_edit ler 1 --bd-local /tmp/bd_edit.sqlite
+    python -m db_servico_edit editar 1 --morada "Rua X" --qtd 3=10 --qtd 4=2 --server 192.168.100.14,1433
+    python -m db_servico_edit servir --bd-local /tmp/bd_edit.sqlite          (trabalhos no stdin)
+    python -m db_servico_edit servir --porta 8765 --server 192.168.100.14,1433 (socket local, 127.0.0.1)
+
+No modo servir cada trabalho é um objeto JSON numa linha, e a resposta também:
+    {"id": 1, "op": "ler", "enc_id": 1}
+    {"id": 2, "op": "editar", "enc_id": 1, "nova_morada": "Rua X",
+     "produtos_alterados": [{"produto_id": 3, "nova_qtd": 10}]}
+    {"id": 3, "op": "isolamento", "nivel": "SNAPSHOT"}
+    {"id": 4, "op": "estado"}
+    {"id": 5, "op": "ler_varias", "enc_ids": [1, 2, 3]}   (ou "de": 1, "ate": 100)
+ -> {"id": 2, "ok": true, "resultado": {...}}  ou  {"id": 2, "ok": false, "erro": "..."}
+As mensagens do motor vão para o stderr: o stdout só leva respostas.
+"""
+import argparse
+import getpass
+import io
+import json
+import os
+import signal
+import sys
+import time
+
+# Relógio do arranque: o serviço diz quanto tempo levou até aceitar trabalhos
+_ARRANQUE = time.perf_counter()
+
+
+# --- Trabalhos ---
+
+def executar_trabalho(db, trabalho: dict):
+    """ Executa um trabalho {'op': ..., ...} e devolve a resposta (nunca lança exceções). """
+    resposta = {'id': trabalho.get('id')} if isinstance(trabalho, dict) else {'id': None}
+    try:
+        op = trabalho.get('op') if isinstance(trabalho, dict) else None
+        operacao = OPERACOES.get(op)
+        if operacao is None:
+            raise ValueError(f"Operação desconhecida: {op!r} (disponíveis: {', '.join(OPERACOES)})")
+        resultado = operacao(db, trabalho)
+        resposta['ok'] = True
+        resposta['resultado'] = resultado
+    except Exception as ex:
+        resposta['ok'] = False
+        resposta['erro'] = str(ex)
+    return resposta
+
+
+def _ler(db, trabalho: dict):
+    from db_cache_edit import CabecalhoEncomenda, LinhaEncomenda
+    header, linhas = db.fetch_encomenda_data(int(trabalho['enc_id']), usar_cache=trabalho.get('usar_cache', True))
+    return {'cabecalho': dict(zip(CabecalhoEncomenda._fields, header)),
+            'linhas': [dict(zip(LinhaEncomenda._fields, linha)) for linha in linhas]}
+
+
+def _ler_varias(db, trabalho: dict):
+    # Uma ida à BD por bloco de encomendas, em vez de uma por encomenda
+    from db_cache_edit import CabecalhoEncomenda, LinhaEncomenda
+    enc_ids = [int(e) for e in trabalho['enc_ids']] if trabalho.get('enc_ids') is not None else None
+    encomendas = db.fetch_encomendas(enc_ids, de=trabalho.get('de'), ate=trabalho.get('ate'),
+                                     usar_cache=trabalho.get('usar_cache', True))
+    return [{'enc_id': enc_id, 'cabecalho': dict(zip(CabecalhoEncomenda._fields, header)),
+             'linhas': [dict(zip(LinhaEncomenda._fields, linha)) for linha in linhas]}
+            for enc_id, (header, linhas) in encomendas.items()]
+
+
+def _editar(db, trabalho: dict):
+    produtos = [{'produto_id': int(p['produto_id']), 'nova_qtd': int(p['nova_qtd'])}
+                for p in trabalho.get('produtos_alterados', [])]
+    resultado = db.editar_encomenda(int(trabalho['enc_id']), trabalho.get('nova_morada'), produtos,
+                                    em_lote=trabalho.get('em_lote', True))
+    if resultado is None:
+        # A razão veio pela notificação (nesta thread), não pelo retorno
+        notificacao = db.ultima_notificacao()
+        raise RuntimeError(notificacao[2] if notificacao else "A transação foi revertida (ROLLBACK).")
+    return resultado
+
+
+def _isolamento(db, trabalho: dict):
+    if not db.set_isolation(trabalho['nivel']):
+        raise RuntimeError(f"Não foi possível definir o nível de isolamento {trabalho['nivel']}.")
+    return {'nivel': db.NIVEL_ISOLAMENTO_ATUAL}
+
+
+def _estado(db, trabalho: dict):
+    return {'ligado': db.is_connected, 'servidor': db.SERVER_NAME, 'isolamento': db.NIVEL_ISOLAMENTO_ATUAL,
+            'pool': dict(db.pool.estatisticas) if db.pool else None,
+            'repeticoes': dict(db.politica_repeticao.estatisticas),
+            'instrucoes': dict(db.instrucoes.estatisticas),
+            'etapas': db.rastreio.resumo()}
+
+
+OPERACOES = {'ler': _ler, 'ler_varias': _ler_varias, 'editar': _editar, 'isolamento': _isolamento, 'estado': _estado}
+
+
+# --- Modo servir ---
+
+def servir_fluxo(db, entrada, saida):
+    """ Lê trabalhos JSON por linha de entrada e escreve as respostas em saida, pela mesma ordem. """
+    for linha in entrada:
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            trabalho = json.loads(linha)
+        except ValueError as ex:
+            resposta = {'id': None, 'ok': False, 'erro': f"JSON inválido: {ex}"}
+        else:
+            resposta = executar_trabalho(db, trabalho)
+        saida.write(json.dumps(resposta, ensure_ascii=False, default=str) + "\n")
+        saida.flush()
+
+
+def servir_socket(db, porta: int):
+    """ Um cliente por thread (o motor partilha o pool entre elas). Só escuta em 127.0.0.1. """
+    import socketserver
+
+    class _Cliente(socketserver.StreamRequestHandler):
+        def handle(self):
+            entrada = io.TextIOWrapper(self.rfile, encoding="utf-8")
+            saida = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+            servir_fluxo(db, entrada, saida)
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    with socketserver.ThreadingTCPServer(("127.0.0.1", porta), _Cliente) as servidor:
+        servidor.daemon_threads = True
+        db.rastreio.mensagem(f"✅ Serviço pronto em 127.0.0.1:{servidor.server_address[1]} "
+                             f"({(time.perf_counter() - _ARRANQUE) * 1000:.0f} ms desde o arranque)")
+        try:
+            servidor.serve_forever()
+        except KeyboardInterrupt:
+            db.rastreio.mensagem("Serviço interrompido.")
+
+
+# --- Linha de comandos ---
+
+def _par_qtd(texto: str):
+    try:
+        produto_id, nova_qtd = texto.split("=")
+        return {'produto_id': int(produto_id), 'nova_qtd': int(nova_qtd)}
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"esperado PRODUTO=QTD, recebido {texto!r}") from None
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(prog="python -m db_servico_edit", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default="192.168.100.14,1433")
+    parser.add_argument("--database", default="SGBD_PL1_02")
+    parser.add_argument("--user", default="User_SGBD_PL1_02")
+    parser.add_argument("--bd-local", help="usar a BD local de testes (ficheiro SQLite) em vez do SQL Server")
+    parser.add_argument("--isolamento", default="READ COMMITTED")
+    parser.add_argument("--lock-timeout-ms", type=int, help="SET LOCK_TIMEOUT de cada edição")
+    parser.add_argument("--max-conexoes", type=int, default=5)
+    parser.add_argument("--rastreio", metavar="FICHEIRO", help="gravar os tempos por etapa (JSON por linha) neste ficheiro")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    ler = comandos.add_parser("ler", help="mostra uma encomenda (JSON)")
+    ler.add_argument("enc_id", type=int)
+
+    editar = comandos.add_parser("editar", help="edita uma encomenda numa transação")
+    editar.add_argument("enc_id", type=int)
+    editar.add_argument("--morada", help="nova morada (omitir para não mudar o cabeçalho)")
+    editar.add_argument("--qtd", type=_par_qtd, action="append", default=[], metavar="PRODUTO=QTD")
+
+    servir = comandos.add_parser("servir", help="serviço: trabalhos JSON por linha no stdin ou num socket local")
+    servir.add_argument("--porta", type=int, help="escutar em 127.0.0.1:PORTA em vez do stdin (0 = porta livre)")
+    return parser
+
+
+def ligar(args):
+    """ Cria e liga o motor (importado só aqui). Devolve o DbConnectionEdit ou None. """
+    from db_backend_edit import BackendSQLite, BackendSqlServer
+    from db_motor_edit import DbConnectionEdit
+
+    from db_rastreio_edit import SaidaConsola, SaidaFicheiro
+
+    db = DbConnectionEdit()
+    # As mensagens do motor, do pool e do serviço vão para o stderr; o stdout fica só com os resultados
+    db.rastreio.saidas = [SaidaConsola(ficheiro=sys.stderr)]
+    if args.rastreio:
+        db.rastreio.saidas.append(SaidaFicheiro(args.rastreio))
+        db.rastreio.ativo = True
+    if args.lock_timeout_ms is not None:
+        db.politica_repeticao.lock_timeout_ms = args.lock_timeout_ms
+
+    if args.bd_local:
+        backend = BackendSQLite(args.bd_local)
+    else:
+        password = os.environ.get("SGBD_PASSWORD") or getpass.getpass(f"Password de {args.user}: ")
+        backend = BackendSqlServer(args.server, args.database, args.user, password, driver=db.DRIVER)
+    if not db.ligar(backend, max_conexoes=args.max_conexoes) or not db.set_isolation(args.isolamento):
+        db.fechar()
+        return None
+    return db
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    saida = sys.stdout
+    db = ligar(args)
+    if db is None:
+        return 1
+    try:
+        if args.comando == "servir":
+            # SIGTERM (ex: systemd a parar o serviço) sai como Ctrl+C: o log pendente é escrito no fecho
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+            if args.porta is not None:
+                servir_socket(db, args.porta)
+            else:
+                db.rastreio.mensagem(f"✅ Serviço pronto no stdin ({(time.perf_counter() - _ARRANQUE) * 1000:.0f} ms desde o arranque)")
+                try:
+                    servir_fluxo(db, sys.stdin, saida)
+                except KeyboardInterrupt:
+                    db.rastreio.mensagem("Serviço interrompido.")
+            return 0
+
+        if args.comando == "ler":
+            trabalho = {'op': 'ler', 'enc_id': args.enc_id}
+        else:
+            trabalho = {'op': 'editar', 'enc_id': args.enc_id, 'nova_morada': args.morada,
+                        'produtos_alterados': args.qtd}
+        resposta = executar_trabalho(db, trabalho)
+        saida.write(json.dumps(resposta, ensure_ascii=False, default=str, indent=2) + "\n")
+        return 0 if resposta['ok'] else 2
+    finally:
+        db.fechar() # Escreve os registos de log que ainda estão na fila
+
+
+if __name__ == '__main__':
+    sys.exit(main())
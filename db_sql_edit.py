@@ -0,0 +1,57 @@
+"""
+Auxiliares de SQL partilhados pelo motor, pela edição em massa e pelo log.
+"""
+
+# Limite de 2100 parâmetros por instrução e de 1000 linhas por VALUES no SQL Server
+MAX_PARAMETROS = 2000
+MAX_LINHAS_VALUES = 1000
+
+
+def _executar_por_blocos(cursor, modelo_sql: str, linhas: list, linha_sql: str):
+    # Um execute por bloco; quem chama lê o resultado de cada um no cursor
+    n_colunas = linha_sql.count("?")
+    por_bloco = min(MAX_LINHAS_VALUES, MAX_PARAMETROS // n_colunas)
+    for inicio in range(0, len(linhas), por_bloco):
+        bloco = linhas[inicio:inicio + por_bloco]
+        cursor.execute(modelo_sql.format(valores=", ".join([linha_sql] * len(bloco))),
+                       *[valor for linha in bloco for valor in linha])
+        yield
+
+
+def executar_values(cursor, modelo_sql: str, linhas: list, linha_sql: str):
+    """
+    Executa modelo_sql com {valores} preenchido com linha_sql repetida por cada
+    linha, em blocos que respeitam os limites do SQL Server.
+    Devolve o total de linhas afetadas.
+    """
+    return sum(max(cursor.rowcount, 0) for _ in _executar_por_blocos(cursor, modelo_sql, linhas, linha_sql))
+
+
+def consultar_values(cursor, modelo_sql: str, linhas: list, linha_sql: str):
+    """ Como executar_values, para um SELECT sobre (VALUES {valores}): devolve as linhas lidas de todos os blocos. """
+    return [linha for _ in _executar_por_blocos(cursor, modelo_sql, linhas, linha_sql) for linha in cursor.fetchall()]
+
+
+def _valores_versao_sql(colunas):
+    # Cada valor vai precedido do seu comprimento: NULL, '' e textos que contenham o separador
+    # não dão a mesma sequência de bytes
+    return "CONCAT(" + ", NCHAR(31), ".join(f"DATALENGTH({coluna}), NCHAR(31), {coluna}" for coluna in colunas) + ")"
+
+
+def versao_sql(*colunas):
+    """
+    Versão de uma linha calculada no servidor: SHA-256 dos valores das colunas.
+    Ao contrário de CHECKSUM, distingue textos que só diferem em maiúsculas/acentos
+    (a collation não entra) e não tem colisões na prática.
+    """
+    return f"HASHBYTES('SHA2_256', {_valores_versao_sql(colunas)})"
+
+
+def versao_agregada_sql(colunas, ordem: str):
+    """
+    Versão de um conjunto de linhas (ex: todas as EncLinha de uma encomenda): SHA-256
+    dos valores de todas as linhas, pela ordem de 'ordem'. STRING_AGG ... WITHIN GROUP
+    exige SQL Server 2017 ou posterior.
+    """
+    return (f"HASHBYTES('SHA2_256', STRING_AGG(CAST({_valores_versao_sql(colunas)} AS nvarchar(max)), NCHAR(30)) "
+            f"WITHIN GROUP (ORDER BY {ordem}))")
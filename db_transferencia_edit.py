@@ -0,0 +1,484 @@
+"""
+Exportação e importação de intervalos de encomendas (Encomenda + EncLinha).
+
+Exportar: o intervalo de EncIds é dividido em partes e cada parte é lida numa
+conexão do pool, com fetchmany em blocos de tamanho_bloco, e escrita à medida
+que chega (a memória não cresce com o intervalo). Cada parte dá um ficheiro por
+tabela na pasta de destino, ex: Encomenda-000.csv + EncLinha-000.csv. Os
+ficheiros são escritos com o sufixo .parcial e só mudam de nome quando todas as
+partes terminam: uma exportação falhada não deixa ficheiros que pareçam completos.
+
+Importar: cada par de ficheiros é carregado, também por blocos, em tabelas
+#temporárias (executemany com fast_executemany) e depois aplicado de uma vez:
+UPDATE ... FROM das linhas que mudaram e INSERT ... SELECT das que faltam (e,
+com apagar_em_falta, DELETE das linhas de EncLinha das encomendas importadas
+que não vêm no ficheiro). Uma transação por parte; cada encomenda que a parte
+realmente muda leva o seu par de registos 'O' em LogOperations, pelo escritor
+de log do motor.
+
+As partes são independentes (intervalos de EncId disjuntos), por isso as duas
+direções correm em paralelo, uma thread por parte até paralelo threads (no
+máximo max_conexoes do pool).
+
+Formatos: csv (sempre), parquet e arrow (Arrow IPC), estes dois com o pacote
+opcional pyarrow. No CSV um campo vazio é NULL. O Preco é sempre Decimal
+(decimal128(18, 4) em Arrow, o texto do Decimal em CSV): nunca passa por float.
+
+Exemplos:
+    python db_transferencia_edit.py exportar /tmp/dump --bd-local /tmp/bd_edit.sqlite --partes 4 --formato parquet
+    python db_transferencia_edit.py importar /tmp/dump --server 192.168.100.14,1433 --paralelo 4
+Se EncId for IDENTITY no servidor, as encomendas novas precisam de SET IDENTITY_INSERT
+(as que já existem são só atualizadas).
+"""
+import argparse
+import csv
+import getpass
+import glob
+import json
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+from db_backend_edit import BackendSQLite, BackendSqlServer
+from db_motor_edit import DbConnectionEdit, gerar_referencia
+from db_pool_edit import ErroPool
+
+
+def _decimal(valor):
+    """ Preco exato: o SQL Server já devolve Decimal; float (BD local) e texto (CSV) passam pela forma decimal. """
+    return valor if isinstance(valor, Decimal) else Decimal(str(valor))
+
+
+# colunas: (nome, conversão do texto CSV); chave: colunas da chave primária
+Tabela = namedtuple("Tabela", ["nome", "colunas", "chave", "colunas_sql"])
+
+ENCOMENDA = Tabela("Encomenda", (("EncId", int), ("Nome", str), ("Morada", str)), ("EncId",),
+                   "EncId int PRIMARY KEY, Nome nvarchar(4000), Morada nvarchar(4000)")
+ENC_LINHA = Tabela("EncLinha", (("EncId", int), ("Produtold", int), ("Designacao", str), ("Preco", _decimal), ("Qtd", int)),
+                   ("EncId", "Produtold"),
+                   "EncId int, Produtold int, Designacao nvarchar(4000), Preco decimal(18, 4), Qtd int, "
+                   "PRIMARY KEY (EncId, Produtold)")
+TABELAS = (ENCOMENDA, ENC_LINHA)
+
+FORMATOS = ("csv", "parquet", "arrow")
+# Encomenda-003.parquet -> parte 3
+_NOME_PARTE = re.compile(r"^(Encomenda|EncLinha)-(\d+)\.(csv|parquet|arrow)$")
+# Ficheiros ainda a ser escritos (não correspondem a _NOME_PARTE, por isso importar ignora-os)
+SUFIXO_PARCIAL = ".parcial"
+
+
+def _nomes(tabela: Tabela):
+    return [nome for nome, _ in tabela.colunas]
+
+
+def _caminho_parte(pasta: str, tabela: Tabela, numero: int, formato: str):
+    return os.path.join(pasta, f"{tabela.nome}-{numero:03d}.{formato}")
+
+
+def dividir_intervalo(inicio: int, fim: int, partes: int):
+    """ [(de, ate), ...] contíguos e disjuntos que cobrem inicio..fim (inclusive). """
+    partes = max(1, min(partes, fim - inicio + 1))
+    passo, resto = divmod(fim - inicio + 1, partes)
+    intervalos = []
+    de = inicio
+    for i in range(partes):
+        ate = de + passo - 1 + (1 if i < resto else 0)
+        intervalos.append((de, ate))
+        de = ate + 1
+    return intervalos
+
+
+# --- Ficheiros ---
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as ex:
+        raise ImportError("Os formatos parquet/arrow precisam do pacote 'pyarrow' (pip install pyarrow).") from ex
+    return pyarrow
+
+
+def _esquema_arrow(pa, tabela: Tabela):
+    tipos = {int: pa.int32(), str: pa.string(), _decimal: pa.decimal128(18, 4)}
+    return pa.schema([(nome, tipos[tipo]) for nome, tipo in tabela.colunas])
+
+
+class EscritorCsv:
+
+    def __init__(self, caminho: str, tabela: Tabela):
+        self._ficheiro = open(caminho, "w", encoding="utf-8", newline="")
+        self._csv = csv.writer(self._ficheiro)
+        self._csv.writerow(_nomes(tabela))
+
+    def escrever(self, linhas: list):
+        self._csv.writerows(linhas)
+
+    def fechar(self):
+        self._ficheiro.close()
+
+
+class EscritorArrow:
+    """ Parquet (um row group por bloco) ou Arrow IPC (um record batch por bloco). """
+
+    def __init__(self, caminho: str, tabela: Tabela, formato: str):
+        pa = self._pa = _pyarrow()
+        self._esquema = _esquema_arrow(pa, tabela)
+        self._conversoes = [tipo for _, tipo in tabela.colunas]
+        if formato == "parquet":
+            self._escritor = pa.parquet.ParquetWriter(caminho, self._esquema)
+        else:
+            self._escritor = pa.ipc.new_file(caminho, self._esquema)
+
+    def escrever(self, linhas: list):
+        # Preco fica Decimal (decimal128): o float da BD local é convertido pelo seu texto
+        colunas = [[None if valor is None else conversao(valor) for valor in coluna]
+                   for conversao, coluna in zip(self._conversoes, zip(*linhas))]
+        self._escritor.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(coluna, tipo) for coluna, tipo in zip(colunas, self._esquema.types)],
+            schema=self._esquema))
+
+    def fechar(self):
+        self._escritor.close()
+
+
+def abrir_escritor(caminho: str, tabela: Tabela, formato: str):
+    if formato == "csv":
+        return EscritorCsv(caminho, tabela)
+    return EscritorArrow(caminho, tabela, formato)
+
+
+def ler_blocos(caminho: str, tabela: Tabela, tamanho_bloco: int):
+    """ Gera listas de até tamanho_bloco tuplos (pela ordem das colunas da tabela), sem ler o ficheiro todo. """
+    if caminho.endswith(".csv"):
+        with open(caminho, encoding="utf-8", newline="") as ficheiro:
+            leitor = csv.reader(ficheiro)
+            cabecalho = next(leitor)
+            if cabecalho != _nomes(tabela):
+                raise ValueError(f"{caminho}: colunas {cabecalho}, esperadas {_nomes(tabela)}")
+            conversoes = [tipo for _, tipo in tabela.colunas]
+            bloco = []
+            for linha in leitor:
+                bloco.append(tuple(conversao(valor) if valor != "" else None
+                                   for conversao, valor in zip(conversoes, linha)))
+                if len(bloco) >= tamanho_bloco:
+                    yield bloco
+                    bloco = []
+            if bloco:
+                yield bloco
+        return
+
+    pa = _pyarrow()
+    if caminho.endswith(".parquet"):
+        lotes = pa.parquet.ParquetFile(caminho).iter_batches(batch_size=tamanho_bloco, columns=_nomes(tabela))
+    else:
+        leitor = pa.ipc.open_file(caminho)
+        lotes = (leitor.get_batch(i) for i in range(leitor.num_record_batches))
+    for lote in lotes:
+        colunas = [lote.column(nome).to_pylist() for nome in _nomes(tabela)]
+        linhas = list(zip(*colunas))
+        for inicio in range(0, len(linhas), tamanho_bloco):
+            yield linhas[inicio:inicio + tamanho_bloco]
+
+
+# --- Exportação ---
+
+def _exportar_tabela(conn, tabela: Tabela, de: int, ate: int, caminho: str, formato: str, tamanho_bloco: int):
+    select_sql = (f"SELECT {', '.join(_nomes(tabela))} FROM {tabela.nome} "
+                  f"WHERE EncId BETWEEN ? AND ? ORDER BY {', '.join(tabela.chave)}")
+    escritor = abrir_escritor(caminho, tabela, formato)
+    total = 0
+    cursor = conn.cursor()
+    try:
+        cursor.arraysize = tamanho_bloco
+        cursor.execute(select_sql, de, ate)
+        while True:
+            bloco = cursor.fetchmany(tamanho_bloco)
+            if not bloco:
+                break
+            escritor.escrever([tuple(linha) for linha in bloco])
+            total += len(bloco)
+    finally:
+        cursor.close()
+        escritor.fechar()
+    return total
+
+
+def _exportar_parte(db, numero: int, de: int, ate: int, pasta: str, formato: str, tamanho_bloco: int):
+    inicio = time.perf_counter()
+    linhas = {}
+    with db.rastreio.span("exportar_parte", parte=numero, de=de, ate=ate) as span, db.pool.conexao() as conn:
+        for tabela in TABELAS:
+            caminho = _caminho_parte(pasta, tabela, numero, formato) + SUFIXO_PARCIAL
+            linhas[tabela.nome] = _exportar_tabela(conn, tabela, de, ate, caminho, formato, tamanho_bloco)
+        span.linhas = sum(linhas.values())
+    return {'parte': numero, 'de': de, 'ate': ate, 'linhas': linhas,
+            'duracao_seg': round(time.perf_counter() - inicio, 3)}
+
+
+def exportar(db, pasta: str, formato: str = "csv", de: int = None, ate: int = None, partes: int = 1,
+             paralelo: int = None, tamanho_bloco: int = 5000):
+    """
+    Exporta as encomendas de..ate (por omissão todas) para pasta, em partes ficheiros por tabela.
+    Devolve um relatório com as linhas por tabela, a duração e o débito (linhas/s).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato} (disponíveis: {', '.join(FORMATOS)})")
+    if formato != "csv":
+        _pyarrow() # Falha já, antes de abrir conexões e criar ficheiros
+    if de is None or ate is None:
+        with db.pool.conexao() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MIN(EncId), MAX(EncId) FROM Encomenda")
+            minimo, maximo = cursor.fetchone()
+            cursor.close()
+        de = minimo if de is None else de
+        ate = maximo if ate is None else ate
+    os.makedirs(pasta, exist_ok=True)
+    if de is None or ate is None or de > ate:
+        return _relatorio([], 0.0, partes=0)
+
+    intervalos = dividir_intervalo(de, ate, partes)
+    finais = [_caminho_parte(pasta, tabela, numero, formato) for numero in range(len(intervalos)) for tabela in TABELAS]
+    inicio = time.perf_counter()
+    try:
+        # Cada parte ocupa uma conexão: mais threads do que o pool só ficariam à espera
+        with ThreadPoolExecutor(max_workers=min(paralelo or len(intervalos), db.pool.max_conexoes),
+                                thread_name_prefix="exportar") as executor:
+            resultados = list(executor.map(
+                lambda parte: _exportar_parte(db, parte[0], *parte[1], pasta, formato, tamanho_bloco),
+                enumerate(intervalos)))
+    except BaseException:
+        for caminho in finais:
+            if os.path.exists(caminho + SUFIXO_PARCIAL):
+                os.remove(caminho + SUFIXO_PARCIAL)
+        raise
+    for caminho in finais:
+        os.replace(caminho + SUFIXO_PARCIAL, caminho)
+    return _relatorio(resultados, time.perf_counter() - inicio, partes=len(intervalos), de=de, ate=ate)
+
+
+# --- Importação ---
+
+def _merge_sql(tabela: Tabela, apagar_em_falta: bool):
+    """ Instruções set-based de #{tabela}Carga para a tabela: [(chave, sql), ...]. """
+    carga = f"#{tabela.nome}Carga"
+    juncao = " AND ".join(f"{tabela.nome}.{c} = s.{c}" for c in tabela.chave)
+    valores = [nome for nome in _nomes(tabela) if nome not in tabela.chave]
+    instrucoes = [
+        # Só as linhas que mudaram (EXCEPT compara NULLs como iguais)
+        ('atualizadas',
+         f"UPDATE {tabela.nome} SET {', '.join(f'{c} = s.{c}' for c in valores)} "
+         f"FROM {carga} AS s WHERE {juncao} AND EXISTS ("
+         f"SELECT {', '.join(f's.{c}' for c in valores)} "
+         f"EXCEPT SELECT {', '.join(f'{tabela.nome}.{c}' for c in valores)})"),
+        ('inseridas',
+         f"INSERT INTO {tabela.nome} ({', '.join(_nomes(tabela))}) "
+         f"SELECT {', '.join(f's.{c}' for c in _nomes(tabela))} FROM {carga} AS s "
+         f"WHERE NOT EXISTS (SELECT 1 FROM {tabela.nome} WHERE {juncao})"),
+    ]
+    if apagar_em_falta and tabela is ENC_LINHA:
+        instrucoes.append(
+            ('apagadas',
+             f"DELETE FROM EncLinha WHERE EncId IN (SELECT EncId FROM #EncomendaCarga) "
+             f"AND NOT EXISTS (SELECT 1 FROM {carga} AS s WHERE {juncao})"))
+    return instrucoes
+
+
+def _afetadas_sql(apagar_em_falta: bool):
+    """ EncIds que o merge vai mudar (linhas novas, diferentes ou, com apagar_em_falta, a apagar). """
+    consultas = []
+    for tabela in TABELAS:
+        juncao = " AND ".join(f"{tabela.nome}.{c} = s.{c}" for c in tabela.chave)
+        valores = [nome for nome in _nomes(tabela) if nome not in tabela.chave]
+        # Sem linha igual no destino (INTERSECT compara NULLs como iguais): nova ou mudou
+        consultas.append(
+            f"SELECT s.EncId FROM #{tabela.nome}Carga AS s WHERE NOT EXISTS ("
+            f"SELECT {', '.join(f's.{c}' for c in valores)} "
+            f"INTERSECT SELECT {', '.join(f'{tabela.nome}.{c}' for c in valores)} FROM {tabela.nome} WHERE {juncao})")
+    if apagar_em_falta:
+        consultas.append(
+            "SELECT EncId FROM EncLinha WHERE EncId IN (SELECT EncId FROM #EncomendaCarga) "
+            "AND NOT EXISTS (SELECT 1 FROM #EncLinhaCarga AS s WHERE EncLinha.EncId = s.EncId "
+            "AND EncLinha.Produtold = s.Produtold)")
+    return " UNION ".join(consultas)
+
+
+def _importar_parte(db, numero: int, ficheiros: dict, tamanho_bloco: int, apagar_em_falta: bool):
+    inicio = time.perf_counter()
+    linhas, contagens = {}, {}
+    conn = db.pool.obter()
+    descartar = False
+    try:
+        with db.rastreio.span("importar_parte", parte=numero) as span:
+            cursor = conn.cursor()
+            try:
+                for tabela in TABELAS:
+                    carga = f"#{tabela.nome}Carga"
+                    cursor.execute(f"DROP TABLE IF EXISTS {carga}")
+                    cursor.execute(f"CREATE TABLE {carga} ({tabela.colunas_sql})")
+                    inserir_sql = f"INSERT INTO {carga} VALUES ({', '.join(['?'] * len(tabela.colunas))})"
+                    cursor.fast_executemany = True # Um envio por bloco em vez de uma ida à BD por linha
+                    linhas[tabela.nome] = 0
+                    for bloco in ler_blocos(ficheiros[tabela.nome], tabela, tamanho_bloco):
+                        cursor.executemany(inserir_sql, bloco)
+                        linhas[tabela.nome] += len(bloco)
+
+                # As encomendas que vão mudar, lidas antes do merge (depois já não se distinguem)
+                inicio_merge = datetime.now()
+                cursor.execute(_afetadas_sql(apagar_em_falta))
+                afetadas = [linha[0] for linha in cursor.fetchall()]
+
+                # Encomenda antes de EncLinha (as linhas novas precisam do cabeçalho)
+                for tabela in TABELAS:
+                    for chave, sql in _merge_sql(tabela, apagar_em_falta):
+                        cursor.execute(sql)
+                        contagens[f"{tabela.nome}_{chave}"] = max(cursor.rowcount, 0)
+                for tabela in TABELAS:
+                    cursor.execute(f"DROP TABLE #{tabela.nome}Carga")
+                conn.commit()
+                span.linhas = sum(linhas.values())
+            except db.Erro:
+                try:
+                    conn.rollback()
+                except db.Erro:
+                    descartar = True
+                raise
+            finally:
+                cursor.close()
+    finally:
+        db.pool.devolver(conn, descartar=descartar)
+
+    # LOG INICIAL e FINAL de cada encomenda mudada, pelo escritor de log (como numa edição)
+    fim = datetime.now()
+    referencias = [(enc_id, gerar_referencia()) for enc_id in afetadas]
+    db.escritor_log.registar([(enc_id, inicio_merge, ref) for enc_id, ref in referencias]
+                             + [(enc_id, fim, ref) for enc_id, ref in referencias])
+    contagens['Encomenda_registadas'] = len(afetadas)
+    return {'parte': numero, 'linhas': linhas, **contagens, 'duracao_seg': round(time.perf_counter() - inicio, 3)}
+
+
+def encontrar_partes(pasta: str):
+    """ {parte: {'Encomenda': caminho, 'EncLinha': caminho}} dos ficheiros exportados em pasta. """
+    partes = {}
+    for caminho in sorted(glob.glob(os.path.join(pasta, "*"))):
+        encontrado = _NOME_PARTE.match(os.path.basename(caminho))
+        if encontrado:
+            partes.setdefault(int(encontrado.group(2)), {})[encontrado.group(1)] = caminho
+    for numero, ficheiros in partes.items():
+        em_falta = [t.nome for t in TABELAS if t.nome not in ficheiros]
+        if em_falta:
+            raise ValueError(f"Parte {numero} incompleta em {pasta}: falta {', '.join(em_falta)}")
+    return partes
+
+
+def importar(db, pasta: str, paralelo: int = 1, tamanho_bloco: int = 5000, apagar_em_falta: bool = False):
+    """
+    Importa as partes exportadas em pasta (uma transação por parte, até paralelo em simultâneo).
+    Devolve um relatório com linhas lidas/atualizadas/inseridas, partes falhadas e débito (linhas/s).
+    """
+    partes = encontrar_partes(pasta)
+    inicio = time.perf_counter()
+    resultados, erros = [], []
+
+    def _importar(numero):
+        try:
+            return _importar_parte(db, numero, partes[numero], tamanho_bloco, apagar_em_falta)
+        except (db.Erro, ErroPool, ValueError, OSError) as ex:
+            db.rastreio.mensagem(f"❌ Parte {numero} não importada (ROLLBACK): {ex}", 'erro')
+            erros.append({'parte': numero, 'erro': str(ex)})
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(paralelo, db.pool.max_conexoes)),
+                            thread_name_prefix="importar") as executor:
+        resultados = [r for r in executor.map(_importar, sorted(partes)) if r is not None]
+    if db.cache is not None:
+        db.cache.invalidar() # As encomendas importadas podem estar em cache com os valores antigos
+    relatorio = _relatorio(resultados, time.perf_counter() - inicio, partes=len(partes))
+    relatorio['partes_falhadas'] = len(erros)
+    relatorio['erros'] = erros
+    for resultado in resultados:
+        for chave, valor in resultado.items():
+            if chave.startswith(("Encomenda_", "EncLinha_")):
+                relatorio[chave] = relatorio.get(chave, 0) + valor
+    return relatorio
+
+
+def _relatorio(resultados: list, duracao: float, **extra):
+    linhas = {t.nome: sum(r['linhas'][t.nome] for r in resultados) for t in TABELAS}
+    total = sum(linhas.values())
+    return {**extra, 'linhas': linhas, 'duracao_seg': round(duracao, 3),
+            'linhas_por_seg': round(total / duracao, 1) if duracao else 0.0,
+            'por_parte': sorted(resultados, key=lambda r: r['parte'])}
+
+
+# --- Linha de comandos ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("direcao", choices=("exportar", "importar"))
+    parser.add_argument("pasta", help="pasta com os ficheiros Encomenda-NNN / EncLinha-NNN")
+    parser.add_argument("--server", default="192.168.100.14,1433")
+    parser.add_argument("--database", default="SGBD_PL1_02")
+    parser.add_argument("--user", default="User_SGBD_PL1_02")
+    parser.add_argument("--bd-local", help="usar a BD local de testes (ficheiro SQLite) em vez do SQL Server")
+    parser.add_argument("--isolamento", default="READ COMMITTED")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv", help="formato da exportação")
+    parser.add_argument("--de", type=int, help="primeiro EncId a exportar (por omissão o menor)")
+    parser.add_argument("--ate", type=int, help="último EncId a exportar (por omissão o maior)")
+    parser.add_argument("--partes", type=int, default=4, help="intervalos de EncId (ficheiros) na exportação")
+    parser.add_argument("--paralelo", type=int, default=4, help="partes exportadas/importadas em simultâneo")
+    parser.add_argument("--tamanho-bloco", type=int, default=5000, help="linhas por fetchmany / executemany")
+    parser.add_argument("--apagar-em-falta", action="store_true",
+                        help="na importação, apagar as linhas das encomendas importadas que não vêm no ficheiro")
+    parser.add_argument("--relatorio", help="guardar o relatório em JSON neste ficheiro")
+    args = parser.parse_args(argv)
+
+    db = DbConnectionEdit()
+    if args.bd_local:
+        backend = BackendSQLite(args.bd_local)
+    else:
+        password = os.environ.get("SGBD_PASSWORD") or getpass.getpass(f"Password de {args.user}: ")
+        backend = BackendSqlServer(args.server, args.database, args.user, password, driver=db.DRIVER)
+    # Uma conexão por parte em curso (+1 para o escritor de log)
+    if not db.ligar(backend, max_conexoes=args.paralelo + 1) or not db.set_isolation(args.isolamento):
+        return 1
+
+    try:
+        if args.direcao == "exportar":
+            relatorio = exportar(db, args.pasta, args.formato, args.de, args.ate, args.partes,
+                                 args.paralelo, args.tamanho_bloco)
+        else:
+            relatorio = importar(db, args.pasta, args.paralelo, args.tamanho_bloco, args.apagar_em_falta)
+    except ImportError as ex:
+        db.rastreio.mensagem(f"❌ {ex}", 'erro')
+        return 1
+    finally:
+        db.fechar()
+
+    linhas = relatorio['linhas']
+    db.rastreio.mensagem(f"\n--- RESUMO ({args.direcao}) ---\n"
+                         f"Partes: {relatorio['partes']} | Encomendas: {linhas['Encomenda']} | Linhas: {linhas['EncLinha']}\n"
+                         f"Duração: {relatorio['duracao_seg']} s | Débito: {relatorio['linhas_por_seg']} linhas/s")
+    if args.direcao == "importar":
+        db.rastreio.mensagem(
+            f"Encomenda: {relatorio.get('Encomenda_atualizadas', 0)} atualizadas, "
+            f"{relatorio.get('Encomenda_inseridas', 0)} inseridas, "
+            f"{relatorio.get('Encomenda_registadas', 0)} com registo 'O' | "
+            f"EncLinha: {relatorio.get('EncLinha_atualizadas', 0)} atualizadas, "
+            f"{relatorio.get('EncLinha_inseridas', 0)} inseridas, {relatorio.get('EncLinha_apagadas', 0)} apagadas"
+            + (f" | {relatorio['partes_falhadas']} partes falhadas" if relatorio['partes_falhadas'] else ""))
+    if args.relatorio:
+        with open(args.relatorio, "w", encoding="utf-8") as ficheiro:
+            json.dump(relatorio, ficheiro, indent=2, ensure_ascii=False)
+    return 0 if not relatorio.get('partes_falhadas') else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
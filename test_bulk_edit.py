@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from conftest import consultar
+import db_bulk_edit as bulk
+
+
+def _escrever(tmp_path, nome: str, texto: str):
+    caminho = tmp_path / nome
+    caminho.write_text(texto, encoding="utf-8")
+    return str(caminho)
+
+
+def test_csv_salta_linhas_invalidas(tmp_path):
+    caminho = _escrever(tmp_path, "edicoes.csv",
+                        "enc_id,nova_morada,produto_id,nova_qtd\n"
+                        "1,Rua A,2,5\n"
+                        ",Rua B,,\n"        # 3: sem EncId
+                        "2,,3,-1\n"         # 4: quantidade negativa
+                        "3,,x,2\n"          # 5: produto não numérico
+                        "4,Rua D,,\n")
+    invalidas = []
+
+    edicoes = list(bulk.ler_edicoes(caminho, invalidas))
+
+    assert edicoes == [
+        {'enc_id': 1, 'nova_morada': "Rua A", 'produtos_alterados': [{'produto_id': 2, 'nova_qtd': 5}]},
+        {'enc_id': 4, 'nova_morada': "Rua D", 'produtos_alterados': []},
+    ]
+    assert [i['linha'] for i in invalidas] == [3, 4, 5]
+    assert "enc_id em falta" in invalidas[0]['erro'] and "negativo" in invalidas[1]['erro']
+
+
+def test_json_por_linha_salta_registos_invalidos(tmp_path):
+    caminho = _escrever(tmp_path, "edicoes.jsonl", "\n".join([
+        json.dumps({'enc_id': 1, 'produtos_alterados': [{'produto_id': 1, 'nova_qtd': 2}]}),
+        "{isto não é json",
+        json.dumps([1, 2]),
+        json.dumps({'enc_id': 2, 'nova_morada': 7}),
+        json.dumps({'enc_id': 3, 'produtos_alterados': [{'produto_id': 1, 'nova_qtd': 1.5}]}),
+        "",
+        json.dumps({'enc_id': 5, 'nova_morada': "Rua E"}),
+    ]))
+    invalidas = []
+
+    assert [e['enc_id'] for e in bulk.ler_edicoes(caminho, invalidas)] == [1, 5]
+    assert [i['linha'] for i in invalidas] == [2, 3, 4, 5]
+
+
+def test_lista_json_lida_por_blocos(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, "TAMANHO_BLOCO_JSON", 7) # Registos e números cortados entre blocos
+    registos = [{'enc_id': n, 'produtos_alterados': [{'produto_id': 12345, 'nova_qtd': n * 1000}]}
+                for n in range(1, 6)]
+    registos.insert(2, {'enc_id': -1})
+    caminho = _escrever(tmp_path, "edicoes.json", " " + json.dumps(registos, indent=1))
+    invalidas = []
+
+    edicoes = list(bulk.ler_edicoes(caminho, invalidas))
+
+    assert [(e['enc_id'], e['produtos_alterados'][0]['nova_qtd']) for e in edicoes] == \
+        [(n, n * 1000) for n in range(1, 6)]
+    assert invalidas == [{'registo': 3, 'erro': "enc_id negativo: -1"}]
+
+
+def test_lista_json_sem_fim_da_erro(tmp_path):
+    caminho = _escrever(tmp_path, "edicoes.json", '[{"enc_id": 1}, ')
+    with pytest.raises(ValueError):
+        list(bulk.ler_edicoes(caminho))
+
+
+def test_editar_em_massa_so_regista_encomendas_mudadas(db):
+    edicoes = [
+        {'enc_id': 1, 'nova_morada': "Rua Massa", 'produtos_alterados': []},
+        {'enc_id': 2, 'nova_morada': None, 'produtos_alterados': [{'produto_id': 1, 'nova_qtd': 9}]},
+        {'enc_id': 999, 'nova_morada': "Rua Nenhuma", 'produtos_alterados': [{'produto_id': 1, 'nova_qtd': 1}]},
+    ]
+    invalidas = [{'linha': 7, 'erro': "enc_id em falta"}]
+
+    relatorio = bulk.editar_em_massa(db, edicoes, tamanho_lote=2, invalidas=invalidas)
+
+    assert relatorio['lotes'] == 2 and relatorio['lotes_falhados'] == 0
+    assert relatorio['encomendas'] == 3 and relatorio['encomendas_mudadas'] == 2
+    assert (relatorio['moradas_pedidas'], relatorio['moradas_afetadas']) == (2, 1)
+    assert (relatorio['linhas_pedidas'], relatorio['linhas_afetadas']) == (2, 1)
+    assert relatorio['invalidas'] == invalidas
+    db.escritor_log.esvaziar()
+    assert consultar(db, "SELECT Objecto, COUNT(*) FROM LogOperations GROUP BY Objecto ORDER BY Objecto") == \
+        [('1', 2), ('2', 2)]
@@ -0,0 +1,117 @@
+from conftest import consultar
+
+
+def _idas(backend):
+    return sum(c.idas_a_bd for c in backend.conexoes)
+
+
+def _executar(db, sql: str, *params):
+    """ Alteração feita por "outra sessão", fora do motor (a cache não sabe dela). """
+    with db.pool.conexao() as conn:
+        conn.execute(sql, *params)
+        conn.commit()
+
+
+def test_leitura_repetida_vem_da_cache(db, backend):
+    header, linhas = db.fetch_encomenda_data(1)
+    idas = _idas(backend)
+
+    assert db.fetch_encomenda_data(1) == (header, linhas)
+    assert _idas(backend) == idas # Validada há menos de intervalo_validacao_seg: nem usa a BD
+    assert db.cache.estatisticas['hits'] == 1 and db.cache.estatisticas['misses'] == 1
+
+
+def test_probe_confirma_versao_inalterada(db):
+    db.cache.intervalo_validacao_seg = 0
+    header, linhas = db.fetch_encomenda_data(1)
+
+    assert db.fetch_encomenda_data(1) == (header, linhas)
+    assert db.cache.estatisticas['validacoes'] == 1 and db.cache.estatisticas['hits'] == 1
+    assert db.cache.estatisticas['desatualizadas'] == 0
+
+
+def test_alteracao_de_outra_sessao_invalida_a_entrada(db):
+    db.cache.intervalo_validacao_seg = 0
+    header, _ = db.fetch_encomenda_data(1)
+    _executar(db, "UPDATE EncLinha SET Qtd = 42 WHERE EncId = 1 AND Produtold = 2")
+
+    _, linhas = db.fetch_encomenda_data(1)
+
+    assert [l.Qtd for l in linhas if l.Produtold == 2] == [42]
+    assert db.cache.estatisticas['desatualizadas'] == 1
+
+    # Só maiúsculas/minúsculas também muda a versão
+    _executar(db, "UPDATE Encomenda SET Morada = ? WHERE EncId = 1", header.Morada.upper())
+    assert db.fetch_encomenda_data(1)[0].Morada == header.Morada.upper()
+    assert db.cache.estatisticas['desatualizadas'] == 2
+
+
+def test_edicao_atualiza_a_cache_sem_mais_idas_a_bd(db, backend):
+    db.fetch_encomenda_data(2) # Em cache
+    idas = _idas(backend)
+    db.editar_encomenda(3, "Rua Sem Cache", [{'produto_id': 1, 'nova_qtd': 3}])
+    idas_sem_cache = _idas(backend) - idas
+
+    idas = _idas(backend)
+    db.editar_encomenda(2, "Rua Com Cache", [{'produto_id': 1, 'nova_qtd': 3}])
+
+    # O probe de versão vai no batch do COMMIT: a edição de uma encomenda em cache não custa mais
+    assert _idas(backend) - idas == idas_sem_cache
+    db.cache.intervalo_validacao_seg = 0
+    header, linhas = db.fetch_encomenda_data(2)
+    assert header.Morada == "Rua Com Cache" and linhas[0].Qtd == 3
+    assert db.cache.estatisticas['desatualizadas'] == 0 # A versão guardada é a do servidor
+    assert consultar(db, "SELECT Morada FROM Encomenda WHERE EncId = 2") == [("Rua Com Cache",)]
+
+
+def test_erro_na_edicao_invalida_a_entrada(db):
+    db.fetch_encomenda_data(1)
+    conn = db.pool.obter()
+    db.pool.devolver(conn)
+    conn.injetar_erro(db.Erro('42000', "[42000] Erro simulado (50000)"))
+
+    assert db.editar_encomenda(1, "Rua Falhada", []) is None
+    assert 1 not in db.cache
+
+
+def test_pre_carga_enche_a_cache_num_so_batch(db, backend):
+    idas = _idas(backend)
+
+    encomendas = db.fetch_encomendas([2, 3, 4, 999], pre_carga=True)
+
+    assert sorted(encomendas) == [2, 3, 4] # As que não existem não aparecem
+    assert _idas(backend) - idas == 2 # O batch e o ROLLBACK ao devolver a conexão
+    assert db.cache.estatisticas['pre_carga_misses'] == 4
+    assert db.cache.estatisticas['hits'] == db.cache.estatisticas['misses'] == 0
+    # A encomenda pré-carregada abre sem ir à BD, com os mesmos dados de uma leitura normal
+    idas = _idas(backend)
+    assert db.fetch_encomenda_data(3) == encomendas[3]
+    assert _idas(backend) == idas and db.cache.estatisticas['hits'] == 1
+    assert db.fetch_encomenda_data(3, usar_cache=False) == encomendas[3]
+
+
+def test_pre_carga_do_que_ja_esta_em_cache_nao_usa_conexao(db, backend):
+    db.fetch_encomendas([1, 2])
+    idas = _idas(backend)
+
+    assert sorted(db.fetch_encomendas([1, 2], pre_carga=True)) == [1, 2]
+    assert _idas(backend) == idas
+    assert db.cache.estatisticas['pre_carga_hits'] == 2
+
+
+def test_versao_da_pre_carga_e_a_da_leitura_normal(db):
+    db.cache.intervalo_validacao_seg = 0
+    db.fetch_encomendas([1, 2], pre_carga=True)
+
+    db.fetch_encomenda_data(1)
+    assert db.cache.estatisticas['desatualizadas'] == 0 # O probe confirmou a versão da pré-carga
+    _executar(db, "UPDATE EncLinha SET Qtd = 5 WHERE EncId = 2 AND Produtold = 1")
+    assert db.fetch_encomenda_data(2)[1][0].Qtd == 5
+    assert db.cache.estatisticas['desatualizadas'] == 1
+
+
+def test_intervalo_nao_passa_pela_cache(db):
+    encomendas = db.fetch_encomendas(de=2, ate=4)
+
+    assert sorted(encomendas) == [2, 3, 4] and all(len(linhas) == 4 for _, linhas in encomendas.values())
+    assert len(db.cache) == 0
@@ -0,0 +1,64 @@
+from db_instrucoes_edit import INTEIRO, TEXTO, RegistoInstrucoes
+
+
+SQL_MORADA = "SELECT COUNT(*) FROM Encomenda WHERE EncId = ? AND Morada <> ?"
+
+
+def test_mesmo_sql_reutiliza_o_cursor_preparado(backend):
+    conn = backend.fabrica()
+    registo = RegistoInstrucoes()
+
+    with registo.executar(conn, "SELECT Nome FROM Encomenda WHERE EncId = ?", [1], [INTEIRO]) as cursor:
+        primeiro = cursor
+        assert cursor.fetchone().Nome == "Cliente 1"
+    with registo.executar(conn, "SELECT Nome FROM Encomenda WHERE EncId = ?", [2], [INTEIRO]) as cursor:
+        assert cursor is primeiro
+        assert cursor.fetchone().Nome == "Cliente 2"
+
+    assert registo.estatisticas['preparacoes'] == 1 and registo.estatisticas['preparacoes_evitadas'] == 1
+    assert conn.preparacoes == 1
+    conn.close()
+
+
+def test_tipos_explicitos_mantem_uma_assinatura(backend):
+    conn = backend.fabrica()
+    com_tipos, sem_tipos = RegistoInstrucoes(), RegistoInstrucoes(usar_tipos=False)
+
+    for registo in (com_tipos, sem_tipos):
+        for morada in ("Rua A", "Rua mais comprida", "Rua A"):
+            with registo.executar(conn, SQL_MORADA, [1, morada], [INTEIRO, TEXTO]):
+                pass
+
+    # Sem tipos o driver declara nvarchar(len(morada)): uma assinatura por comprimento
+    assert (com_tipos.estatisticas['assinaturas'], com_tipos.estatisticas['assinaturas_repetidas']) == (1, 2)
+    assert (sem_tipos.estatisticas['assinaturas'], sem_tipos.estatisticas['assinaturas_repetidas']) == (2, 1)
+    conn.close()
+
+
+def test_cursores_menos_usados_saem_do_registo(backend):
+    conn = backend.fabrica()
+    registo = RegistoInstrucoes(max_por_conexao=2)
+
+    for enc_id in (1, 2, 3):
+        with registo.executar(conn, f"SELECT Nome FROM Encomenda WHERE EncId = {enc_id}"):
+            pass
+    with registo.executar(conn, "SELECT Nome FROM Encomenda WHERE EncId = 1"):
+        pass # Saiu (LRU): volta a ser preparado
+
+    assert registo.estatisticas['preparacoes'] == 4
+    assert len(registo._cursores[id(conn)]) == 2
+    registo.esquecer(conn)
+    assert id(conn) not in registo._cursores
+    conn.close()
+
+
+def test_edicoes_repetidas_nao_preparam_nada_de_novo(db, backend):
+    db.escritor_log.intervalo_seg = 3600 # O INSERT do log (outro cursor) fica para o fim
+    produtos = [{'produto_id': 1, 'nova_qtd': 2}, {'produto_id': 3, 'nova_qtd': 4}]
+    db.editar_encomenda(1, "Rua Curta", produtos)
+    preparacoes = sum(c.preparacoes for c in backend.conexoes)
+
+    db.editar_encomenda(2, "Uma Rua Bastante Mais Comprida", produtos)
+    db.editar_encomenda(3, "Rua", produtos)
+
+    assert sum(c.preparacoes for c in backend.conexoes) == preparacoes
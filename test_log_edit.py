@@ -0,0 +1,87 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from conftest import consultar
+from db_log_edit import EscritorLogOperations
+from db_pool_edit import ErroPool
+
+
+class PoolEmBaixo:
+    """ Pool de uma BD inacessível: todas as conexões falham. """
+    @contextmanager
+    def conexao(self):
+        raise ErroPool("BD inacessível")
+        yield
+
+
+class PoolIntermitente:
+    """ Em baixo até a BD voltar (em_baixo = False); depois usa o pool verdadeiro. """
+    def __init__(self, pool):
+        self.pool = pool
+        self.em_baixo = True
+
+    def conexao(self):
+        return (PoolEmBaixo() if self.em_baixo else self.pool).conexao()
+
+
+def test_reserva_e_reenviada_quando_a_bd_volta(db):
+    reserva = "pendentes.jsonl"
+    inicio, fim = datetime(2024, 1, 1, 10, 0), datetime(2024, 1, 1, 10, 5)
+
+    escritor = EscritorLogOperations(PoolEmBaixo(), ficheiro_reserva=reserva).iniciar()
+    escritor.registar_edicao(3, "G1-teste", inicio, fim)
+    escritor.esvaziar()
+    escritor.parar()
+    assert os.path.exists(reserva)
+    assert escritor.estatisticas['em_reserva'] == 2
+    assert consultar(db, "SELECT COUNT(*) FROM LogOperations") == [(0,)]
+
+    # Um escritor novo (ex: a aplicação reiniciada) manda a reserva com a primeira escrita
+    escritor = EscritorLogOperations(db.pool, ficheiro_reserva=reserva).iniciar()
+    assert escritor.esvaziar()
+    escritor.parar()
+
+    assert escritor.estatisticas['reenviados'] == 2
+    assert not os.path.exists(reserva) and not os.path.exists(reserva + ".reenvio")
+    assert consultar(db, "SELECT EventType, Objecto, Referencia FROM LogOperations ORDER BY NumReg") == \
+        [('O', '3', "G1-teste")] * 2
+
+
+def test_reserva_reenviada_sem_novas_edicoes(db):
+    reserva = "pendentes.jsonl"
+    pool = PoolIntermitente(db.pool)
+    escritor = EscritorLogOperations(pool, ficheiro_reserva=reserva, intervalo_reserva_seg=0.05).iniciar()
+    escritor.registar_edicao(4, "G1-parado", datetime(2024, 1, 1), datetime(2024, 1, 1))
+    escritor.esvaziar()
+    assert os.path.exists(reserva)
+
+    # A BD volta e a aplicação fica parada: a thread tenta a reserva sozinha
+    pool.em_baixo = False
+    limite = time.monotonic() + 5
+    while os.path.exists(reserva) and time.monotonic() < limite:
+        time.sleep(0.02)
+    escritor.parar()
+
+    assert escritor.estatisticas['reenviados'] == 2
+    assert consultar(db, "SELECT COUNT(*) FROM LogOperations WHERE Referencia = 'G1-parado'") == [(2,)]
+
+
+def test_dcriacao_e_a_hora_do_insert(db):
+    antes = datetime.now().replace(microsecond=0)
+    # Registo de uma versão anterior do ficheiro de reserva (com DCriacao do cliente)
+    with open("pendentes.jsonl", "w", encoding="utf-8") as ficheiro:
+        ficheiro.write(json.dumps([5, "2024-01-01T10:00:00", "G1-antigo", "2024-01-01T10:00:00"]) + "\n")
+
+    escritor = EscritorLogOperations(db.pool, ficheiro_reserva="pendentes.jsonl").iniciar()
+    escritor.registar_edicao(6, "G1-novo", datetime(2024, 1, 1, 11), datetime(2024, 1, 1, 11, 5))
+    escritor.esvaziar()
+    escritor.parar()
+
+    linhas = consultar(db, "SELECT Objecto, Valor, Referencia, DCriacao FROM LogOperations ORDER BY NumReg")
+    # Valor é o instante da edição; DCriacao vem do GETDATE() do servidor
+    assert [(o, v[:16], r) for o, v, r, _ in linhas] == [
+        ('5', "2024-01-01 10:00", "G1-antigo"), ('6', "2024-01-01 11:00", "G1-novo"), ('6', "2024-01-01 11:05", "G1-novo")]
+    assert all(datetime.fromisoformat(d) >= antes for _, _, _, d in linhas)
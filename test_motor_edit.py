@@ -0,0 +1,181 @@
+import threading
+
+from conftest import consultar
+
+
+def test_deadlock_e_repetido(db):
+    conn = db.pool.obter()
+    db.pool.devolver(conn)
+    # A próxima edição recebe esta conexão (LIFO) e a primeira instrução é a vítima do deadlock
+    conn.injetar_erro(db.Erro('40001', "[40001] Transaction was deadlocked ... deadlock victim. (1205)"))
+
+    resumo = db.editar_encomenda(1, "Rua Nova", [{'produto_id': 2, 'nova_qtd': 7}])
+
+    assert resumo['tentativas'] == 2
+    assert not resumo['conflito']
+    assert consultar(db, "SELECT Morada FROM Encomenda WHERE EncId = ?", 1) == [("Rua Nova",)]
+    assert consultar(db, "SELECT Qtd FROM EncLinha WHERE EncId = ? AND Produtold = ?", 1, 2) == [(7,)]
+    db.escritor_log.esvaziar()
+    # Só a tentativa confirmada deixa o par 'O'
+    assert consultar(db, "SELECT Referencia FROM LogOperations WHERE Objecto = '1'") == [(resumo['referencia'],)] * 2
+
+
+def test_otimista_deteta_conflito_na_morada(db):
+    _, _, versoes = db.ler_para_edicao(1)
+    morada = consultar(db, "SELECT Morada FROM Encomenda WHERE EncId = ?", 1)[0][0]
+    # Outra sessão muda só maiúsculas/minúsculas: continua a ser uma alteração
+    assert db.editar_encomenda(1, morada.upper(), [])['conflito'] is False
+
+    resumo = db.editar_encomenda(1, "Rua Otimista", [{'produto_id': 1, 'nova_qtd': 9}], versoes=versoes)
+
+    assert resumo['conflito'] is True
+    assert consultar(db, "SELECT Morada FROM Encomenda WHERE EncId = ?", 1) == [(morada.upper(),)]
+    assert consultar(db, "SELECT Qtd FROM EncLinha WHERE EncId = ? AND Produtold = ?", 1, 1) == [(1,)]
+
+
+def test_otimista_deteta_conflito_nas_linhas(db):
+    _, _, versoes = db.ler_para_edicao(2)
+    db.editar_encomenda(2, None, [{'produto_id': 3, 'nova_qtd': 5}])
+
+    resumo = db.editar_encomenda(2, None, [{'produto_id': 3, 'nova_qtd': 8}], versoes=versoes)
+    assert resumo['conflito'] is True
+    assert consultar(db, "SELECT Qtd FROM EncLinha WHERE EncId = ? AND Produtold = ?", 2, 3) == [(5,)]
+
+    # Com versões novas a mesma edição passa
+    _, _, versoes = db.ler_para_edicao(2)
+    assert db.editar_encomenda(2, None, [{'produto_id': 3, 'nova_qtd': 8}], versoes=versoes)['conflito'] is False
+
+
+def test_pessimista_encomenda_inexistente(db):
+    assert db.editar_encomenda(999, "Rua Nenhuma", [{'produto_id': 1, 'nova_qtd': 2}]) is None
+
+    tipo, titulo, mensagem = db.ultima_notificacao()
+    assert tipo == 'error' and "999" in mensagem
+    db.escritor_log.esvaziar()
+    assert consultar(db, "SELECT COUNT(*) FROM LogOperations") == [(0,)]
+
+
+def _encomenda_grande(db, enc_id: int = 1, n_linhas: int = 50):
+    """ Acrescenta linhas à encomenda (as da BD de testes só têm 4). """
+    with db.pool.conexao() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("INSERT INTO EncLinha (EncId, Produtold, Designacao, Preco, Qtd) VALUES (?, ?, ?, ?, ?)",
+                           [(enc_id, p, f"Produto {p}", 1.5 * p, 1) for p in range(5, n_linhas + 1)])
+        cursor.close()
+        conn.commit()
+
+
+def test_primeira_pagina_com_total(db):
+    _encomenda_grande(db)
+
+    header, total, linhas = db.fetch_encomenda_pagina(1, tamanho_pagina=10)
+
+    assert header.Nome == "Cliente 1" and total == 50
+    assert [l.Produtold for l in linhas] == list(range(1, 11))
+    assert 1 not in db.cache # A cache só guarda encomendas inteiras
+    assert db.fetch_encomenda_pagina(2, tamanho_pagina=10)[1] == 4 and 2 in db.cache
+
+
+def test_paginas_por_chave_e_por_deslocamento(db):
+    _encomenda_grande(db)
+
+    assert [l.Produtold for l in db.fetch_linhas_pagina(1, apos_produto=10, tamanho_pagina=10)] == list(range(11, 21))
+    assert [l.Produtold for l in db.fetch_linhas_pagina(1, deslocamento=30, tamanho_pagina=10)] == list(range(31, 41))
+    assert [l.Produtold for l in db.fetch_linhas_pagina(1, deslocamento=45, tamanho_pagina=10)] == list(range(46, 51))
+    assert db.fetch_linhas_pagina(1, apos_produto=50) == []
+
+
+def test_paginas_reutilizam_a_mesma_instrucao(db, backend):
+    _encomenda_grande(db)
+    db.fetch_linhas_pagina(1, deslocamento=0, tamanho_pagina=10)
+    preparacoes = sum(c.preparacoes for c in backend.conexoes)
+
+    for deslocamento in (10, 20, 30, 40):
+        db.fetch_linhas_pagina(1, deslocamento=deslocamento, tamanho_pagina=10)
+
+    # O deslocamento é um parâmetro: o mesmo SQL e o mesmo cursor preparado em todas as páginas
+    assert sum(c.preparacoes for c in backend.conexoes) == preparacoes
+
+
+def test_iterar_linhas_por_lotes_de_fetchmany(db):
+    _encomenda_grande(db)
+
+    lotes = list(db.iterar_linhas(1, arraysize=7, em_lotes=True))
+
+    assert [len(lote) for lote in lotes] == [7] * 7 + [1]
+    assert [l.Produtold for lote in lotes for l in lote] == list(range(1, 51))
+    assert not db.pool._em_uso # Lido até ao fim: a conexão voltou ao pool
+
+
+def test_iterar_linhas_parado_a_meio_devolve_a_conexao(db):
+    _encomenda_grande(db)
+    linhas = db.iterar_linhas(1, arraysize=5)
+
+    primeiras = [next(linhas) for _ in range(3)]
+    assert [l.Produtold for l in primeiras] == [1, 2, 3]
+    assert len(db.pool._em_uso) == 1 # O gerador tem a conexão enquanto lê
+    linhas.close()
+    assert not db.pool._em_uso
+
+
+def test_iterar_linhas_cancelado_noutra_thread(db):
+    _encomenda_grande(db)
+    cancelar = threading.Event()
+    lidas = []
+
+    for lote in db.iterar_linhas(1, arraysize=10, em_lotes=True, cancelar=cancelar):
+        lidas.extend(lote)
+        cancelar.set()
+
+    assert len(lidas) == 10
+    assert not db.pool._em_uso
+
+
+def test_iterar_linhas_com_versoes(db):
+    linhas = list(db.iterar_linhas(2, com_versoes=True))
+    _, _, versoes = db.ler_para_edicao(2)
+
+    assert [l.Produtold for l in linhas] == [1, 2, 3, 4]
+    assert {l.Produtold: l.Versao for l in linhas} == versoes.linhas
+
+
+def test_edicao_sem_alteracoes_nao_vai_a_bd(db, backend):
+    idas = sum(c.idas_a_bd for c in backend.conexoes)
+
+    resumo = db.editar_encomenda(1, None, [])
+
+    assert resumo['sem_alteracoes'] is True and resumo['referencia'] is None
+    assert sum(c.idas_a_bd for c in backend.conexoes) == idas
+    db.escritor_log.esvaziar()
+    assert consultar(db, "SELECT COUNT(*) FROM LogOperations") == [(0,)]
+
+
+def test_so_as_linhas_alteradas_sao_escritas(db):
+    morada = consultar(db, "SELECT Morada FROM Encomenda WHERE EncId = 1")[0][0]
+    with db.pool.conexao() as conn:
+        # Outra sessão muda a morada: uma edição só de quantidades não a pode repor
+        conn.execute("UPDATE Encomenda SET Morada = 'Rua de Outra Sessão' WHERE EncId = 1")
+        conn.commit()
+
+    resumo = db.editar_encomenda(1, None, [{'produto_id': 2, 'nova_qtd': 8}])
+
+    assert (resumo['linhas_pedidas'], resumo['linhas_afetadas']) == (1, 1)
+    assert consultar(db, "SELECT Morada FROM Encomenda WHERE EncId = 1") == [("Rua de Outra Sessão",)]
+    assert consultar(db, "SELECT Produtold, Qtd FROM EncLinha WHERE EncId = 1 ORDER BY Produtold") == \
+        [(1, 1), (2, 8), (3, 1), (4, 1)]
+    assert morada != "Rua de Outra Sessão"
+
+
+def test_so_a_morada_nao_toca_nas_linhas(db):
+    db.rastreio.ativo = True
+    _, _, versoes = db.ler_para_edicao(2)
+    # Uma linha que a edição não muda pode mudar noutra sessão sem dar conflito
+    db.editar_encomenda(2, None, [{'produto_id': 1, 'nova_qtd': 6}])
+    db.rastreio.limpar()
+
+    resumo = db.editar_encomenda(2, "Rua Só Cabeçalho", [], versoes=versoes)
+
+    assert resumo['linhas_pedidas'] == 0 and not resumo['conflito']
+    etapas = db.rastreio.resumo()
+    assert etapas['update_encomenda']['n'] == 1 and 'update_linhas' not in etapas
+    assert consultar(db, "SELECT Morada FROM Encomenda WHERE EncId = 2") == [("Rua Só Cabeçalho",)]
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+from db_pool_edit import ErroPool, PoolConexoesEdit
+
+
+def test_inativas_sao_fechadas_acima_do_minimo(backend):
+    pool = PoolConexoesEdit(backend.fabrica, min_conexoes=1, max_conexoes=3, max_inativa_seg=0.05)
+    fechadas = []
+    pool.ao_fechar_conexao = fechadas.append
+    conexoes = [pool.obter() for _ in range(3)]
+    for conexao in conexoes:
+        pool.devolver(conexao)
+
+    time.sleep(0.1)
+    conexao = pool.obter()
+
+    # Fica a mais recente (LIFO) e o mínimo; as outras duas foram fechadas
+    assert conexao is conexoes[-1]
+    assert pool.estatisticas['removidas_inativas'] == 2
+    assert fechadas == conexoes[:2] and all(c._fechada for c in fechadas)
+    pool.devolver(conexao)
+    pool.fechar()
+
+
+def test_inativas_fechadas_fora_do_lock(backend):
+    pool = PoolConexoesEdit(backend.fabrica, min_conexoes=0, max_conexoes=2, max_inativa_seg=0.01)
+    lock_livre = []
+
+    def ao_fechar(conexao):
+        # Outra thread consegue usar o pool enquanto a conexão fecha
+        outra = threading.Thread(target=lambda: lock_livre.append(pool._cond.acquire(timeout=1) and
+                                                                  (pool._cond.release() or True)))
+        outra.start()
+        outra.join()
+
+    pool.ao_fechar_conexao = ao_fechar
+    pool.devolver(pool.obter())
+    time.sleep(0.05)
+    pool.devolver(pool.obter())
+    assert lock_livre == [True]
+    pool.fechar()
+
+
+def test_conexao_caida_e_religada(backend):
+    pool = PoolConexoesEdit(backend.fabrica, min_conexoes=1, max_conexoes=1, intervalo_validacao_seg=0)
+    pool.aquecer()
+    caida = pool.obter()
+    pool.devolver(caida)
+    caida.simular_queda()
+
+    nova = pool.obter()
+
+    assert nova is not caida
+    assert pool.estatisticas['falhas_validacao'] == 1 and pool.estatisticas['religacoes'] == 1
+    with nova.cursor() as cursor:
+        assert cursor.execute("SELECT 1").fetchone()[0] == 1
+    pool.devolver(nova)
+    pool.fechar()
+
+
+def test_conexao_que_cai_em_uso_e_descartada(backend):
+    pool = PoolConexoesEdit(backend.fabrica, min_conexoes=1, max_conexoes=1)
+    pool.aquecer()
+    conexao = pool.obter()
+    conexao.simular_queda()
+    pool.devolver(conexao) # O ROLLBACK falha: não volta ao pool
+
+    assert pool.obter() is not conexao
+    assert pool.estatisticas['criadas'] == 2
+    pool.fechar()
+
+
+def test_estado_de_sessao_reposto_na_conexao_religada(backend):
+    pool = PoolConexoesEdit(backend.fabrica, min_conexoes=1, max_conexoes=1, intervalo_validacao_seg=0)
+    pool.definir_estado_sessao('isolamento', "SET TRANSACTION ISOLATION LEVEL SERIALIZABLE")
+    pool.aquecer()
+    caida = pool.obter()
+    pool.devolver(caida)
+    caida.simular_queda()
+
+    with pool.conexao() as nova:
+        assert nova.isolamento == "SERIALIZABLE"
+    pool.fechar()
+
+
+def test_bd_inacessivel_da_erro_pool():
+    def fabrica():
+        raise OSError("sem rede")
+
+    pool = PoolConexoesEdit(fabrica, tentativas_religar=2, espera_religar_seg=0.001)
+    with pytest.raises(ErroPool):
+        pool.aquecer()
+    assert not pool.saudavel
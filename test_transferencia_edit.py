@@ -0,0 +1,47 @@
+from decimal import Decimal
+
+import pytest
+
+from conftest import consultar
+import db_transferencia_edit as transferencia
+
+
+def _precos(db):
+    linhas = consultar(db, "SELECT EncId, Produtold, Preco FROM EncLinha ORDER BY EncId, Produtold")
+    return [(enc_id, produto_id, transferencia._decimal(preco)) for enc_id, produto_id, preco in linhas]
+
+
+def _ida_e_volta(db, tmp_path, formato):
+    with db.pool.conexao() as conn:
+        conn.execute("UPDATE EncLinha SET Preco = ? WHERE EncId = ? AND Produtold = ?", Decimal("0.1"), 1, 1)
+        conn.commit()
+    originais = _precos(db)
+
+    exportado = transferencia.exportar(db, str(tmp_path / "dump"), formato=formato, partes=2)
+    assert exportado['linhas'] == {'Encomenda': 5, 'EncLinha': 20}
+
+    # As encomendas 4 e 5 mudam depois da exportação: a importação repõe-nas
+    with db.pool.conexao() as conn:
+        conn.execute("UPDATE EncLinha SET Preco = 0 WHERE EncId >= 4")
+        conn.commit()
+    relatorio = transferencia.importar(db, str(tmp_path / "dump"), paralelo=2)
+
+    assert relatorio['partes_falhadas'] == 0
+    assert relatorio['Encomenda_registadas'] == 2
+    assert _precos(db) == originais
+    assert (1, 1, Decimal("0.1")) in originais
+    # Só as encomendas que mudaram ficam com o par 'O' em LogOperations
+    db.escritor_log.esvaziar()
+    assert consultar(db, "SELECT Objecto, COUNT(*) FROM LogOperations GROUP BY Objecto ORDER BY Objecto") == \
+        [('4', 2), ('5', 2)]
+
+
+def test_csv_ida_e_volta_mantem_precos_exatos(db, tmp_path):
+    _ida_e_volta(db, tmp_path, "csv")
+    with open(tmp_path / "dump" / "EncLinha-000.csv", encoding="utf-8") as ficheiro:
+        assert "0.1," in ficheiro.read()
+
+
+def test_parquet_ida_e_volta_mantem_precos_exatos(db, tmp_path):
+    pytest.importorskip("pyarrow")
+    _ida_e_volta(db, tmp_path, "parquet")